@@ -5,23 +5,51 @@ ASTP-720, Spring 2020
 Class to handle matrix operations.
 While not strictly required for this assignment,
 this code does not use np.array
+
+Elements are stored in a flat array('d') buffer (8 bytes per element)
+and indexed with row/column strides, so that a transpose is simply
+a view onto the same buffer with the strides swapped.
 """
 import math
+from array import array
 
 
 def make_matrix(rows, cols, value=0):
     """ Makes a new, empty matrix """
-    return Matrix([[value for i in range(cols)] for j in range(rows)])
+    return Matrix.from_buffer(array('d', [value]) * (rows*cols), rows, cols)
+
+
+def _flatten(rows, cols):
+    """ Flatten a list of lists into an array('d') buffer, checking row lengths """
+    data = array('d')
+    for row in rows:
+        if len(row) != cols:
+            raise IndexError("Rows are not all the same length: %i != %i"%
+                             (len(row), cols))
+        data.extend(row)
+    return data
 
 
 
 class Matrix:
     """ Matrix class """
+    __slots__ = ("data", "rows", "cols", "row_stride", "col_stride", "L", "U")
+
     def __init__(self, array):
-        """ Class initialization """
-        self.array = array
-        self.rows = len(self.array)
-        self.cols = len(self.array[0])
+        """
+        Class initialization
+
+        Parameters
+        ----------
+        array : list
+            List of lists (rows) of values
+        """
+        self.rows = len(array)
+        self.cols = len(array[0])
+        self.data = _flatten(array, self.cols)
+        # Row-major ordering
+        self.row_stride = self.cols
+        self.col_stride = 1
 
         # If LU decomposition has been run,
         # store the results in these variables
@@ -29,13 +57,48 @@ class Matrix:
         self.U = None
 
 
+    @classmethod
+    def from_buffer(cls, data, rows, cols, row_stride=None, col_stride=1):
+        """
+        Make a Matrix directly from a flat array('d') buffer without copying
+
+        Parameters
+        ----------
+        data : array.array
+            Flat buffer of doubles
+        rows : int
+            Number of rows
+        cols : int
+            Number of columns
+        row_stride (optional) : int
+            Step in the buffer between rows, defaults to cols (row-major)
+        col_stride (optional) : int
+            Step in the buffer between columns
+        """
+        newmat = cls.__new__(cls)
+        newmat.data = data
+        newmat.rows = rows
+        newmat.cols = cols
+        newmat.row_stride = cols if row_stride is None else row_stride
+        newmat.col_stride = col_stride
+        newmat.L = None
+        newmat.U = None
+        return newmat
+
+
+    @property
+    def array(self):
+        """ Return a copy of the values as a list of lists """
+        return [[self[i, j] for j in range(self.cols)] for i in range(self.rows)]
+
+
     def __getitem__(self, inds):
         """
         Get item out of the main data array
         Uses numpy-like syntax
         """
         i, j = inds
-        return self.array[i][j]
+        return self.data[i*self.row_stride + j*self.col_stride]
 
     def __setitem__(self, inds, value):
         """
@@ -43,7 +106,7 @@ class Matrix:
         Uses numpy-like syntax
         """
         i, j = inds
-        self.array[i][j] = value
+        self.data[i*self.row_stride + j*self.col_stride] = value
 
 
 
@@ -54,11 +117,11 @@ class Matrix:
             string += "["
             for j in range(self.cols):
                 item = self[i, j]
-                if isinstance(item, int):
+                if item.is_integer() and abs(item) < 1e6:
                     string += "%i,"%item
-                elif isinstance(item, float) and abs(item) > 0.001:
+                elif abs(item) > 0.001:
                     string += "%0.3f,"%item
-                elif isinstance(item, float):
+                else:
                     string += "%0.3e,"%item
             string = string[:-1]+"],\n"
         string = string[:-2]+"]"
@@ -115,14 +178,25 @@ class Matrix:
 
 
     def transpose(self):
-        """ Transpose a matrix """
-        newmat = make_matrix(self.cols, self.rows)
+        """
+        Transpose a matrix, without copying
 
-        for i in range(newmat.rows):
-            for j in range(newmat.cols):
-                newmat[i, j] = self[j, i]
+        The returned matrix is a view that shares the data buffer of
+        this one, with the strides swapped. Setting an element of
+        either one changes the other (and any LU decomposition already
+        stored on the other is not updated). Use transpose().copy() for
+        an independent matrix.
+        """
+        return Matrix.from_buffer(self.data, self.cols, self.rows,
+                                  row_stride=self.col_stride,
+                                  col_stride=self.row_stride)
 
-        return newmat
+
+    def copy(self):
+        """ Return a row-major copy of this matrix with its own buffer """
+        return Matrix.from_buffer(array('d', (self[i, j] for i in range(self.rows)
+                                              for j in range(self.cols))),
+                                  self.rows, self.cols)
 
 
 
@@ -0,0 +1,84 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Import-time benchmark for the reusable modules. Every import pays its
+cost again in each worker of a process pool (e.g., sweep.run_sweep()),
+so the modules defer heavy optional dependencies such as astropy and
+matplotlib until they are used. Each module is imported in a fresh
+interpreter, and the time on top of starting Python and importing numpy,
+which every module needs, is compared to a startup budget. Any heavy
+dependencies found in sys.modules after the import are also reported.
+
+To run, enter the benchmarks/ directory and run python on the script.
+The exit status is nonzero if any module is over its budget.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import numpy as np
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../")
+
+# Module name, directory, and budget in seconds beyond importing numpy
+MODULES = [("matrix", "HW2", 0.02),
+           ("calculus", "HW2", 0.02),
+           ("ode", "HW3", 0.05),
+           ("coefficients_reader", "HW3", 0.05),
+           ("detailed_balance", "HW3", 0.05),
+           ("sweep", "HW3", 0.05),
+           ("stellar_structure", "HW4", 0.05),
+           ("eos_table", "HW4", 0.05),
+           ("coordinate", "HW5", 0.05),
+           ("particle", "HW5", 0.05),
+           ("quadtree", "HW5", 0.05),
+           ("direct", "HW5", 0.05),
+           ("parallel_forces", "HW5", 0.05),
+           ("fft", "HW8", 0.05)]
+
+HEAVY = ["astropy", "matplotlib", "scipy", "emcee", "corner"]
+
+# Prints the import time of the module and any heavy modules loaded
+TEMPLATE = """
+import sys, time
+import numpy
+start = time.perf_counter()
+import %s
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(" ".join(name for name in %r if name in sys.modules))
+"""
+
+
+def time_import(module, directory, repeat=5):
+    """
+    Return the best time in seconds to import module from directory in
+    a fresh interpreter, after numpy, and the heavy modules it loaded
+    """
+    best = np.inf
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", TEMPLATE%(module, HEAVY)],
+                                cwd=os.path.join(ROOT, directory), check=True,
+                                capture_output=True, text=True).stdout.split("\n")
+        best = min(best, float(output[0]))
+    return best, output[1].split()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the import times of the modules")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    over = False
+    print("%-22s %12s %12s  %s"%("module", "time (s)", "budget (s)", "heavy imports"))
+    for module, directory, budget in MODULES:
+        elapsed, heavy = time_import(module, directory, args.repeat)
+        flag = ""
+        if elapsed > budget:
+            flag = "OVER BUDGET"
+            over = True
+        print("%-22s %12.4f %12.4f  %s %s"%(module, elapsed, budget, " ".join(heavy), flag))
+    sys.exit(1 if over else 0)
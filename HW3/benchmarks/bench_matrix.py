@@ -0,0 +1,187 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Benchmark and profiling harness for the Matrix class in HW2/matrix.py
+The operations are timed over a sweep of matrix sizes, with numpy.linalg
+as the reference, and a complexity exponent p (time ~ N^p) is fit to each.
+
+To run, enter the benchmarks/ directory and run python on the script, e.g.,
+
+python bench_matrix.py --sizes 8 16 32 64 --profile profiles/
+"""
+
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../HW2/"))
+import numpy as np
+from matrix import Matrix
+
+
+OPERATIONS = ["construct", "mul", "transpose", "decomposeLU",
+              "solve_linear_system", "inverse", "determinant"]
+
+
+def make_cases(A, b):
+    """
+    Return dictionaries of zero-argument callables for each operation,
+    one using Matrix and one using the numpy reference
+
+    Parameters
+    ----------
+    A : np.ndarray
+        NxN array
+    b : np.ndarray
+        Nx1 array
+    """
+    rows = A.tolist()
+    MA = Matrix(rows)
+    Mb = Matrix(b.tolist())
+
+    # The LU-based methods cache L and U, so start from a fresh
+    # matrix every time in order to time the full calculation
+    matrix_cases = {"construct": lambda: Matrix(rows),
+                    "mul": lambda: MA*MA,
+                    "transpose": lambda: MA.transpose(),
+                    "decomposeLU": lambda: Matrix(rows).decomposeLU(),
+                    "solve_linear_system": lambda: Matrix(rows).solve_linear_system(Mb),
+                    "inverse": lambda: Matrix(rows).inverse(),
+                    "determinant": lambda: Matrix(rows).determinant()}
+
+    numpy_cases = {"construct": lambda: np.array(rows),
+                   "mul": lambda: A @ A,
+                   "transpose": lambda: A.T.copy(),
+                   "decomposeLU": lambda: np.linalg.qr(A), #numpy has no LU, QR is comparable
+                   "solve_linear_system": lambda: np.linalg.solve(A, b),
+                   "inverse": lambda: np.linalg.inv(A),
+                   "determinant": lambda: np.linalg.det(A)}
+    return matrix_cases, numpy_cases
+
+
+def time_call(func, repeat=3, min_time=0.05):
+    """
+    Return the best time per call of func in seconds
+
+    The function is called in loops long enough to take at least
+    min_time seconds, and the best of repeat loops is kept.
+    """
+    best = np.inf
+    for _ in range(repeat):
+        number = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            func()
+            number += 1
+            elapsed = time.perf_counter() - start
+        best = min(best, elapsed/number)
+    return best
+
+
+def fit_exponent(sizes, times):
+    """
+    Fit time = C * N^p in log-log space and return p
+    Returns NaN if there are fewer than two sizes
+    """
+    if len(sizes) < 2:
+        return np.nan
+    p, _ = np.polyfit(np.log(sizes), np.log(times), 1)
+    return p
+
+
+def run_benchmark(sizes, operations=OPERATIONS, repeat=3, min_time=0.05, seed=0):
+    """
+    Time every operation over every size
+
+    Parameters
+    ----------
+    sizes : list
+        Matrix sizes N to test
+    operations (optional) : list
+        Names of the operations to test, from OPERATIONS
+    repeat (optional) : int
+        Number of repeated timing loops, keeping the best
+    min_time (optional) : float
+        Minimum time in seconds for each timing loop
+    seed (optional) : int
+        Random seed for the test matrices
+
+    Returns
+    -------
+    results : dict
+        Dictionary keyed by operation, containing arrays of
+        "matrix" and "numpy" times per call in seconds and the
+        fitted "exponent" for the Matrix times.
+    """
+    rng = np.random.default_rng(seed)
+    results = {op: {"matrix": np.zeros(len(sizes)), "numpy": np.zeros(len(sizes))}
+               for op in operations}
+
+    for i, N in enumerate(sizes):
+        # Diagonally dominant so that LU without pivoting is stable
+        A = rng.random((N, N)) + N*np.eye(N)
+        b = rng.random((N, 1))
+        matrix_cases, numpy_cases = make_cases(A, b)
+        for op in operations:
+            results[op]["matrix"][i] = time_call(matrix_cases[op], repeat, min_time)
+            results[op]["numpy"][i] = time_call(numpy_cases[op], repeat, min_time)
+
+    for op in operations:
+        results[op]["exponent"] = fit_exponent(sizes, results[op]["matrix"])
+    return results
+
+
+def profile_operations(N, directory, operations=OPERATIONS, seed=0):
+    """
+    Run each Matrix operation once under cProfile for an NxN matrix
+    and dump the statistics to directory/<operation>_N.prof
+
+    Returns the list of file names written
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    A = rng.random((N, N)) + N*np.eye(N)
+    b = rng.random((N, 1))
+    matrix_cases, _ = make_cases(A, b)
+
+    filenames = list()
+    for op in operations:
+        profiler = cProfile.Profile()
+        profiler.runcall(matrix_cases[op])
+        filename = os.path.join(directory, "%s_%i.prof"%(op, N))
+        profiler.dump_stats(filename)
+        filenames.append(filename)
+    return filenames
+
+
+def print_results(sizes, results):
+    """ Print a table of the timing results """
+    print("%-20s %6s %14s %14s %10s"%("operation", "N", "Matrix (s)", "numpy (s)", "ratio"))
+    for op, result in results.items():
+        for i, N in enumerate(sizes):
+            print("%-20s %6i %14.4e %14.4e %10.1f"%(op, N, result["matrix"][i], result["numpy"][i],
+                                                  result["matrix"][i]/result["numpy"][i]))
+        print("%-20s fitted exponent p = %0.2f\n"%(op, result["exponent"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark HW2/matrix.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--operations", nargs="+", default=OPERATIONS, choices=OPERATIONS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.05)
+    parser.add_argument("--profile", default=None,
+                        help="Directory to dump cProfile statistics for the largest size")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.operations, args.repeat, args.min_time)
+    print_results(args.sizes, results)
+
+    if args.profile is not None:
+        for filename in profile_operations(max(args.sizes), args.profile, args.operations):
+            print("Top hot spots in %s:"%filename)
+            pstats.Stats(filename).sort_stats("cumulative").print_stats(5)
@@ -14,10 +14,75 @@ If the A_coefficients.dat is stored in a separate directory, you should
 specify that as an argument:
 
 read_coefficients(filename=/path/to/file)
+
+For rate-matrix calculations, read_coefficients_array() instead returns
+a dense array indexed as A[lower, upper], with units of inverse seconds
+attached once to the whole array:
+
+A = read_coefficients_array()
+A[3, 6]
+
+The parsed table is cached to a binary .npz file next to the text file
+(A_coefficients.npz), which is re-parsed only if it has been modified
+since the cache was written. The cache is written to a temporary file
+and renamed into place, so that processes reading it at the same time
+(e.g., sweep workers) never see a partial file.
+
+astropy is only imported when units are requested, since importing it
+takes much longer than reading the coefficients.
 """
 
+import os
+import tempfile
+import zipfile
 import numpy as np
-import astropy.units as un
+
+
+def _parse_coefficients(filename):
+    """ Parse the text file into arrays of the lower and upper levels and A_ul """
+    data = np.loadtxt(filename, delimiter=",",
+                      dtype={"names": ('l', 'u', 'A_ul'),
+                             "formats": (int, int, float)})
+    return data['l'], data['u'], data['A_ul']
+
+
+def _load_coefficients(filename, cache=True):
+    """
+    Return the arrays of _parse_coefficients(), from the .npz cache if
+    it is newer than the text file, otherwise parsing and re-caching
+    """
+    cachename = os.path.splitext(filename)[0] + ".npz"
+    mtime = os.path.getmtime(filename)
+    if cache and os.path.exists(cachename):
+        try:
+            with np.load(cachename) as data:
+                if data["mtime"] == mtime:
+                    return data['l'], data['u'], data['A_ul']
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            pass #a corrupt or old cache, rebuild it
+
+    l, u, As = _parse_coefficients(filename)
+    if cache:
+        _save_cache(cachename, l=l, u=u, A_ul=As, mtime=mtime)
+    return l, u, As
+
+
+def _save_cache(cachename, **arrays):
+    """
+    Write the .npz cache to a temporary file in the same directory, then
+    atomically replace the cache with it
+    """
+    try:
+        fd, tempname = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(cachename) or ".")
+    except OSError: #e.g., a read-only directory, just don't cache
+        return
+    try:
+        with os.fdopen(fd, "wb") as outfile:
+            np.savez(outfile, **arrays)
+        os.replace(tempname, cachename)
+    except OSError:
+        if os.path.exists(tempname):
+            os.remove(tempname)
 
 
 def read_coefficients(filename="A_coefficients.dat"):
@@ -28,13 +93,13 @@ def read_coefficients(filename="A_coefficients.dat"):
     =========
     filename (optional): another path to the A_coefficients.dat file.
     """
+    import astropy.units as un
+
     # unpack the text file
-    l, u, As = np.loadtxt(filename, unpack=True, delimiter=",",
-                          dtype={"names": ('l', 'u', 'A_ul'),
-                                 "formats": (np.int, np.int, np.float)})
+    l, u, As = _load_coefficients(filename)
 
     # Apply units of inverse seconds
-    As /= un.s
+    As = As / un.s
 
     # Create the dictionary to return
     Adict = dict()
@@ -44,8 +109,33 @@ def read_coefficients(filename="A_coefficients.dat"):
     return Adict
 
 
+def read_coefficients_array(filename="A_coefficients.dat", units=True, cache=True):
+    """
+    Return the A_ul coefficients as a dense (n_levels+1, n_levels+1) array
+    indexed as A[lower, upper], so that the levels can be used directly
+    as indices. Row and column 0 and all transitions not in the file
+    are zero.
+
+    Parameter
+    =========
+    filename (optional): another path to the A_coefficients.dat file.
+    units (optional): if True, return a Quantity in 1/s, otherwise a
+        plain np.ndarray in 1/s
+    cache (optional): if True, read and write the binary .npz cache
+    """
+    l, u, As = _load_coefficients(filename, cache)
+    n_levels = max(l.max(), u.max())
+    A = np.zeros((n_levels+1, n_levels+1))
+    A[l, u] = As
+    if units:
+        import astropy.units as un
+        return A / un.s
+    return A
+
+
 if __name__ == '__main__':
     Adict = read_coefficients()
     print(Adict)
     print("Check: 778000 1 / s is roughly")
     print(Adict[(3, 6)])
+    print(read_coefficients_array()[3, 6])
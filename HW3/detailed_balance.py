@@ -0,0 +1,170 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Level populations of hydrogen in detailed balance, as in the HW3
+detailed-balance notebook, but vectorized. The notebook's make_M(T)
+fills the rate matrix element by element, recomputing the transition
+frequencies and Einstein coefficients with astropy units for every term.
+Here the frequency, B_ul, and B_lu arrays are computed once in CGS, the
+mean intensities are evaluated for a whole array of temperatures in one
+broadcast, and a stack of rate matrices (n_T, n, n) is assembled at once:
+
+Ts = np.logspace(3, 7, 30)
+M = rate_matrices(Ts)
+n = level_populations(Ts)
+
+All arrays of level quantities are indexed by the level number, so
+that index 0 is unused, as in coefficients_reader.read_coefficients_array().
+"""
+
+import os
+import numpy as np
+from coefficients_reader import read_coefficients_array
+
+
+# Constants in CGS, CODATA 2022 values as in astropy.constants
+h = 6.62607015e-27 #erg s
+c = 2.99792458e10 #cm s^-1
+k_B = 1.380649e-16 #erg K^-1
+eV = 1.602176634e-12 #erg
+E_ionization = 13.6*eV #as in the notebook
+
+FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "A_coefficients.dat")
+
+
+def degeneracies(n_levels):
+    """ Degeneracy factors g_n = 2n^2 of hydrogen, indexed by level """
+    n = np.arange(n_levels+1)
+    return 2*n**2
+
+
+def transition_frequencies(n_levels):
+    """
+    Transition frequencies (Hz) between all pairs of levels, as an
+    (n_levels+1, n_levels+1) array where nu[l, u] = nu[u, l]
+    """
+    n = np.arange(1, n_levels+1)
+    E = np.zeros(n_levels+1)
+    E[1:] = -E_ionization/n**2
+    nu = np.abs(E[:, None] - E[None, :])/h
+    nu[0, :] = nu[:, 0] = 0.0
+    return nu
+
+
+def einstein_B(A):
+    """
+    Return the Einstein B coefficients from the A coefficients
+
+    Parameters
+    ----------
+    A : np.ndarray
+        (n_levels+1, n_levels+1) array of A_ul (1/s) indexed as A[lower, upper]
+
+    Returns
+    -------
+    nu : np.ndarray
+        Transition frequencies (Hz), see transition_frequencies()
+    B_ul : np.ndarray
+        Stimulated emission coefficients, indexed as B_ul[lower, upper]
+    B_lu : np.ndarray
+        Absorption coefficients, indexed as B_lu[lower, upper]
+    """
+    n_levels = len(A) - 1
+    nu = transition_frequencies(n_levels)
+    g = degeneracies(n_levels)
+    transitions = A != 0
+    nu_safe = np.where(transitions, nu, 1.0)
+    B_ul = np.where(transitions, A*c**2/(2*h*nu_safe**3), 0.0)
+    g_l = np.where(g == 0, 1, g)
+    B_lu = B_ul*g[None, :]/g_l[:, None]
+    return nu, B_ul, B_lu
+
+
+def mean_intensity(nu, Ts):
+    """
+    Planck mean intensities J(nu, T) (erg s^-1 cm^-2 Hz^-1 sr^-1) for
+    every frequency and temperature, broadcast to shape Ts.shape + nu.shape.
+    Zero frequencies return zero.
+    """
+    Ts = np.asarray(Ts, dtype=np.float64)[..., None, None]
+    nu_safe = np.where(nu == 0, 1.0, nu)
+    with np.errstate(over="ignore"): #J -> 0 as exp(h nu/k_B T) -> inf
+        J = (2*h*nu_safe**3/c**2)/np.expm1(h*nu_safe/(k_B*Ts))
+    return np.where(nu == 0, 0.0, J)
+
+
+def _to_kelvin(Ts):
+    """ Accept temperatures as floats in K or as astropy Quantities """
+    if hasattr(Ts, "unit"):
+        import astropy.units as un
+        return Ts.to(un.K).value
+    return Ts
+
+
+def rate_matrices(Ts, A=None, n_levels=None):
+    """
+    Assemble the detailed-balance rate matrices for an array of temperatures
+
+    Row i of each matrix, times the level populations, is the net rate
+    out of level i+1, as in the notebook's make_M(T): the diagonal holds
+    all absorption, stimulated emission, and spontaneous emission out of
+    the level, and the off-diagonal terms the rates into it.
+
+    Parameters
+    ----------
+    Ts : float, np.ndarray, astropy.units.Quantity
+        Temperatures, in K if not a Quantity
+    A (optional) : np.ndarray
+        (n+1, n+1) array of A_ul (1/s) indexed as A[lower, upper],
+        by default read from A_coefficients.dat
+    n_levels (optional) : int
+        Use only the first n_levels levels of A
+
+    Returns
+    -------
+    M : np.ndarray
+        Rate matrices (1/s) of shape Ts.shape + (n_levels, n_levels)
+    """
+    if A is None:
+        A = read_coefficients_array(FILENAME, units=False)
+    if n_levels is not None:
+        A = A[:n_levels+1, :n_levels+1]
+    nu, B_ul, B_lu = einstein_B(A)
+    J = mean_intensity(nu, _to_kelvin(Ts))
+
+    # R[..., a, b] is the rate from level a to level b per atom in a
+    upper = np.triu(np.ones(A.shape, dtype=bool), 1)
+    R = np.where(upper, B_lu*J, 0.0) #absorption, lower to upper
+    R += np.swapaxes(np.where(upper, A + B_ul*J, 0.0), -1, -2) #emission, upper to lower
+    R = R[..., 1:, 1:]
+
+    M = -np.swapaxes(R, -1, -2)
+    diagonal = np.einsum("...ii->...i", M) #writeable view of the diagonals
+    diagonal += R.sum(axis=-1)
+    return M
+
+
+def level_populations(Ts, A=None, n_levels=None):
+    """
+    Solve for the level populations in detailed balance, normalized
+    to a total density of 1 cm^-3, for an array of temperatures
+
+    The rate matrices are singular, since the rates only determine the
+    ratios of the populations, so the last equation is replaced by the
+    normalization.
+
+    Parameters
+    ----------
+    As in rate_matrices()
+
+    Returns
+    -------
+    n : np.ndarray
+        Level populations (cm^-3) of shape Ts.shape + (n_levels,)
+    """
+    M = rate_matrices(Ts, A, n_levels)
+    M[..., -1, :] = 1.0
+    b = np.zeros(M.shape[:-1])
+    b[..., -1] = 1.0
+    return np.linalg.solve(M, b[..., None])[..., 0]
@@ -3,22 +3,1351 @@ Michael Lam
 ASTP-720, Fall 2020
 
 Set of functions to perform ODE solving
-The assumption is that either one or two variables can be solved
-for simultaneously. Therefore, rather than making a generic solver
-like scipy's odeint(), I have intentionally constructed these to
-take a set of functions, dy_A/dt and and y_{A,0}, and also allow
-for optional arguments dy_B/dt and y_{B,0}.
-
-By design, many of these functions are similar internally. However,
-I will write them out as separate functions explicitly, rather
-than trying to combine them all into a single function with
-internal logic.
+The main interface assumes that either one or two variables are
+solved for simultaneously, so the functions euler(), heun(), RK4(),
+and RK45() take a set of functions, dy_A/dt and y_{A,0}, and also
+allow for optional arguments dy_B/dt and y_{B,0}.
+
+Each method is written once, as a single step, e.g.,
+RK4_step(f, t, y, h), and a vector-valued solver, e.g.,
+RK4_system(ts, f, y0), where f(t, y) takes and returns an np.ndarray y
+of any length. The fixed-step solvers share one loop over ts,
+_integrate(), which also handles the events and statistics, and the
+one- and two-equation functions are thin wrappers that pack the
+equations into a vector for the *_system() functions and unpack the
+output. The steps are also available for building other drivers,
+such as ensemble_system(), which integrates many initial conditions
+in lockstep with vectorized derivative functions, and stream_system(),
+which yields the solution of very long integrations in chunks.
+All of the solvers take an optional SolverStats instance to measure
+their cost.
+For separable systems such as orbits, symplectic_system() provides
+leapfrog/velocity Verlet and 4th order Yoshida integrators.
+
+For stiff systems, BDF_system() is an implicit solver that uses the
+LU decomposition of the Matrix class from HW2.
 """
 
+import os
+import sys
+import time
 import numpy as np
 
 
-def euler(ts, dyAdt, yA0, dyBdt=None, yB0=None):
+def euler_step(f, t, y, h):
+    """
+    Single forward Euler step of y' = f(t, y) from t to t+h
+
+    Parameters
+    ----------
+    f : function
+        Derivative function f(t, y), returning an array the shape of y
+    t : float
+        Current time
+    y : np.ndarray
+        Current state vector
+    h : float
+        Step size
+
+    Returns
+    -------
+    ynew : np.ndarray
+        State vector at t+h
+    """
+    return y + h*f(t, y)
+
+
+def heun_step(f, t, y, h, niter=10, rtol=1e-9, atol=0.0, full_output=False):
+    """
+    Single Heun step of y' = f(t, y) from t to t+h
+
+    The Picard iterations stop once successive iterates agree to
+    within |y_{k+1} - y_k| <= atol + rtol*|y_{k+1}| for every element,
+    or after niter corrector steps. Other parameters are as in euler_step().
+
+    Parameters
+    ----------
+    niter (optional) : int
+        Maximum number of Picard iterations/corrector steps to perform
+    rtol (optional) : float
+        Relative tolerance between successive iterates
+    atol (optional) : float
+        Absolute tolerance between successive iterates
+    full_output (optional) : bool
+        If True, also return the number of corrector steps performed
+    """
+    f_i = f(t, y)
+    ynew = y + h*f_i
+    # Now perform Picard iteration
+    k = 0
+    while k < niter:
+        # At the i+1 time step, replace the next k+1
+        # iteration with the previous.
+        yold = ynew
+        ynew = y + 0.5*h*(f_i + f(t + h, yold))
+        k += 1
+        if np.all(np.abs(ynew - yold) <= atol + rtol*np.abs(ynew)):
+            break
+    if full_output:
+        return ynew, k
+    return ynew
+
+
+def RK4_step(f, t, y, h):
+    """
+    Single classical Runge-Kutta step of y' = f(t, y) from t to t+h
+    Parameters are as in euler_step().
+    """
+    k1 = h*f(t, y)
+    k2 = h*f(t + h/2.0, y + k1/2.0)
+    k3 = h*f(t + h/2.0, y + k2/2.0)
+    k4 = h*f(t + h, y + k3)
+    return y + (k1 + 2*k2 + 2*k3 + k4)/6.0
+
+
+
+def make_output(ts, y0):
+    """
+    Preallocate the (n_steps, n_dim) output buffer for a set of times
+    and initial state vector, filling in the first row with y0
+    """
+    y0 = np.atleast_1d(np.asarray(y0))
+    dtype = np.result_type(y0.dtype, np.float64)
+    ys = np.empty((len(ts), len(y0)), dtype=dtype)
+    ys[0] = y0
+    return ys
+
+
+def locate_root(g, ga, gb, xtol=1e-12, maxiter=100):
+    """
+    Find the root of g(theta) for theta in [0, 1] using the
+    Illinois variant of the false-position method
+
+    This works elementwise on arrays as well, so that many roots
+    can be found at once with one call of g per iteration.
+
+    Parameters
+    ----------
+    g : function
+        Function of theta, with g(0) = ga and g(1) = gb of opposite signs
+    ga : float, np.ndarray
+        Value of g(0)
+    gb : float, np.ndarray
+        Value of g(1)
+    xtol (optional) : float
+        Tolerance on theta
+    maxiter (optional) : int
+        Maximum number of iterations
+
+    Returns
+    -------
+    theta : float, np.ndarray
+        Location of the root. The returned value is always on the
+        far side of the root, i.e., where g has the sign of gb.
+    """
+    scalar = np.ndim(ga) == 0 and np.ndim(gb) == 0
+    ga = np.array(ga, dtype=np.float64)
+    gb = np.array(gb, dtype=np.float64)
+    a = np.zeros_like(ga)
+    b = np.ones_like(gb)
+    side = np.zeros(ga.shape, dtype=int)
+    for _ in range(maxiter):
+        todo = (b - a > xtol) & (gb != 0)
+        if not np.any(todo):
+            break
+        c = (a*gb - b*ga)/(gb - ga)
+        # Keep away from the endpoints to guarantee shrinking the bracket
+        c = np.clip(c, a + 0.5*xtol, b - 0.5*xtol)
+        gc = g(float(c) if scalar else c)
+        right = todo & ((gc == 0) | (np.sign(gc) == np.sign(gb)))
+        left = todo & ~right
+        # Halve the retained endpoint if the same side moves twice in a row
+        ga = np.where(right & (side == -1), ga/2.0, ga)
+        gb = np.where(left & (side == 1), gb/2.0, gb)
+        b = np.where(right, c, b)
+        gb = np.where(right, gc, gb)
+        a = np.where(left, c, a)
+        ga = np.where(left, gc, ga)
+        side = np.where(right, -1, np.where(left, 1, side))
+    if scalar:
+        return float(b)
+    return b
+
+
+class EventTracker:
+    """
+    Keeps track of the event functions during an integration
+
+    Each event is a function g(t, y), and an event occurs where g
+    crosses zero. As in scipy.integrate.solve_ivp(), the optional
+    attribute g.terminal = True will stop the integration at the first
+    occurrence, and g.direction = 1 (-1) will only count crossings where
+    g goes from negative to positive (positive to negative).
+
+    Parameters
+    ----------
+    events : function, list
+        Event function or list of event functions
+    t0 : float
+        Initial time
+    y0 : np.ndarray
+        Initial state vector
+    """
+    def __init__(self, events, t0, y0):
+        if callable(events):
+            events = [events]
+        self.events = list(events)
+        self.terminal = [getattr(event, "terminal", False) for event in self.events]
+        self.direction = [getattr(event, "direction", 0) for event in self.events]
+        self.g = [event(t0, y0) for event in self.events]
+        self.t_events = [list() for event in self.events]
+        self.y_events = [list() for event in self.events]
+
+
+    def update(self, t, h, ynew, y_at):
+        """
+        Check for events within the step from t to t+h
+
+        Parameters
+        ----------
+        t : float
+            Time at the start of the step
+        h : float
+            Step size
+        ynew : np.ndarray
+            State vector at t+h
+        y_at : function
+            Returns the state vector at t + theta*h, for theta in [0, 1]
+
+        Returns
+        -------
+        theta : float
+            Fraction of the step at which a terminal event occurred,
+            or None if the integration should continue
+        """
+        gnew = [event(t + h, ynew) for event in self.events]
+        found = list()
+        for k, event in enumerate(self.events):
+            up = self.g[k] < 0 and gnew[k] >= 0
+            down = self.g[k] > 0 and gnew[k] <= 0
+            if (up and self.direction[k] >= 0) or (down and self.direction[k] <= 0):
+                theta = locate_root(lambda th: event(t + th*h, y_at(th)),
+                                    self.g[k], gnew[k])
+                found.append((theta, k))
+        self.g = gnew
+
+        # Record events in time order, stopping at the first terminal one
+        for theta, k in sorted(found):
+            self.t_events[k].append(t + theta*h)
+            self.y_events[k].append(ynew if theta == 1 else y_at(theta))
+            if self.terminal[k]:
+                return theta
+        return None
+
+
+    def results(self):
+        """
+        Return the event times and states
+
+        Returns
+        -------
+        t_events : list
+            For each event, an np.ndarray of the times it occurred
+        y_events : list
+            For each event, an np.ndarray of shape (n_occurrences, n_dim)
+            of the state vectors at those times
+        """
+        t_events = [np.array(t_event) for t_event in self.t_events]
+        y_events = [np.array(y_event) for y_event in self.y_events]
+        return t_events, y_events
+
+
+class SolverStats:
+    """
+    Opt-in instrumentation for the solvers. Pass an instance as the
+    stats argument of a solver, after which it contains the number of
+    derivative evaluations, the time spent inside the derivative
+    function versus the solver itself, and the accepted and rejected
+    steps. An instance can be reused to accumulate over several runs.
+
+    Parameters
+    ----------
+    trace (optional) : bool
+        If True, also keep a per-step trace, see get_trace()
+    """
+    def __init__(self, trace=False):
+        self.nfev = 0
+        self.naccept = 0
+        self.nreject = 0
+        self.f_time = 0.0 #time spent inside the derivative function
+        self.max_f_time = 0.0 #longest single stage evaluation
+        self.total_time = 0.0
+        self.steps = list() if trace else None
+        self._start = None
+        self._step_nfev = 0
+        self._step_f_time = 0.0
+
+
+    def wrap(self, f):
+        """ Return f(t, y) wrapped to count and time every evaluation """
+        def wrapped(t, y):
+            start = time.perf_counter()
+            retval = f(t, y)
+            elapsed = time.perf_counter() - start
+            self.nfev += 1
+            self.f_time += elapsed
+            self.max_f_time = max(self.max_f_time, elapsed)
+            self._step_nfev += 1
+            self._step_f_time += elapsed
+            return retval
+        return wrapped
+
+
+    def start(self):
+        """ Start the wall-clock timer for a solver call """
+        self._start = time.perf_counter()
+
+
+    def stop(self):
+        """ Stop the wall-clock timer for a solver call """
+        self.total_time += time.perf_counter() - self._start
+
+
+    def record_step(self, t, h, accepted=True):
+        """
+        Record a step from t to t+h, with the derivative evaluations and
+        time spent in them since the previous step
+        """
+        if accepted:
+            self.naccept += 1
+        else:
+            self.nreject += 1
+        if self.steps is not None:
+            self.steps.append((t, h, accepted, self._step_nfev, self._step_f_time))
+        self._step_nfev = 0
+        self._step_f_time = 0.0
+
+
+    @property
+    def overhead_time(self):
+        """ Time spent in the solver outside of the derivative function """
+        return self.total_time - self.f_time
+
+
+    def get_trace(self):
+        """
+        Return the per-step trace as a structured np.ndarray with fields
+        "t", "h", "accepted", "nfev", and "f_time", or None if the trace
+        was not requested
+        """
+        if self.steps is None:
+            return None
+        dtype = [("t", np.float64), ("h", np.float64), ("accepted", bool),
+                 ("nfev", np.int64), ("f_time", np.float64)]
+        return np.array(self.steps, dtype=dtype)
+
+
+    def as_dict(self):
+        """ Return the summary statistics as a dictionary """
+        return {"nfev": self.nfev, "naccept": self.naccept, "nreject": self.nreject,
+                "f_time": self.f_time, "max_f_time": self.max_f_time,
+                "total_time": self.total_time, "overhead_time": self.overhead_time}
+
+
+    def __str__(self):
+        """ Nice printing """
+        fraction = self.f_time/self.total_time if self.total_time > 0 else 0.0
+        return ("%i derivative evaluations over %i accepted and %i rejected steps\n"
+                "%0.3e s total, %0.3e s (%0.1f%%) in the derivative function, "
+                "%0.3e s solver overhead"%(self.nfev, self.naccept, self.nreject,
+                                            self.total_time, self.f_time, 100*fraction,
+                                            self.overhead_time))
+    __repr__ = __str__
+
+
+def _integrate(step, ts, f, y0, events=None, stats=None, **kwargs):
+    """ Shared fixed-grid loop for the *_system() functions """
+    if stats is not None:
+        f = stats.wrap(f)
+        stats.start()
+    ys = make_output(ts, y0)
+    if events is None:
+        for i in range(len(ts) - 1): #do not go to the last timestep
+            t = ts[i]
+            ys[i+1] = step(f, t, ys[i], ts[i+1] - t, **kwargs)
+            if stats is not None:
+                stats.record_step(t, ts[i+1] - t)
+        if stats is not None:
+            stats.stop()
+        return ys
+
+    tracker = EventTracker(events, ts[0], ys[0])
+    for i in range(len(ts) - 1):
+        t = ts[i]
+        h = ts[i+1] - t
+        ys[i+1] = step(f, t, ys[i], h, **kwargs)
+        # Within a step, the state is found by a shorter step of the same method
+        y_at = lambda theta: step(f, t, ys[i], theta*h, **kwargs)
+        theta = tracker.update(t, h, ys[i+1], y_at)
+        if stats is not None:
+            stats.record_step(t, h)
+        if theta is not None:
+            ys = ys[:i+2] if theta == 1 else ys[:i+1]
+            break
+    if stats is not None:
+        stats.stop()
+    return (ys,) + tracker.results()
+
+
+def euler_system(ts, f, y0, events=None, stats=None):
+    """
+    Forward Euler method for solving a system of ODEs
+    y' = f(t, y)
+    where y is a vector of any length
+
+    Parameters
+    ----------
+    ts : list, np.ndarray
+        Times to solve the functions y(t) at
+    f : function
+        Derivative function f(t, y). It must take the time and the
+        state vector and return an array of the same length.
+    y0 : list, np.ndarray
+        Initial state vector y(0)
+    events (optional) : function, list
+        Event function(s) g(t, y) to locate the zeros of, see EventTracker
+    stats (optional) : SolverStats
+        If given, record the derivative evaluations, timing, and steps
+
+    Returns
+    -------
+    ys : np.ndarray
+        Array of shape (len(ts), len(y0)) of y(t). If a terminal event
+        occurs, only the rows up to the event are returned.
+    t_events : list
+        Only if events is given. For each event, the times it occurred.
+    y_events : list
+        Only if events is given. For each event, the state vectors
+        at those times.
+    """
+    return _integrate(euler_step, ts, f, y0, events=events, stats=stats)
+
+
+def heun_system(ts, f, y0, niter=10, rtol=1e-9, atol=0.0, events=None, stats=None,
+                full_output=False):
+    """
+    Heun's method for solving a system of ODEs
+    y' = f(t, y)
+    See euler_system() for the parameters, events, stats, and return value, and
+    heun_step() for niter, the maximum number of Picard iterations/corrector
+    steps, and the tolerances rtol and atol.
+
+    If full_output is True, a dictionary of information is also returned,
+    with the number of derivative evaluations "nfev" and the mean number of
+    corrector steps per step "mean_iterations". Steps used to locate events
+    are included.
+    """
+    iterations = list()
+    def step(f, t, y, h):
+        ynew, k = heun_step(f, t, y, h, niter=niter, rtol=rtol, atol=atol, full_output=True)
+        iterations.append(k)
+        return ynew
+
+    retval = _integrate(step, ts, f, y0, events=events, stats=stats)
+    if not full_output:
+        return retval
+    if not isinstance(retval, tuple):
+        retval = (retval,)
+    info = {"nfev": len(iterations) + sum(iterations),
+            "mean_iterations": np.mean(iterations) if iterations else 0.0}
+    return retval + (info,)
+
+
+def RK4_system(ts, f, y0, events=None, stats=None):
+    """
+    Classical Runge-Kutta method for solving a system of ODEs
+    y' = f(t, y)
+    See euler_system() for the parameters, events, stats, and return value.
+    """
+    return _integrate(RK4_step, ts, f, y0, events=events, stats=stats)
+
+
+# Dormand-Prince 5(4) coefficients, see Hairer, Norsett & Wanner (1993).
+# DP_E gives the difference between the 5th and embedded 4th order
+# solutions, and DP_P gives the 4th order continuous extension used
+# for the dense output (as in scipy.integrate.RK45).
+DP_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1])
+DP_A = [np.array([]),
+        np.array([1/5]),
+        np.array([3/40, 9/40]),
+        np.array([44/45, -56/15, 32/9]),
+        np.array([19372/6561, -25360/2187, 64448/6561, -212/729]),
+        np.array([9017/3168, -355/33, 46732/5247, 49/176, -5103/18656])]
+DP_B = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84])
+DP_E = np.array([-71/57600, 0, 71/16695, -71/1920, 17253/339200, -22/525, 1/40])
+DP_P = np.array([
+    [1, -8048581381/2820520608, 8663915743/2820520608, -12715105075/11282082432],
+    [0, 0, 0, 0],
+    [0, 131558114200/32700410799, -68118460800/10900136933, 87487479700/32700410799],
+    [0, -1754552775/470086768, 14199869525/1410260304, -10690763975/1880347072],
+    [0, 127303824393/49829197408, -318862633887/49829197408, 701980252875/199316789632],
+    [0, -282668133/205662961, 2019193451/616988883, -1453857185/822651844],
+    [0, 40617522/29380423, -110615467/29380423, 69997945/29380423]])
+
+
+def RK45_step(f, t, y, h, f0):
+    """
+    Single Dormand-Prince step of y' = f(t, y) from t to t+h
+
+    Parameters
+    ----------
+    f : function
+        Derivative function f(t, y), returning an array the shape of y
+    t : float
+        Current time
+    y : np.ndarray
+        Current state vector
+    h : float
+        Step size
+    f0 : np.ndarray
+        f(t, y), which is the last stage of the previous step (FSAL)
+
+    Returns
+    -------
+    ynew : np.ndarray
+        5th order state vector at t+h
+    K : np.ndarray
+        Array of shape (7, len(y)) of the stage derivatives. The
+        last row is f(t+h, ynew), to be reused by the next step.
+    error : np.ndarray
+        Local error estimate of ynew
+    """
+    K = np.empty((7, len(y)), dtype=y.dtype)
+    K[0] = f0
+    for s in range(1, 6):
+        K[s] = f(t + DP_C[s]*h, y + h*(DP_A[s] @ K[:s]))
+    ynew = y + h*(DP_B @ K[:6])
+    K[6] = f(t + h, ynew)
+    error = h*(DP_E @ K)
+    return ynew, K, error
+
+
+def RK45_dense(y, h, K, theta):
+    """
+    Evaluate the continuous extension of a Dormand-Prince step
+
+    Parameters
+    ----------
+    y : np.ndarray
+        State vector at the start of the step
+    h : float
+        Step size
+    K : np.ndarray
+        Stage derivatives returned by RK45_step()
+    theta : float, np.ndarray
+        Fraction(s) of the step, between 0 and 1
+
+    Returns
+    -------
+    ys : np.ndarray
+        State vector(s) at t + theta*h, of shape (len(theta), len(y))
+        if theta is an array
+    """
+    theta = np.asarray(theta, dtype=np.float64)
+    powers = theta[..., np.newaxis]**np.arange(1, 5) #theta, theta^2, theta^3, theta^4
+    return y + h*(powers @ (K.T @ DP_P).T)
+
+
+def error_norm(error, y, ynew, rtol, atol):
+    """ RMS norm of the error scaled by the mixed tolerance """
+    scale = atol + rtol*np.maximum(np.abs(y), np.abs(ynew))
+    return np.sqrt(np.mean((error/scale)**2))
+
+
+def initial_step(f, t0, y0, f0, direction, rtol, atol, order=5):
+    """
+    Estimate a starting step size, following Hairer, Norsett & Wanner (1993)
+    Returns the step size with the sign of direction
+    """
+    scale = atol + rtol*np.abs(y0)
+    d0 = np.sqrt(np.mean((y0/scale)**2))
+    d1 = np.sqrt(np.mean((f0/scale)**2))
+    if d0 < 1e-5 or d1 < 1e-5:
+        h0 = 1e-6
+    else:
+        h0 = 0.01*d0/d1
+
+    y1 = y0 + direction*h0*f0
+    f1 = f(t0 + direction*h0, y1)
+    d2 = np.sqrt(np.mean(((f1 - f0)/scale)**2))/h0
+    if d1 <= 1e-15 and d2 <= 1e-15:
+        h1 = max(1e-6, 1e-3*h0)
+    else:
+        h1 = (0.01/max(d1, d2))**(1.0/order)
+    return direction*min(100*h0, h1)
+
+
+def RK45_system(ts, f, y0, rtol=1e-6, atol=1e-9, h0=None, max_steps=100000,
+                safety=0.9, events=None, stats=None, full_output=False):
+    """
+    Adaptive Dormand-Prince (RK45) method for solving a system of ODEs
+    y' = f(t, y)
+
+    The step size is chosen by the local error estimate rather than by
+    ts. Steps whose error exceeds the tolerance are rejected and retried
+    with a smaller step, and the last stage of each step is reused as the
+    first stage of the next (FSAL). The values at ts are then found with
+    the dense output of each step, which is also used to locate events.
+
+    Parameters
+    ----------
+    ts : list, np.ndarray
+        Times to solve the functions y(t) at, monotonic
+    f : function
+        Derivative function f(t, y). It must take the time and the
+        state vector and return an array of the same length.
+    y0 : list, np.ndarray
+        Initial state vector y(ts[0])
+    rtol (optional) : float
+        Relative tolerance of the local error
+    atol (optional) : float, np.ndarray
+        Absolute tolerance of the local error
+    h0 (optional) : float
+        Initial step size. If None, it will be estimated.
+    max_steps (optional) : int
+        Maximum number of steps (accepted and rejected) to take
+    safety (optional) : float
+        Safety factor on the step size update
+    events (optional) : function, list
+        Event function(s) g(t, y) to locate the zeros of, see EventTracker
+    stats (optional) : SolverStats
+        If given, record the derivative evaluations, timing, and steps
+    full_output (optional) : bool
+        If True, also return a dictionary of information
+
+    Returns
+    -------
+    ys : np.ndarray
+        Array of shape (len(ts), len(y0)) of y(t). If a terminal event
+        occurs, only the rows up to the event are returned.
+    t_events : list
+        Only if events is given. For each event, the times it occurred.
+    y_events : list
+        Only if events is given. For each event, the state vectors
+        at those times.
+    info : dict
+        Only if full_output is True. Contains the number of derivative
+        evaluations "nfev", accepted steps "naccept", rejected steps
+        "nreject", and the array of accepted step times "t_steps".
+    """
+    if stats is not None:
+        f = stats.wrap(f)
+        stats.start()
+    ts = np.asarray(ts, dtype=np.float64)
+    ys = make_output(ts, y0)
+    t = ts[0]
+    y = ys[0].copy()
+    t_end = ts[-1]
+    direction = 1.0 if t_end >= t else -1.0
+
+    f0 = np.asarray(f(t, y))
+    nfev = 1
+    if h0 is None:
+        h = initial_step(f, t, y, f0, direction, rtol, atol)
+        nfev += 1
+    else:
+        h = direction*abs(h0)
+
+    if events is not None:
+        tracker = EventTracker(events, t, y)
+
+    naccept = 0
+    nreject = 0
+    t_steps = [t]
+    i = 1 #next output index to fill
+    while i < len(ts):
+        if naccept + nreject >= max_steps:
+            raise RuntimeError("Maximum number of steps (%i) reached at t = %e"%(max_steps, t))
+        # Do not step past the end
+        if direction*(t + h - t_end) >= 0:
+            h = t_end - t
+            tnew = t_end
+        else:
+            tnew = t + h
+        if tnew == t:
+            raise RuntimeError("Step size underflow at t = %e"%t)
+
+        ynew, K, error = RK45_step(f, t, y, h, f0)
+        nfev += 6
+        err = error_norm(error, y, ynew, rtol, atol)
+
+        if not err <= 1: #also rejects NaN
+            if stats is not None:
+                stats.record_step(t, h, accepted=False)
+            h *= max(0.2, safety*err**-0.2) if np.isfinite(err) else 0.2
+            nreject += 1
+            continue
+
+        # Accepted, so check for events within this step
+        if stats is not None:
+            stats.record_step(t, h)
+        theta = None
+        tstop = tnew
+        if events is not None:
+            theta = tracker.update(t, h, ynew, lambda th: RK45_dense(y, h, K, th))
+            if theta is not None and theta < 1:
+                tstop = t + theta*h
+
+        # Fill any output times inside of this step
+        j = i
+        while j < len(ts) and direction*(ts[j] - tstop) <= 0:
+            j += 1
+        if j > i:
+            ys[i:j] = RK45_dense(y, h, K, (ts[i:j] - t)/h)
+            if ts[j-1] == tnew:
+                ys[j-1] = ynew
+            i = j
+        if theta is not None: #terminal event
+            ys = ys[:i]
+            t_steps.append(tstop)
+            naccept += 1
+            break
+
+        t, y, f0 = tnew, ynew, K[6]
+        naccept += 1
+        t_steps.append(t)
+        if err == 0:
+            h *= 10
+        else:
+            h *= min(10, safety*err**-0.2)
+
+    if stats is not None:
+        stats.stop()
+    retval = (ys,)
+    if events is not None:
+        retval += tracker.results()
+    if full_output:
+        info = {"nfev": nfev, "naccept": naccept, "nreject": nreject,
+                "t_steps": np.array(t_steps)}
+        retval += (info,)
+    if len(retval) == 1:
+        return ys
+    return retval
+
+
+
+STEPS = {"euler": euler_step, "heun": heun_step, "RK4": RK4_step}
+
+
+def ensemble_system(ts, f, Y0, method="RK4", event=None, stats=None, **kwargs):
+    """
+    Integrate an ensemble of M initial conditions of y' = f(t, y)
+    in lockstep on the same grid of times, with one vectorized call
+    of f per stage for all of the members.
+
+    Parameters
+    ----------
+    ts : list, np.ndarray
+        Times to solve the functions y(t) at
+    f : function
+        Derivative function f(t, Y), where Y is an array of shape
+        (m, n_dim) of the state vectors of m members. It must return an
+        array of the same shape and must treat each row independently,
+        since finished members are dropped from Y.
+    Y0 : list, np.ndarray
+        Array of shape (M, n_dim) of the initial state vectors
+    method (optional) : str
+        One of "euler", "heun", or "RK4"
+    event (optional) : function
+        Event function g(t, Y) returning an array of length m. Each
+        member stops at the first zero crossing of its g, respecting
+        the optional g.direction attribute as in EventTracker. The
+        crossings are located with cubic Hermite interpolation of y
+        across the step.
+    stats (optional) : SolverStats
+        If given, record the derivative evaluations, timing, and steps.
+        Each vectorized call of f counts as one evaluation.
+    kwargs : dict
+        Additional arguments to the step function, e.g., niter for heun
+
+    Returns
+    -------
+    ys : np.ndarray
+        Array of shape (len(ts), M, n_dim) of y(t). Once a member has
+        stopped, the remaining rows for that member are NaN.
+    t_events : np.ndarray
+        Only if event is given. Array of length M of the event times,
+        NaN for members that did not reach their event.
+    y_events : np.ndarray
+        Only if event is given. Array of shape (M, n_dim) of the state
+        vectors at the event times.
+    """
+    step = STEPS[method]
+    if stats is not None:
+        f = stats.wrap(f)
+        stats.start()
+    Y0 = np.atleast_2d(np.asarray(Y0))
+    M, n_dim = Y0.shape
+    ys = np.full((len(ts), M, n_dim), np.nan, dtype=np.result_type(Y0.dtype, np.float64))
+    ys[0] = Y0
+    active = np.ones(M, dtype=bool)
+
+    if event is not None:
+        direction = getattr(event, "direction", 0)
+        g = np.array(event(ts[0], Y0), dtype=np.float64) #copy, as g may be a view of Y0
+        t_events = np.full(M, np.nan)
+        y_events = np.full((M, n_dim), np.nan)
+
+    for i in range(len(ts) - 1):
+        inds = np.flatnonzero(active)
+        if len(inds) == 0:
+            break
+        t = ts[i]
+        h = ts[i+1] - t
+        Y = ys[i, inds]
+        Ynew = step(f, t, Y, h, **kwargs)
+        ys[i+1, inds] = Ynew
+        if stats is not None:
+            stats.record_step(t, h)
+        if event is None:
+            continue
+
+        gnew = np.asarray(event(t + h, Ynew), dtype=np.float64)
+        gold = g[inds]
+        up = (gold < 0) & (gnew >= 0)
+        down = (gold > 0) & (gnew <= 0)
+        crossed = np.flatnonzero((up & (direction >= 0)) | (down & (direction <= 0)))
+        g[inds] = gnew
+        if len(crossed) == 0:
+            continue
+
+        # Locate all of the events in this step at once, using cubic
+        # Hermite interpolation across the step for the state
+        Yc = Y[crossed]
+        Ycnew = Ynew[crossed]
+        Fc = f(t, Yc)
+        Fcnew = f(t + h, Ycnew)
+        def y_at(th):
+            th = th[:, np.newaxis]
+            return ((2*th**3 - 3*th**2 + 1)*Yc + (th**3 - 2*th**2 + th)*h*Fc +
+                    (-2*th**3 + 3*th**2)*Ycnew + (th**3 - th**2)*h*Fcnew)
+        theta = locate_root(lambda th: event(t + th*h, y_at(th)), gold[crossed], gnew[crossed])
+        m = inds[crossed]
+        t_events[m] = t + theta*h
+        y_events[m] = y_at(theta)
+        # Only keep the end of the step if it is at the event
+        ys[i+1, m[theta < 1]] = np.nan
+        active[m] = False
+
+    if stats is not None:
+        stats.stop()
+    if event is not None:
+        return ys, t_events, y_events
+    return ys
+
+
+
+def stream_system(f, y0, t0, h, n_steps, method="RK4", chunk_size=10000, stride=1,
+                  stats=None, **kwargs):
+    """
+    Generator that integrates y' = f(t, y) on a uniform grid of times,
+    yielding the solution in fixed-size chunks rather than storing the
+    whole run, so that memory stays O(chunk_size) for any n_steps.
+
+    Parameters
+    ----------
+    f : function
+        Derivative function f(t, y). It must take the time and the
+        state vector and return an array of the same length.
+    y0 : list, np.ndarray
+        Initial state vector y(t0)
+    t0 : float
+        Initial time
+    h : float
+        Step size
+    n_steps : int
+        Number of steps to take, ending at t0 + n_steps*h
+    method (optional) : str
+        One of "euler", "heun", or "RK4"
+    chunk_size (optional) : int
+        Number of samples per yielded chunk
+    stride (optional) : int
+        Only keep every stride-th sample (decimation)
+    stats (optional) : SolverStats
+        If given, record the derivative evaluations, timing, and steps.
+        The time spent by the caller between chunks is not included.
+    kwargs : dict
+        Additional arguments to the step function, e.g., niter for heun
+
+    Yields
+    ------
+    ts : np.ndarray
+        Times of the samples in this chunk
+    ys : np.ndarray
+        Array of shape (len(ts), len(y0)) of y(t) in this chunk
+    """
+    step = STEPS[method]
+    if stats is not None:
+        f = stats.wrap(f)
+        stats.start()
+    y = np.array(y0, dtype=np.float64, ndmin=1)
+    t_buf = np.empty(chunk_size)
+    y_buf = np.empty((chunk_size, len(y)), dtype=y.dtype)
+    t_buf[0] = t0
+    y_buf[0] = y
+    n = 1
+
+    t = t0
+    for i in range(1, n_steps + 1):
+        y = step(f, t, y, h, **kwargs)
+        if stats is not None:
+            stats.record_step(t, h)
+        t = t0 + i*h #avoid accumulating round-off in t
+        if i % stride != 0:
+            continue
+        if n == chunk_size:
+            # Pause the timer while the caller has the chunk
+            if stats is not None:
+                stats.stop()
+            yield t_buf.copy(), y_buf.copy()
+            if stats is not None:
+                stats.start()
+            n = 0
+        t_buf[n] = t
+        y_buf[n] = y
+        n += 1
+    if stats is not None:
+        stats.stop()
+    yield t_buf[:n].copy(), y_buf[:n].copy()
+
+
+def stream_to_npy(filename, f, y0, t0, h, n_steps, method="RK4", chunk_size=10000,
+                  stride=1, **kwargs):
+    """
+    Integrate with stream_system() and write the samples to a .npy file
+    on disk as they are produced. See stream_system() for the parameters.
+
+    The file contains an array of shape (n_steps//stride + 1, 1 + len(y0)),
+    where the first column is the time and the others are y(t).
+
+    Returns
+    -------
+    data : np.memmap
+        The file, memory-mapped read-only
+    """
+    n_dim = len(np.atleast_1d(y0))
+    n_samples = n_steps//stride + 1
+    data = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float64,
+                                     shape=(n_samples, 1 + n_dim))
+    start = 0
+    for ts, ys in stream_system(f, y0, t0, h, n_steps, method=method,
+                                chunk_size=chunk_size, stride=stride, **kwargs):
+        data[start:start+len(ts), 0] = ts
+        data[start:start+len(ts), 1:] = ys
+        start += len(ts)
+    data.flush()
+    del data
+    return np.load(filename, mmap_mode="r")
+
+
+
+# Yoshida (1990) 4th order composition weights for the leapfrog
+YOSHIDA_W1 = 1.0/(2 - 2**(1.0/3))
+YOSHIDA_W0 = -2**(1.0/3)/(2 - 2**(1.0/3))
+
+
+def verlet_step(dxdt, dvdt, x, v, h, a=None):
+    """
+    Single velocity Verlet (kick-drift-kick leapfrog) step of
+    x' = dxdt(v), v' = dvdt(x)
+
+    Parameters
+    ----------
+    dxdt : function
+        Derivative of the positions, dxdt(v)
+    dvdt : function
+        Derivative of the velocities (acceleration), dvdt(x)
+    x : np.ndarray
+        Current positions
+    v : np.ndarray
+        Current velocities
+    h : float
+        Step size
+    a (optional) : np.ndarray
+        dvdt(x), if already known from the end of the previous step
+
+    Returns
+    -------
+    xnew : np.ndarray
+        Positions at t+h
+    vnew : np.ndarray
+        Velocities at t+h
+    anew : np.ndarray
+        dvdt(xnew), to be reused by the next step
+    """
+    if a is None:
+        a = dvdt(x)
+    vhalf = v + 0.5*h*a
+    xnew = x + h*dxdt(vhalf)
+    anew = dvdt(xnew)
+    vnew = vhalf + 0.5*h*anew
+    return xnew, vnew, anew
+
+
+def yoshida_step(dxdt, dvdt, x, v, h, a=None):
+    """
+    Single 4th order Yoshida step, composed of three velocity Verlet
+    steps of sizes w1*h, w0*h, w1*h. Parameters and returned values are
+    as in verlet_step().
+    """
+    x, v, a = verlet_step(dxdt, dvdt, x, v, YOSHIDA_W1*h, a)
+    x, v, a = verlet_step(dxdt, dvdt, x, v, YOSHIDA_W0*h, a)
+    return verlet_step(dxdt, dvdt, x, v, YOSHIDA_W1*h, a)
+
+
+SYMPLECTIC_STEPS = {"verlet": verlet_step, "yoshida": yoshida_step}
+
+
+def symplectic_system(ts, dxdt, dvdt, x0, v0, method="verlet", diagnostics=None, stats=None):
+    """
+    Symplectic integration of a separable system
+    x' = dxdt(v)
+    v' = dvdt(x)
+    e.g., orbits, where dxdt(v) = v and dvdt(x) is the acceleration.
+    These methods do not have a secular drift in the energy, so long
+    integrations can use larger steps than with the non-symplectic
+    methods above. The acceleration at the end of each step is reused
+    at the start of the next.
+
+    Parameters
+    ----------
+    ts : list, np.ndarray
+        Times to solve the functions at, preferably uniformly spaced,
+        since changing the step size breaks the symplectic property
+    dxdt : function
+        Derivative of the positions, dxdt(v), returning an array the
+        shape of v
+    dvdt : function
+        Derivative of the velocities, dvdt(x), returning an array the
+        shape of x
+    x0 : list, np.ndarray
+        Initial positions, a vector of any length
+    v0 : list, np.ndarray
+        Initial velocities, a vector of any length
+    method (optional) : str
+        "verlet" (2nd order) or "yoshida" (4th order)
+    diagnostics (optional) : function
+        Function diagnostics(t, x, v) returning a float or an array, e.g.,
+        the total energy and momentum, evaluated at each of ts
+    stats (optional) : SolverStats
+        If given, record the evaluations of dxdt and dvdt, timing, and
+        steps. The diagnostics are not counted as evaluations.
+
+    Returns
+    -------
+    xs : np.ndarray
+        Array of shape (len(ts), len(x0)) of x(t)
+    vs : np.ndarray
+        Array of shape (len(ts), len(v0)) of v(t)
+    diags : np.ndarray
+        Only if diagnostics is given. Array of the diagnostics at
+        each of ts, with shape (len(ts),) + the shape of its output.
+    """
+    step = SYMPLECTIC_STEPS[method]
+    if stats is not None:
+        # SolverStats wraps functions of (t, y), and these take only one
+        dxdt_wrapped = stats.wrap(lambda t, v, dxdt=dxdt: dxdt(v))
+        dvdt_wrapped = stats.wrap(lambda t, x, dvdt=dvdt: dvdt(x))
+        dxdt = lambda v: dxdt_wrapped(None, v)
+        dvdt = lambda x: dvdt_wrapped(None, x)
+        stats.start()
+    xs = make_output(ts, x0)
+    vs = make_output(ts, v0)
+    if diagnostics is not None:
+        diag0 = np.asarray(diagnostics(ts[0], xs[0], vs[0]), dtype=np.float64)
+        diags = np.empty((len(ts),) + diag0.shape)
+        diags[0] = diag0
+
+    a = None
+    for i in range(len(ts) - 1):
+        h = ts[i+1] - ts[i]
+        xs[i+1], vs[i+1], a = step(dxdt, dvdt, xs[i], vs[i], h, a)
+        if stats is not None:
+            stats.record_step(ts[i], h)
+        if diagnostics is not None:
+            diags[i+1] = diagnostics(ts[i+1], xs[i+1], vs[i+1])
+
+    if stats is not None:
+        stats.stop()
+    if diagnostics is not None:
+        return xs, vs, diags
+    return xs, vs
+
+
+
+def numerical_jacobian(f, t, y, f0=None, eps=None):
+    """
+    Forward-difference approximation of the Jacobian df_i/dy_j
+
+    Parameters
+    ----------
+    f : function
+        Derivative function f(t, y)
+    t : float
+        Time
+    y : np.ndarray
+        State vector
+    f0 (optional) : np.ndarray
+        f(t, y), if already known
+    eps (optional) : float
+        Relative perturbation, defaults to sqrt of machine precision
+
+    Returns
+    -------
+    J : np.ndarray
+        Array of shape (len(y), len(y))
+    """
+    if f0 is None:
+        f0 = f(t, y)
+    if eps is None:
+        eps = np.sqrt(np.finfo(np.float64).eps)
+    J = np.empty((len(y), len(y)))
+    for j in range(len(y)):
+        dy = eps*max(abs(y[j]), 1.0)
+        yp = y.copy()
+        yp[j] += dy
+        J[:, j] = (f(t, yp) - f0)/dy
+    return J
+
+
+class NewtonMatrix:
+    """
+    LU factorization of the Newton iteration matrix I - gamma*J for the
+    implicit solvers, using the Matrix class from HW2. The factorization
+    is kept and reused until refactor() is called.
+
+    Parameters
+    ----------
+    J : np.ndarray
+        Jacobian df_i/dy_j
+    gamma : float
+        Coefficient on the Jacobian, e.g., the step size for backward Euler
+    """
+    def __init__(self, J, gamma):
+        # HW2 is only needed by the implicit solvers, so import it here
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../HW2/")
+        if path not in sys.path:
+            sys.path.append(path)
+        from matrix import Matrix
+        self.Matrix = Matrix
+        self.nfactor = 0
+        self.refactor(J, gamma)
+
+
+    def refactor(self, J, gamma):
+        """ Form and factor I - gamma*J """
+        self.J = J
+        self.gamma = gamma
+        self.matrix = self.Matrix((np.eye(len(J)) - gamma*J).tolist())
+        self.matrix.decomposeLU()
+        self.nfactor += 1
+
+
+    def solve(self, b):
+        """ Solve (I - gamma*J) x = b for x, returning an np.ndarray """
+        x = self.matrix.solve_linear_system(self.Matrix([[value] for value in b]))
+        return np.array(x.data)
+
+
+
+def BDF_system(ts, f, y0, jac=None, order=2, rtol=1e-8, atol=1e-12, max_newton=8,
+               stats=None, full_output=False):
+    """
+    Implicit backward differentiation formula (BDF) method for solving
+    stiff systems of ODEs
+    y' = f(t, y)
+
+    order=1 is backward Euler, order=2 is the (variable step) BDF2 method,
+    started with a backward Euler step. Both are stable for any step size
+    on decaying problems, so the step size in ts only needs to be chosen
+    for accuracy. This is a fixed-step solver: it steps exactly between
+    the times in ts, with no estimate of the local truncation error and
+    no step size control, and rtol and atol only set the convergence of
+    the Newton iteration. Check the accuracy by, e.g., comparing against
+    a solution with half of the step size.
+
+    Each step is solved with a simplified Newton iteration, where the
+    matrix I - gamma*J is LU-factored with HW2's Matrix class and reused
+    across iterations and steps. The Jacobian is re-evaluated when the
+    step size changes or the iteration fails to converge, and the matrix
+    is refactored then or when gamma changes, e.g., from the backward
+    Euler start to BDF2.
+
+    Parameters
+    ----------
+    ts : list, np.ndarray
+        Times to solve the functions y(t) at
+    f : function
+        Derivative function f(t, y). It must take the time and the
+        state vector and return an array of the same length.
+    y0 : list, np.ndarray
+        Initial state vector y(ts[0])
+    jac (optional) : function
+        Jacobian function jac(t, y) returning an array of shape
+        (len(y0), len(y0)). If None, it is found by finite differences.
+    order (optional) : int
+        1 or 2
+    rtol (optional) : float
+        Relative tolerance on the Newton iteration, not on the error of
+        the solution
+    atol (optional) : float, np.ndarray
+        Absolute tolerance on the Newton iteration, as for rtol
+    max_newton (optional) : int
+        Maximum number of Newton iterations per step before refactoring
+    stats (optional) : SolverStats
+        If given, record the derivative evaluations, timing, and steps
+    full_output (optional) : bool
+        If True, also return a dictionary of information
+
+    Returns
+    -------
+    ys : np.ndarray
+        Array of shape (len(ts), len(y0)) of y(t)
+    info : dict
+        Only if full_output is True. Contains the number of derivative
+        evaluations "nfev", Jacobian evaluations "njev", LU
+        factorizations "nlu", and Newton iterations "nnewton".
+    """
+    if order not in (1, 2):
+        raise ValueError("order must be 1 or 2")
+    if stats is not None:
+        f = stats.wrap(f)
+        stats.start()
+    ts = np.asarray(ts, dtype=np.float64)
+    ys = make_output(ts, y0)
+    counts = {"nfev": 0, "njev": 0, "nlu": 0, "nnewton": 0}
+
+    def jacobian(t, y):
+        counts["njev"] += 1
+        if jac is not None:
+            return np.asarray(jac(t, y), dtype=np.float64)
+        counts["nfev"] += len(y) + 1
+        return numerical_jacobian(f, t, y)
+
+    newton = None
+    for i in range(len(ts) - 1):
+        t = ts[i]
+        h = ts[i+1] - t
+        # Write the step as y = c + gamma*f(t+h, y)
+        if order == 1 or i == 0:
+            c = ys[i]
+            gamma = h
+        else:
+            omega = h/(t - ts[i-1])
+            denom = 1 + 2*omega
+            c = ((1 + omega)**2*ys[i] - omega**2*ys[i-1])/denom
+            gamma = h*(1 + omega)/denom
+
+        if newton is None:
+            newton = NewtonMatrix(jacobian(t, ys[i]), gamma)
+        elif not np.isclose(h, ts[i] - ts[i-1], rtol=1e-12, atol=0):
+            # A new step size, so the state has moved on by a different
+            # amount than the Jacobian was last evaluated for
+            newton.refactor(jacobian(t, ys[i]), gamma)
+        elif not np.isclose(gamma, newton.gamma, rtol=1e-12, atol=0):
+            newton.refactor(newton.J, gamma)
+
+        y = ys[i].copy() #initial guess
+        for attempt in range(2):
+            converged = False
+            for k in range(max_newton):
+                residual = c + gamma*f(t + h, y) - y
+                counts["nfev"] += 1
+                counts["nnewton"] += 1
+                dy = newton.solve(residual)
+                y = y + dy
+                scale = atol + rtol*np.abs(y)
+                if np.all(np.abs(dy) <= scale):
+                    converged = True
+                    break
+            if converged:
+                break
+            # Slow convergence, so update the Jacobian and try again
+            y = ys[i].copy()
+            newton.refactor(jacobian(t, ys[i]), gamma)
+        if not converged:
+            raise RuntimeError("Newton iteration did not converge at t = %e"%t)
+        ys[i+1] = y
+        if stats is not None:
+            stats.record_step(t, h)
+
+    if stats is not None:
+        stats.stop()
+    if full_output:
+        counts["nlu"] = 0 if newton is None else newton.nfactor
+        return ys, counts
+    return ys
+
+
+
+def pack_equations(dyAdt, yA0, dyBdt=None, yB0=None):
+    """
+    Convert the one- or two-equation form into a vector form
+
+    Returns
+    -------
+    f : function
+        Vector derivative function f(t, y)
+    y0 : np.ndarray
+        Initial state vector
+    two_eqns : bool
+        Whether dyBdt and yB0 were both given
+    """
+    if dyBdt is not None and yB0 is not None:
+        f = lambda t, y: np.array([dyAdt(t, y[0], y[1]), dyBdt(t, y[0], y[1])])
+        return f, np.array([yA0, yB0], dtype=np.float64), True
+    f = lambda t, y: np.array([dyAdt(t, y[0])])
+    return f, np.array([yA0], dtype=np.float64), False
+
+
+def pack_events(events, two_eqns):
+    """
+    Convert event function(s) g(t, y_A) or g(t, y_A, y_B) into
+    the vector form g(t, y), keeping the terminal and direction attributes
+    """
+    if callable(events):
+        events = [events]
+    packed = list()
+    for event in events:
+        if two_eqns:
+            g = lambda t, y, event=event: event(t, y[0], y[1])
+        else:
+            g = lambda t, y, event=event: event(t, y[0])
+        g.terminal = getattr(event, "terminal", False)
+        g.direction = getattr(event, "direction", 0)
+        packed.append(g)
+    return packed
+
+
+def unpack_output(retval, two_eqns):
+    """
+    Convert the vector output back into the yAs (and yBs) timeseries
+    Any additional outputs (e.g., from events) are passed along afterward.
+    """
+    extra = tuple()
+    if isinstance(retval, tuple):
+        retval, extra = retval[0], retval[1:]
+    if two_eqns:
+        output = (retval[:, 0], retval[:, 1]) + extra
+    else:
+        output = (retval[:, 0],) + extra
+    if len(output) == 1:
+        return output[0]
+    return output
+
+
+
+def euler(ts, dyAdt, yA0, dyBdt=None, yB0=None, events=None, stats=None):
     """
     Forward Euler method for solving ODEs of the form
     y' = f(t, y)
@@ -43,6 +1372,11 @@ def euler(ts, dyAdt, yA0, dyBdt=None, yB0=None):
         t, y_A, and y_B, in that order.
     yB0 (optional) : float
         Initial value for y_B(0) = y_{B,0}
+    events (optional) : function, list
+        Event function(s) g(t, y_A), or g(t, y_A, y_B) if two equations
+        are given, to locate the zeros of. See EventTracker.
+    stats (optional) : SolverStats
+        If given, record the derivative evaluations, timing, and steps
 
 
     Returns
@@ -52,32 +1386,21 @@ def euler(ts, dyAdt, yA0, dyBdt=None, yB0=None):
     yBs : np.ndarray
         If dyBdt and yB0 are not None, then this will also return
         the timeseries of y_b(t)
+    t_events : list
+        Only if events is given. For each event, the times it occurred.
+    y_events : list
+        Only if events is given. For each event, the state vectors
+        [y_A, y_B] at those times.
     """
 
-    # Set up return array(s)
-    yAs = np.zeros_like(ts)
-    yAs[0] = yA0
-    two_eqns = False #easier to read flag for whether we have two equations or not
-    if dyBdt is not None and yB0 is not None:
-        two_eqns = True
-        yBs = np.zeros_like(ts)
-        yBs[0] = yB0
+    f, y0, two_eqns = pack_equations(dyAdt, yA0, dyBdt, yB0)
+    if events is not None:
+        events = pack_events(events, two_eqns)
+    return unpack_output(euler_system(ts, f, y0, events=events, stats=stats), two_eqns)
 
-    for i, t in enumerate(ts[:-1]): #do not go to the last timestep
-        h = ts[i+1] - t
-        if two_eqns:
-            yAs[i+1] = yAs[i] + h*dyAdt(t, yAs[i], yBs[i])
-            yBs[i+1] = yBs[i] + h*dyBdt(t, yAs[i], yBs[i])
-        else:
-            yAs[i+1] = yAs[i] + h*dyAdt(t, yAs[i])
 
-    if two_eqns:
-        return yAs, yBs
-    else:
-        return yAs
-
-
-def heun(ts, dyAdt, yA0, dyBdt=None, yB0=None, niter=10):
+def heun(ts, dyAdt, yA0, dyBdt=None, yB0=None, niter=10, rtol=1e-9, atol=0.0,
+         events=None, stats=None, full_output=False):
     """
     Heun's method for solving ODEs of the form
     y' = f(t, y)
@@ -87,8 +1410,8 @@ def heun(ts, dyAdt, yA0, dyBdt=None, yB0=None, niter=10):
     y_B' = f_B(t, y_A, y_B)
     as denoted in class.
 
-    The Picard iterations work on a fixed number, rather
-    than some threshold.
+    The Picard iterations stop when successive iterates agree to
+    within the tolerances, or after niter iterations.
 
     Parameters
     ----------
@@ -106,7 +1429,18 @@ def heun(ts, dyAdt, yA0, dyBdt=None, yB0=None, niter=10):
     yB0 (optional) : float
         Initial value for y_B(0) = y_{B,0}
     niter (optional) : int
-        Number of Picard iterations/corrector steps to perform.
+        Maximum number of Picard iterations/corrector steps to perform.
+    rtol (optional) : float
+        Relative tolerance between successive Picard iterates
+    atol (optional) : float
+        Absolute tolerance between successive Picard iterates
+    events (optional) : function, list
+        Event function(s) g(t, y_A), or g(t, y_A, y_B) if two equations
+        are given, to locate the zeros of. See EventTracker.
+    stats (optional) : SolverStats
+        If given, record the derivative evaluations, timing, and steps
+    full_output (optional) : bool
+        If True, also return a dictionary of information, see heun_system()
 
 
     Returns
@@ -116,46 +1450,24 @@ def heun(ts, dyAdt, yA0, dyBdt=None, yB0=None, niter=10):
     yBs : np.ndarray
         If dyBdt and yB0 are not None, then this will also return
         the timeseries of y_b(t)
+    t_events : list
+        Only if events is given. For each event, the times it occurred.
+    y_events : list
+        Only if events is given. For each event, the state vectors
+        [y_A, y_B] at those times.
+    info : dict
+        Only if full_output is True, see heun_system()
     """
 
-    # Set up return array(s)
-    yAs = np.zeros_like(ts)
-    yAs[0] = yA0
-    two_eqns = False #easier to read flag for whether we have two equations or not
-    if dyBdt is not None and yB0 is not None:
-        two_eqns = True
-        yBs = np.zeros_like(ts)
-        yBs[0] = yB0
-
-    for i, t in enumerate(ts[:-1]): #do not go to the last timestep
-        h = ts[i+1] - t
-        if two_eqns:
-            f_A_i = dyAdt(t, yAs[i], yBs[i])
-            f_B_i = dyBdt(t, yAs[i], yBs[i])
-            yAs[i+1] = yAs[i] + h*f_A_i
-            yBs[i+1] = yBs[i] + h*f_B_i
-            # Now perform Picard iteration
-            for k in range(niter):
-                # At the i+1 time step, replace the next k+1
-                # iteration with the previous.
-                yAs[i+1] = yAs[i] + 0.5*h*(f_A_i + dyAdt(t, yAs[i+1], yBs[i+1]))
-                yBs[i+1] = yBs[i] + 0.5*h*(f_B_i + dyBdt(t, yAs[i+1], yBs[i+1]))
-        else:
-            f_i = dyAdt(t, yAs[i])
-            yAs[i+1] = yAs[i] + h*f_i
-            # Now perform Picard iteration
-            for k in range(niter):
-                # At the i+1 time step, replace the next k+1
-                # iteration with the previous.
-                yAs[i+1] = yAs[i] + 0.5*h*(f_i + dyAdt(t, yAs[i+1]))
-
-    if two_eqns:
-        return yAs, yBs
-    else:
-        return yAs
+    f, y0, two_eqns = pack_equations(dyAdt, yA0, dyBdt, yB0)
+    if events is not None:
+        events = pack_events(events, two_eqns)
+    return unpack_output(heun_system(ts, f, y0, niter=niter, rtol=rtol, atol=atol,
+                                     events=events, stats=stats, full_output=full_output),
+                         two_eqns)
 
 
-def RK4(ts, dyAdt, yA0, dyBdt=None, yB0=None):
+def RK4(ts, dyAdt, yA0, dyBdt=None, yB0=None, events=None, stats=None):
     """
     Classical Runge-Kutta method for solving ODEs of the form
     y' = f(t, y)
@@ -180,6 +1492,11 @@ def RK4(ts, dyAdt, yA0, dyBdt=None, yB0=None):
         t, y_A, and y_B, in that order.
     yB0 (optional) : float
         Initial value for y_B(0) = y_{B,0}
+    events (optional) : function, list
+        Event function(s) g(t, y_A), or g(t, y_A, y_B) if two equations
+        are given, to locate the zeros of. See EventTracker.
+    stats (optional) : SolverStats
+        If given, record the derivative evaluations, timing, and steps
 
 
     Returns
@@ -189,41 +1506,75 @@ def RK4(ts, dyAdt, yA0, dyBdt=None, yB0=None):
     yBs : np.ndarray
         If dyBdt and yB0 are not None, then this will also return
         the timeseries of y_b(t)
+    t_events : list
+        Only if events is given. For each event, the times it occurred.
+    y_events : list
+        Only if events is given. For each event, the state vectors
+        [y_A, y_B] at those times.
     """
 
-    # Set up return array(s)
-    yAs = np.zeros_like(ts)
-    yAs[0] = yA0
-    two_eqns = False #easier to read flag for whether we have two equations or not
-    if dyBdt is not None and yB0 is not None:
-        two_eqns = True
-        yBs = np.zeros_like(ts)
-        yBs[0] = yB0
+    f, y0, two_eqns = pack_equations(dyAdt, yA0, dyBdt, yB0)
+    if events is not None:
+        events = pack_events(events, two_eqns)
+    return unpack_output(RK4_system(ts, f, y0, events=events, stats=stats), two_eqns)
 
-    for i, t in enumerate(ts[:-1]): #do not go to the last timestep
-        h = ts[i+1] - t
-        if two_eqns:
-            # Evaluate each set of k values one after another
-            # for both y_A and y_B
-            kA1 = h*dyAdt(t, yAs[i], yBs[i])
-            kB1 = h*dyBdt(t, yAs[i], yBs[i])
-            kA2 = h*dyAdt(t + h/2.0, yAs[i] + kA1/2.0, yBs[i] + kB1/2.0)
-            kB2 = h*dyBdt(t + h/2.0, yAs[i] + kA1/2.0, yBs[i] + kB1/2.0)
-            kA3 = h*dyAdt(t + h/2.0, yAs[i] + kA2/2.0, yBs[i] + kB2/2.0)
-            kB3 = h*dyBdt(t + h/2.0, yAs[i] + kA2/2.0, yBs[i] + kB2/2.0)
-            kA4 = h*dyAdt(t + h, yAs[i] + kA3, yBs[i] + kB3)
-            kB4 = h*dyBdt(t + h, yAs[i] + kA3, yBs[i] + kB3)
-            yAs[i+1] = yAs[i] + (kA1 + 2*kA2 + 2*kA3 + kA4)/6.0
-            yBs[i+1] = yBs[i] + (kB1 + 2*kB2 + 2*kB3 + kB4)/6.0
 
-        else:
-            k1 = h*dyAdt(t, yAs[i])
-            k2 = h*dyAdt(t + h/2.0, yAs[i] + k1/2.0)
-            k3 = h*dyAdt(t + h/2.0, yAs[i] + k2/2.0)
-            k4 = h*dyAdt(t + h, yAs[i] + k3)
-            yAs[i+1] = yAs[i] + (k1 + 2*k2 + 2*k3 + k4)/6.0
+def RK45(ts, dyAdt, yA0, dyBdt=None, yB0=None, rtol=1e-6, atol=1e-9, events=None,
+         stats=None):
+    """
+    Adaptive Dormand-Prince method for solving ODEs of the form
+    y' = f(t, y)
+    dyBdt and yB0 are given, then it will solve a set
+    of coupled ODEs of the form
+    y_A' = f_A(t, y_A, y_B)
+    y_B' = f_B(t, y_A, y_B)
+    as denoted in class.
 
-    if two_eqns:
-        return yAs, yBs
-    else:
-        return yAs
+    The internal step sizes are chosen automatically, see RK45_system(),
+    and ts are only the times at which the solution is reported.
+
+    Parameters
+    ----------
+    ts : list, np.ndarray
+        Times to solve the functions y(t) at
+    dyAdt : function
+        Derivative function of y_A. It must take two arguments, t and y_A,
+        unless the y_B options are given below, in which case it must
+        take three: t, y_A, and y_B, in that order.
+    yA0 : float
+        Initial value for y_A(0) = y_{A,0}
+    dyBdt (optional) : function
+        Derivative function of y_B. It must take three arguments:
+        t, y_A, and y_B, in that order.
+    yB0 (optional) : float
+        Initial value for y_B(0) = y_{B,0}
+    rtol (optional) : float
+        Relative tolerance of the local error
+    atol (optional) : float
+        Absolute tolerance of the local error
+    events (optional) : function, list
+        Event function(s) g(t, y_A), or g(t, y_A, y_B) if two equations
+        are given, to locate the zeros of. See EventTracker.
+    stats (optional) : SolverStats
+        If given, record the derivative evaluations, timing, and steps
+
+
+    Returns
+    -------
+    yAs : np.ndarray
+        Timeseries of y_A(t)
+    yBs : np.ndarray
+        If dyBdt and yB0 are not None, then this will also return
+        the timeseries of y_b(t)
+    t_events : list
+        Only if events is given. For each event, the times it occurred.
+    y_events : list
+        Only if events is given. For each event, the state vectors
+        [y_A, y_B] at those times.
+    """
+
+    f, y0, two_eqns = pack_equations(dyAdt, yA0, dyBdt, yB0)
+    if events is not None:
+        events = pack_events(events, two_eqns)
+    return unpack_output(RK45_system(ts, f, y0, rtol=rtol, atol=atol, events=events,
+                                     stats=stats), two_eqns)
@@ -0,0 +1,177 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Runner for parameter sweeps of independent ODE integrations,
+e.g., a grid of central densities and equations of state.
+Each integration is sent to a process pool, and the results are
+written to a CSV table on disk as each one finishes, so that a
+sweep that is interrupted can be resumed where it left off. On resuming,
+the parameters recorded in the table must match those given, and rows
+that were only partly written are run again.
+
+The function to run must be defined at the top level of a module
+(so that it can be pickled), take the parameters as keyword arguments,
+and return a dictionary of results, e.g.,
+
+def white_dwarf(rho_c, mu_e):
+    ...
+    return {"M": M, "R": R}
+
+results = run_sweep(white_dwarf, [{"rho_c": rho_c, "mu_e": 2} for rho_c in rho_cs],
+                    "white_dwarfs.csv")
+"""
+
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+
+def read_table(filename):
+    """
+    Read a results table written by run_sweep()
+
+    Parameters
+    ----------
+    filename : str
+        Path to the CSV file
+
+    Returns
+    -------
+    rows : dict
+        Dictionary keyed by the parameter index, each containing a
+        dictionary of the parameters and results as floats where possible.
+        Rows with missing or extra columns, e.g., from an interrupted
+        write, are left out.
+    """
+    rows = dict()
+    if not os.path.exists(filename):
+        return rows
+    with open(filename, newline="") as infile:
+        for row in csv.DictReader(infile):
+            if None in row or None in row.values():
+                continue
+            rows[int(row.pop("index"))] = {key: _to_value(value) for key, value in row.items()}
+    return rows
+
+
+def _truncate_partial_row(filename):
+    """
+    Cut off a last line without a newline, written by an interrupted
+    run, so that appended rows start on a line of their own
+    """
+    if not os.path.exists(filename):
+        return
+    with open(filename, "rb+") as infile:
+        data = infile.read()
+        if data and not data.endswith(b"\n"):
+            infile.truncate(data.rfind(b"\n") + 1)
+
+
+def _to_value(string):
+    """ Convert a table entry back into a float if possible """
+    try:
+        return float(string)
+    except ValueError:
+        return string
+
+
+def run_sweep(func, params, filename, processes=None, max_pending=None):
+    """
+    Run func(**param) for every param in params on a process pool
+
+    Parameters
+    ----------
+    func : function
+        Top-level function taking the parameters as keyword arguments
+        and returning a dictionary of results
+    params : list
+        List of dictionaries of parameters. The position in the list
+        is used as the index of each run in the table.
+    filename : str
+        Path to the CSV results table, with a row for each run in
+        the order they finish. If it already exists, runs
+        that have already been recorded are skipped, after checking
+        that their parameters match, and incomplete rows are run again.
+    processes (optional) : int
+        Number of worker processes, defaults to the number of CPUs
+    max_pending (optional) : int
+        Maximum number of runs submitted to the pool at once, which
+        bounds the memory used by the work queue. Defaults to twice
+        the number of processes.
+
+    Returns
+    -------
+    results : list
+        List of dictionaries of the parameters and results, in the
+        same order as params
+
+    Raises
+    ------
+    ValueError
+        If the table records different parameters for an index, its
+        columns do not match the results, or the names of the results
+        overlap with those of the parameters
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2*processes
+
+    _truncate_partial_row(filename)
+    done = read_table(filename)
+    for i, row in done.items():
+        if i >= len(params):
+            continue
+        # The table stores the parameters as text, so compare them as read back
+        stored = {key: row.get(key) for key in params[i]}
+        if stored != {key: _to_value(str(value)) for key, value in params[i].items()}:
+            raise ValueError("Parameters %s of run %i in %s do not match %s"%
+                             (stored, i, filename, params[i]))
+    todo = [i for i in range(len(params)) if i not in done]
+
+    fieldnames = None
+    if done:
+        with open(filename, newline="") as infile:
+            fieldnames = next(csv.reader(infile))
+
+    with ProcessPoolExecutor(max_workers=processes) as executor, \
+         open(filename, "a", newline="") as outfile:
+        writer = None
+        pending = dict()
+        todo = iter(todo)
+        while True:
+            # Keep the work queue topped up, but bounded
+            for i in todo:
+                pending[executor.submit(func, **params[i])] = i
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+
+            # Write the finished runs in order of index, although the
+            # table as a whole is in order of completion
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(finished, key=pending.get):
+                i = pending.pop(future)
+                result = future.result()
+                overlap = set(result) & (set(params[i]) | {"index"})
+                if overlap:
+                    raise ValueError("Results %s have the same names as parameters"%
+                                     sorted(overlap))
+                row = dict(index=i, **params[i])
+                row.update(result)
+                if writer is None:
+                    if fieldnames is None:
+                        fieldnames = list(row.keys())
+                    elif set(fieldnames) != set(row.keys()):
+                        raise ValueError("Columns %s do not match the existing table %s"%
+                                         (list(row.keys()), fieldnames))
+                    writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+                    if outfile.tell() == 0:
+                        writer.writeheader()
+                writer.writerow(row)
+                outfile.flush() #so that the row survives an interruption
+
+    rows = read_table(filename)
+    return [rows[i] for i in range(len(params))]
@@ -0,0 +1,96 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Unit tests for the A_ul coefficient reader
+"""
+
+import unittest
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+sys.path.append("../") #lazy but it works
+import numpy as np
+import astropy.units as un
+from coefficients_reader import read_coefficients, read_coefficients_array
+
+FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../A_coefficients.dat")
+
+
+
+class TestCoefficientsReader(unittest.TestCase):
+    """ Unit tester for coefficients_reader.py """
+
+    def setUp(self):
+        """ Work on a copy so that the cache is written to a temporary directory """
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "A_coefficients.dat")
+        shutil.copy(FILENAME, self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_array(self):
+        """ Test that the dense array matches the dictionary """
+        Adict = read_coefficients(self.filename)
+        A = read_coefficients_array(self.filename)
+        self.assertEqual(A.shape, (10, 10))
+        self.assertEqual(A.unit, 1/un.s)
+        for (l, u), A_ul in Adict.items():
+            self.assertEqual(A[l, u], A_ul)
+        self.assertEqual(np.count_nonzero(A.value), len(Adict))
+        self.assertTrue(np.all(np.tril(A.value) == 0)) #only lower < upper
+        self.assertAlmostEqual(read_coefficients_array(self.filename, units=False)[3, 6],
+                               777957.7)
+
+    def test_cache(self):
+        """ Test that the cache is written, used, and invalidated by the mtime """
+        cachename = os.path.join(self.directory, "A_coefficients.npz")
+        A = read_coefficients_array(self.filename, units=False)
+        self.assertTrue(os.path.exists(cachename))
+
+        # Edit the cache: it is used as long as the text file is unchanged
+        with np.load(cachename) as data:
+            cached = dict(data)
+        cached["A_ul"] = 2*cached["A_ul"]
+        np.savez(cachename, **cached)
+        self.assertTrue(np.array_equal(read_coefficients_array(self.filename, units=False), 2*A))
+        self.assertTrue(np.array_equal(read_coefficients_array(self.filename, units=False,
+                                                               cache=False), A))
+
+        # Touching the text file invalidates the cache
+        mtime = os.path.getmtime(self.filename)
+        os.utime(self.filename, (mtime + 10, mtime + 10))
+        self.assertTrue(np.array_equal(read_coefficients_array(self.filename, units=False), A))
+
+    def test_corrupt_cache(self):
+        """ Test that a partially written cache is rebuilt """
+        cachename = os.path.join(self.directory, "A_coefficients.npz")
+        A = read_coefficients_array(self.filename, units=False)
+        with open(cachename, "rb") as infile:
+            contents = infile.read()
+        for partial in [contents[:len(contents)//2], b""]:
+            with open(cachename, "wb") as outfile:
+                outfile.write(partial)
+            self.assertTrue(np.array_equal(read_coefficients_array(self.filename, units=False), A))
+            with np.load(cachename) as data: #rewritten whole
+                self.assertTrue(np.array_equal(data["A_ul"], A[data["l"], data["u"]]))
+        # No temporary files are left behind
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ["A_coefficients.dat", "A_coefficients.npz"])
+
+    def test_lazy_import(self):
+        """ Test that astropy is only imported when units are requested """
+        code = ("import sys; from coefficients_reader import read_coefficients_array; "
+                "A = read_coefficients_array(%r, units=False, cache=False); "
+                "print('astropy' in sys.modules)"%self.filename)
+        output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(FILENAME),
+                                check=True, capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), "False")
+
+
+
+if __name__ == '__main__':
+    unittest.main()
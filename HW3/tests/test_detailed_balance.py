@@ -0,0 +1,94 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Unit tests for the vectorized detailed-balance level populations
+"""
+
+import unittest
+import os
+import sys
+sys.path.append("../") #lazy but it works
+import numpy as np
+import astropy.units as un
+from astropy import constants as const
+from coefficients_reader import read_coefficients
+from detailed_balance import rate_matrices, level_populations
+
+FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../A_coefficients.dat")
+
+
+# The notebook versions, with units
+def calc_transition_freq(l, u):
+    E_l = -13.6*un.eV/l**2
+    E_u = -13.6*un.eV/u**2
+    return (abs(E_u - E_l)/const.h).to(un.Hz)
+
+def calc_B_ul(Adict, l, u):
+    nu = calc_transition_freq(l, u)
+    return (Adict[(l, u)]*const.c**2/(2*const.h * nu**3)).decompose()
+
+def calc_B_lu(Adict, l, u):
+    return (calc_B_ul(Adict, l, u)*(2*u**2)/(2*l**2)).decompose()
+
+def calc_J(nu, T):
+    return ((2*const.h*nu**3/const.c**2)/(np.exp((const.h*nu)/(const.k_B*T))-1)).decompose()
+
+def make_M(Adict, T):
+    M = np.zeros((9, 9))
+    for i in range(1, 10):
+        for j in range(1, 10):
+            if i == j:
+                for u in range(i+1, 10):
+                    nu = calc_transition_freq(i, u)
+                    M[i-1, j-1] += (calc_B_lu(Adict, i, u)*calc_J(nu, T)).value
+                for l in range(1, i):
+                    nu = calc_transition_freq(l, i)
+                    M[i-1, j-1] += (calc_B_ul(Adict, l, i)*calc_J(nu, T)).value
+                    M[i-1, j-1] += Adict[(l, i)].value
+            elif i < j:
+                nu = calc_transition_freq(i, j)
+                M[i-1, j-1] += -(Adict[(i, j)] + calc_B_ul(Adict, i, j)*calc_J(nu, T)).value
+            else:
+                nu = calc_transition_freq(j, i)
+                M[i-1, j-1] += -(calc_B_lu(Adict, j, i)*calc_J(nu, T)).value
+    return M
+
+
+
+class TestDetailedBalance(unittest.TestCase):
+    """ Unit tester for detailed_balance.py """
+
+    def test_rate_matrices(self):
+        """ Test against the notebook's make_M() """
+        Adict = read_coefficients(FILENAME)
+        Ts = np.array([5000.0, 20000.0])
+        M = rate_matrices(Ts*un.K)
+        self.assertEqual(M.shape, (2, 9, 9))
+        for i, T in enumerate(Ts):
+            self.assertTrue(np.allclose(M[i], make_M(Adict, T*un.K), rtol=1e-6))
+        # Columns sum to zero, i.e., the total density is conserved
+        self.assertTrue(np.allclose(M.sum(axis=-2), 0, atol=1e-6*np.abs(M).max()))
+
+    def test_level_populations(self):
+        """ Test the normalization, equilibrium, and arbitrary level counts """
+        Ts = np.logspace(3, 7, 30)
+        n = level_populations(Ts)
+        self.assertEqual(n.shape, (30, 9))
+        self.assertTrue(np.allclose(n.sum(axis=-1), 1))
+        M = rate_matrices(Ts)
+        rates = np.einsum("...ij,...j->...i", M, n)
+        self.assertTrue(np.all(np.abs(rates) < 1e-8*np.abs(M).max(axis=(-1, -2))[:, None]))
+        # Cold gas is in the ground state
+        self.assertAlmostEqual(n[0, 0], 1.0)
+
+        # Two levels: n_2/n_1 = B_lu J/(A + B_ul J)
+        n2 = level_populations(20000.0, n_levels=2)
+        M2 = rate_matrices(20000.0, n_levels=2)
+        self.assertEqual(n2.shape, (2,))
+        self.assertAlmostEqual(n2[1]/n2[0], -M2[1, 0]/M2[1, 1])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,7 +10,7 @@ import unittest
 import sys
 sys.path.append("../../HW2/") #lazy but it works
 import numpy as np
-from matrix import Matrix
+from matrix import Matrix, make_matrix
 
 
 
@@ -100,6 +100,22 @@ class TestMatrixClass(unittest.TestCase):
         self.assertTrue(MU.is_upper_triangular())
 
 
+    def test_transpose_view(self):
+        """ Test that the transpose shares the buffer of the original """
+        A = np.random.rand(5, 4)
+        MA = to_matrix(A)
+        MT = MA.transpose()
+        self.assertIs(MT.data, MA.data)
+        MT[3, 1] = 7.0
+        self.assertEqual(MA[1, 3], 7.0)
+        self.assertEqual(MT.transpose(), MA)
+        self.assertEqual(MT*MA, to_matrix(np.array(MT.array) @ np.array(MA.array)))
+        # A copy of the transpose is independent
+        MC = MA.transpose().copy()
+        MC[3, 1] = 8.0
+        self.assertEqual(MA[1, 3], 7.0)
+
+
     # Other tests:
 
 
@@ -111,6 +127,15 @@ class TestMatrixClass(unittest.TestCase):
         # https://ongspxm.github.io/blog/2016/11/assertraises-testing-for-errors-in-unittest/
         self.assertRaises(IndexError, lambda: MA.check_square())
 
+    def test_memory_layout(self):
+        """ Test the flat buffer storage and lack of __dict__ """
+        MA = make_matrix(3, 4, value=2)
+        self.assertEqual(MA.data.itemsize, 8)
+        self.assertEqual(len(MA.data), 12)
+        self.assertFalse(hasattr(MA, "__dict__"))
+        self.assertEqual(MA.array, [[2.0]*4]*3)
+        self.assertRaises(IndexError, lambda: Matrix([[1, 2], [3]]))
+
     def test_triangular_checks(self):
         """ Test boolean checks for triangular matrices """
         A = np.random.rand(10, 10)
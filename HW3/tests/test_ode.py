@@ -0,0 +1,335 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Unit tests for the ODE solvers
+Tests are against analytic solutions
+"""
+
+import unittest
+import sys
+sys.path.append("../") #lazy but it works
+import numpy as np
+from ode import euler, heun, RK4, RK45, euler_system, heun_system, RK4_system, RK45_system
+from ode import locate_root, ensemble_system, stream_system, stream_to_npy, BDF_system
+from ode import symplectic_system, SolverStats
+import os
+import tempfile
+
+
+# Simple harmonic oscillator, x'' = -x, with x(0) = 1, v(0) = 0
+dxdt = lambda t, x, v: v
+dvdt = lambda t, x, v: -x
+sho = lambda t, y: np.array([y[1], -y[0]])
+
+# Lane-Emden equation for n = 1, with theta(xi) = sin(xi)/xi and a surface at pi
+# y = [theta, dtheta/dxi], started slightly off-center using the series solution
+lane_emden = lambda xi, y: np.array([y[1], -y[0] - 2*y[1]/xi])
+xi0 = 1e-3
+le0 = [1 - xi0**2/6.0, -xi0/3.0]
+
+
+
+class TestODESolvers(unittest.TestCase):
+    """ Unit tester for ode.py """
+
+    def test_one_equation(self):
+        """ Test exponential decay for all three methods """
+        ts = np.linspace(0, 2, 2001)
+        exact = np.exp(-ts)
+        dydt = lambda t, y: -y
+        self.assertTrue(np.allclose(euler(ts, dydt, 1.0), exact, atol=1e-3))
+        self.assertTrue(np.allclose(heun(ts, dydt, 1.0), exact, atol=1e-6))
+        self.assertTrue(np.allclose(RK4(ts, dydt, 1.0), exact, atol=1e-10))
+
+    def test_two_equations(self):
+        """ Test the harmonic oscillator for all three methods """
+        ts = np.linspace(0, 2*np.pi, 1001)
+        for method, atol in [(euler, 0.05), (heun, 1e-4), (RK4, 1e-9)]:
+            xs, vs = method(ts, dxdt, 1.0, dvdt, 0.0)
+            self.assertTrue(np.allclose(xs, np.cos(ts), atol=atol))
+            self.assertTrue(np.allclose(vs, -np.sin(ts), atol=atol))
+
+    def test_heun(self):
+        """ Test the Picard iteration convergence and corrector time """
+        # With y' = t, the corrector is the trapezoid rule, which is exact
+        ts = np.linspace(0, 2, 11)
+        ys, info = heun(ts, lambda t, y: t, 0.0, full_output=True)
+        self.assertTrue(np.allclose(ys, ts**2/2.0))
+        self.assertEqual(info["mean_iterations"], 2) #the second iterate confirms the first
+
+        # Second order convergence, with far fewer than niter iterations
+        errors = list()
+        for N in [101, 201]:
+            ts = np.linspace(0, 2, N)
+            ys, info = heun_system(ts, lambda t, y: -y, [1.0], niter=50, rtol=1e-12,
+                                   full_output=True)
+            errors.append(np.max(np.abs(ys[:, 0] - np.exp(-ts))))
+            self.assertLess(info["mean_iterations"], 10)
+            self.assertEqual(info["nfev"], (N - 1)*(1 + info["mean_iterations"]))
+        self.assertAlmostEqual(errors[0]/errors[1], 4, places=1)
+
+        # The maximum number of iterations is respected
+        ys, info = heun(ts, lambda t, y: -y, 1.0, niter=2, rtol=0.0, full_output=True)
+        self.assertEqual(info["mean_iterations"], 2)
+
+    def test_system_matches_two_equations(self):
+        """ Test that the vector form matches the two-equation form """
+        ts = np.linspace(0, 5, 101)
+        for method, method_system in [(euler, euler_system), (RK4, RK4_system)]:
+            xs, vs = method(ts, dxdt, 1.0, dvdt, 0.0)
+            ys = method_system(ts, sho, [1.0, 0.0])
+            self.assertEqual(ys.shape, (len(ts), 2))
+            self.assertTrue(np.allclose(ys[:, 0], xs))
+            self.assertTrue(np.allclose(ys[:, 1], vs))
+
+    def test_system_many_dimensions(self):
+        """ Test a decoupled set of decays with different rates """
+        rates = np.arange(1, 7, dtype=float)
+        ts = np.linspace(0, 1, 501)
+        exact = np.exp(-np.outer(ts, rates))
+        ys = RK4_system(ts, lambda t, y: -rates*y, np.ones(len(rates)))
+        self.assertTrue(np.allclose(ys, exact, atol=1e-9))
+        ys = heun_system(ts, lambda t, y: -rates*y, np.ones(len(rates)))
+        self.assertTrue(np.allclose(ys, exact, atol=1e-4))
+
+    def test_RK45(self):
+        """ Test the adaptive solver and its dense output """
+        ts = np.linspace(0, 20, 1001)
+        ys, info = RK45_system(ts, sho, [1.0, 0.0], rtol=1e-10, atol=1e-12,
+                               full_output=True)
+        self.assertTrue(np.allclose(ys[:, 0], np.cos(ts), atol=1e-8))
+        self.assertTrue(np.allclose(ys[:, 1], -np.sin(ts), atol=1e-8))
+        # Far fewer steps are taken than output times requested
+        self.assertLess(info["naccept"], len(ts))
+        self.assertEqual(info["t_steps"][-1], ts[-1])
+
+        # Integrating backwards
+        xs, vs = RK45(ts[::-1], dxdt, np.cos(20), dvdt, -np.sin(20))
+        self.assertTrue(np.allclose(xs, np.cos(ts[::-1]), atol=1e-5))
+
+    def test_RK45_tolerance(self):
+        """ Test that a tighter tolerance gives a smaller error """
+        ts = np.linspace(0, 3, 31)
+        exact = np.exp(-ts)
+        errors = list()
+        for rtol in [1e-3, 1e-6, 1e-9]:
+            ys = RK45(ts, lambda t, y: -y, 1.0, rtol=rtol, atol=rtol*1e-3)
+            errors.append(np.max(np.abs(ys - exact)))
+        self.assertTrue(errors[0] > errors[1] > errors[2])
+        self.assertLess(errors[2], 1e-8)
+
+    def test_locate_root(self):
+        """ Test the bracketing root finder on theta in [0, 1] """
+        g = lambda theta: theta**3 - 0.125
+        self.assertAlmostEqual(locate_root(g, g(0), g(1)), 0.5, places=10)
+
+    def test_events(self):
+        """ Test that non-terminal events are all found """
+        ts = np.linspace(0, 20, 201)
+        ys, t_events, y_events = RK45_system(ts, sho, [1.0, 0.0], rtol=1e-10, atol=1e-12,
+                                             events=lambda t, y: y[0])
+        self.assertEqual(len(ys), len(ts))
+        self.assertTrue(np.allclose(t_events[0], np.pi*(np.arange(6) + 0.5)))
+        self.assertTrue(np.allclose(y_events[0][:, 0], 0))
+
+        ys, t_events, y_events = RK4_system(ts, sho, [1.0, 0.0], events=lambda t, y: y[0])
+        self.assertTrue(np.allclose(t_events[0], np.pi*(np.arange(6) + 0.5), atol=1e-5))
+
+    def test_terminal_event(self):
+        """ Test stopping at the surface of an n = 1 polytrope """
+        surface = lambda xi, y: y[0]
+        surface.terminal = True
+        surface.direction = -1
+        xis = np.linspace(xi0, 10, 1000)
+        for method in [RK4_system, RK45_system]:
+            ys, t_events, y_events = method(xis, lane_emden, le0, events=surface)
+            self.assertAlmostEqual(t_events[0][0], np.pi, places=5)
+            self.assertTrue(xis[len(ys)-1] <= np.pi < xis[len(ys)])
+            self.assertTrue(np.all(ys[:, 0] >= 0))
+            self.assertAlmostEqual(y_events[0][0, 1], -1/np.pi, places=5)
+
+        # The same with the two-equation interface
+        surface = lambda xi, theta, dtheta: theta
+        surface.terminal = True
+        thetas, dthetas, t_events, y_events = RK4(xis, lambda xi, theta, dtheta: dtheta, le0[0],
+                                                  lambda xi, theta, dtheta: -theta - 2*dtheta/xi,
+                                                  le0[1], events=surface)
+        self.assertAlmostEqual(t_events[0][0], np.pi, places=5)
+        self.assertEqual(len(thetas), len(dthetas))
+
+    def test_ensemble(self):
+        """ Test lockstep integration of many harmonic oscillators """
+        ts = np.linspace(0, 5, 201)
+        Y0 = np.random.rand(50, 2)
+        vsho = lambda t, Y: np.stack([Y[:, 1], -Y[:, 0]], axis=1)
+        ys = ensemble_system(ts, vsho, Y0)
+        self.assertEqual(ys.shape, (len(ts), 50, 2))
+        for m in [0, 17, 49]:
+            self.assertTrue(np.allclose(ys[:, m], RK4_system(ts, sho, Y0[m])))
+
+    def test_ensemble_event(self):
+        """ Test that each member of the ensemble stops at its own event """
+        # Carry each decay rate in the state, since finished members are dropped
+        rates = np.linspace(0.5, 5, 20)
+        ts = np.linspace(0, 10, 1001)
+        Y0 = np.stack([np.ones(len(rates)), rates], axis=1)
+        Y0_copy = Y0.copy()
+        f = lambda t, Y: np.stack([-Y[:, 1]*Y[:, 0], np.zeros(len(Y))], axis=1)
+        ys, t_events, y_events = ensemble_system(ts, f, Y0, event=lambda t, Y: Y[:, 0] - 0.5)
+        self.assertTrue(np.all(Y0 == Y0_copy))
+        self.assertTrue(np.allclose(t_events, np.log(2)/rates, atol=1e-6))
+        self.assertTrue(np.allclose(y_events[:, 0], 0.5, atol=1e-6))
+
+    def test_ensemble_event_vectorized(self):
+        """ Test stopping at the surface of n = 1 polytropes of different sizes """
+        # Scaling the radius by a, the surface moves to a*pi
+        scales = np.linspace(0.5, 2, 10)
+        def f(xi, Y):
+            a = Y[:, 2]
+            return np.stack([Y[:, 1], -Y[:, 0]/a**2 - 2*Y[:, 1]/xi, np.zeros(len(Y))], axis=1)
+        Y0 = np.array([[1 - (xi0/a)**2/6.0, -xi0/(3.0*a**2), a] for a in scales])
+        xis = np.linspace(xi0, 10, 2000)
+        ys, t_events, y_events = ensemble_system(xis, f, Y0, event=lambda xi, Y: Y[:, 0])
+        self.assertTrue(np.allclose(t_events, scales*np.pi, atol=1e-4))
+        # Stopped members are padded with NaN
+        self.assertTrue(np.all(np.isnan(ys[-1, :, 0])))
+        self.assertFalse(np.any(np.isnan(ys[:xis.searchsorted(0.5*np.pi), :, 0])))
+
+    def test_stream(self):
+        """ Test that the streamed chunks match the full solution """
+        ts = np.linspace(0, 10, 1001)
+        full = RK4_system(ts, sho, [1.0, 0.0])
+        chunks = list(stream_system(sho, [1.0, 0.0], 0.0, 0.01, 1000, chunk_size=64))
+        self.assertTrue(all(len(t_chunk) == 64 for t_chunk, _ in chunks[:-1]))
+        self.assertTrue(np.allclose(np.concatenate([t_chunk for t_chunk, _ in chunks]), ts))
+        self.assertTrue(np.allclose(np.concatenate([y_chunk for _, y_chunk in chunks]), full))
+
+        # Decimation
+        chunks = list(stream_system(sho, [1.0, 0.0], 0.0, 0.01, 1000, chunk_size=7, stride=10))
+        self.assertTrue(np.allclose(np.concatenate([y_chunk for _, y_chunk in chunks]),
+                                    full[::10]))
+
+    def test_stream_to_npy(self):
+        """ Test writing a streamed integration to disk """
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "sho.npy")
+            data = stream_to_npy(filename, sho, [1.0, 0.0], 0.0, 0.01, 1000,
+                                 chunk_size=100, stride=4)
+            self.assertEqual(data.shape, (251, 3))
+            self.assertTrue(np.allclose(data[:, 1], np.cos(data[:, 0]), atol=1e-8))
+            del data
+
+    def test_BDF_stiff(self):
+        """ Test the implicit solver on a stiff equation far beyond the explicit limit """
+        lam = 1e6
+        f = lambda t, y: -lam*(y - np.cos(t))
+        ts = np.linspace(0, 10, 1001) #h*lam = 1e4
+        exact = np.cos(ts) + np.sin(ts)/lam #to O(1/lam^2), after the initial transient
+        for order, atol in [(1, 1e-8), (2, 1e-10)]:
+            ys = BDF_system(ts, f, [0.0], order=order)
+            self.assertTrue(np.allclose(ys[1:, 0], exact[1:], atol=1e-3))
+            self.assertTrue(np.allclose(ys[5:, 0], exact[5:], atol=atol))
+        # RK4 is unstable at this step size
+        with np.errstate(over="ignore", invalid="ignore"):
+            self.assertFalse(np.all(np.isfinite(RK4_system(ts, f, [0.0]))))
+
+    def test_BDF_rate_equations(self):
+        """ Test a stiff three-level population system with rates up to 5e8 1/s """
+        A = np.array([[0, 5e8, 1e3],
+                      [0, 0, 1e1],
+                      [0, 0, 0]]) #A[l, u], transitions from u to l
+        C = np.array([[0, 1e-2, 1e-4],
+                      [1e6, 0, 1e-2],
+                      [1e2, 1e3, 0]]) #upward rates, C[u, l]
+        R = A + C #R[i, j] rate from j to i
+        M = R - np.diag(R.sum(axis=0))
+        f = lambda t, n: M @ n
+        ts = np.linspace(0, 1, 101)
+        ys, info = BDF_system(ts, f, [1.0, 0.0, 0.0], jac=lambda t, n: M, full_output=True)
+        self.assertTrue(np.allclose(ys.sum(axis=1), 1.0))
+        # Equilibrium is the null space of M
+        w, v = np.linalg.eig(M)
+        n_eq = np.real(v[:, np.argmin(np.abs(w))])
+        self.assertTrue(np.allclose(ys[-1], n_eq/n_eq.sum(), rtol=1e-6, atol=1e-12))
+        # The linear problem reuses the factorization: one for the backward
+        # Euler start and one for the rest of the BDF2 steps
+        self.assertEqual(info["njev"], 1)
+        self.assertEqual(info["nlu"], 2)
+        # The Jacobian is re-evaluated whenever the step size changes
+        ts = np.concatenate(([0], np.logspace(-6, 0, 20)))
+        ys, info = BDF_system(ts, f, [1.0, 0.0, 0.0], jac=lambda t, n: M, full_output=True)
+        self.assertTrue(np.allclose(ys.sum(axis=1), 1.0))
+        self.assertEqual(info["njev"], len(ts) - 1)
+
+    def test_symplectic(self):
+        """ Test the order and energy conservation of the symplectic methods """
+        dxdt = lambda v: v
+        dvdt = lambda x: -x
+        energy = lambda t, x, v: 0.5*np.sum(v**2 + x**2)
+        for method, order in [("verlet", 2), ("yoshida", 4)]:
+            errors = list()
+            for N in [201, 401]:
+                ts = np.linspace(0, 2*np.pi, N)
+                xs, vs = symplectic_system(ts, dxdt, dvdt, [1.0], [0.0], method=method)
+                errors.append(np.max(np.abs(xs[:, 0] - np.cos(ts))))
+            self.assertAlmostEqual(np.log2(errors[0]/errors[1]), order, places=1)
+
+            # No secular drift in the energy over many orbits with a large step
+            ts = np.arange(0, 300*2*np.pi, 0.2)
+            xs, vs, energies = symplectic_system(ts, dxdt, dvdt, [1.0, 0.0], [0.0, 1.0],
+                                                 method=method, diagnostics=energy)
+            self.assertEqual(energies.shape, ts.shape)
+            self.assertLess(np.max(np.abs(energies - 1.0)), 0.01)
+            self.assertLess(abs(np.mean(energies[-500:]) - np.mean(energies[:500])), 1e-6)
+
+    def test_stats(self):
+        """ Test counting of derivative evaluations and steps """
+        ts = np.linspace(0, 1, 11)
+        for method, nfev_per_step in [(euler, 1), (RK4, 4)]:
+            stats = SolverStats(trace=True)
+            method(ts, dxdt, 1.0, dvdt, 0.0, stats=stats)
+            self.assertEqual(stats.nfev, nfev_per_step*(len(ts) - 1))
+            self.assertEqual(stats.naccept, len(ts) - 1)
+            self.assertGreaterEqual(stats.total_time, stats.f_time)
+            trace = stats.get_trace()
+            self.assertTrue(np.allclose(trace["t"], ts[:-1]))
+            self.assertTrue(np.all(trace["nfev"] == nfev_per_step))
+
+        # The adaptive solver agrees with its own bookkeeping
+        stats = SolverStats()
+        ys, info = RK45_system(np.linspace(0, 20, 11), sho, [1.0, 0.0], rtol=1e-3, atol=1e-3,
+                               stats=stats, full_output=True)
+        self.assertEqual(stats.nfev, info["nfev"])
+        self.assertEqual(stats.naccept, info["naccept"])
+        self.assertEqual(stats.nreject, info["nreject"])
+        self.assertIsNone(stats.get_trace())
+        self.assertEqual(stats.as_dict()["nfev"], info["nfev"])
+
+        # Accumulates over runs
+        stats = SolverStats()
+        heun_system(ts, sho, [1.0, 0.0], stats=stats)
+        heun_system(ts, sho, [1.0, 0.0], stats=stats)
+        self.assertEqual(stats.naccept, 2*(len(ts) - 1))
+
+        # The other drivers, with one vectorized call per RK4 stage
+        stats = SolverStats()
+        vsho = lambda t, Y: np.stack([Y[:, 1], -Y[:, 0]], axis=1)
+        ensemble_system(ts, vsho, [[1.0, 0.0], [0.0, 1.0]], stats=stats)
+        self.assertEqual((stats.nfev, stats.naccept), (4*(len(ts) - 1), len(ts) - 1))
+        stats = SolverStats()
+        list(stream_system(sho, [1.0, 0.0], 0.0, 0.1, 25, chunk_size=4, stats=stats))
+        self.assertEqual((stats.nfev, stats.naccept), (4*25, 25))
+        self.assertGreaterEqual(stats.total_time, stats.f_time)
+
+        # Verlet evaluates dxdt once and, reusing the acceleration, dvdt
+        # once per step, plus dvdt at the start
+        stats = SolverStats(trace=True)
+        symplectic_system(ts, lambda v: v, lambda x: -x, [1.0], [0.0], stats=stats)
+        self.assertEqual(stats.nfev, 2*(len(ts) - 1) + 1)
+        self.assertTrue(np.allclose(stats.get_trace()["t"], ts[:-1]))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
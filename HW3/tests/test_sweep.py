@@ -0,0 +1,131 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Unit tests for the parameter sweep runner
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+sys.path.append("../") #lazy but it works
+import numpy as np
+from ode import RK4_system
+from sweep import run_sweep, read_table
+
+
+def decay(rate, y0):
+    """ Integrate exponential decay, must be top-level to be pickled """
+    ts = np.linspace(0, 1, 101)
+    ys = RK4_system(ts, lambda t, y: -rate*y, [y0])
+    return {"y_final": ys[-1, 0], "pid": os.getpid()}
+
+
+def decay_extra(rate, y0):
+    """ Same as decay(), with an extra result column """
+    result = decay(rate, y0)
+    result["extra"] = 0.0
+    return result
+
+
+def decay_rate(rate, y0):
+    """ Same as decay(), with a result named as a parameter """
+    result = decay(rate, y0)
+    result["rate"] = rate
+    return result
+
+
+
+class TestSweep(unittest.TestCase):
+    """ Unit tester for sweep.py """
+
+    def test_sweep(self):
+        """ Test that all runs are recorded in order """
+        params = [{"rate": rate, "y0": 2.0} for rate in np.linspace(0, 3, 12)]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "sweep.csv")
+            results = run_sweep(decay, params, filename, processes=2, max_pending=3)
+            self.assertEqual(len(results), len(params))
+            for param, result in zip(params, results):
+                self.assertEqual(result["rate"], param["rate"])
+                self.assertAlmostEqual(result["y_final"], 2.0*np.exp(-param["rate"]))
+            self.assertEqual(len(read_table(filename)), len(params))
+
+    def test_resume(self):
+        """ Test that a partially completed sweep is resumed """
+        params = [{"rate": rate, "y0": 1.0} for rate in np.linspace(0, 3, 8)]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "sweep.csv")
+            first = run_sweep(decay, params[:3], filename, processes=1)
+            results = run_sweep(decay, params, filename, processes=2)
+            # The first three were not rerun
+            self.assertEqual([result["pid"] for result in results[:3]],
+                             [result["pid"] for result in first])
+            with open(filename) as infile:
+                self.assertEqual(len(infile.readlines()), len(params) + 1)
+
+            # Mismatched columns raise an error
+            self.assertRaises(ValueError, lambda: run_sweep(decay_extra, params + params[:1],
+                                                            filename, processes=1))
+
+            # As do different parameters for the runs already recorded
+            shuffled = params[::-1]
+            self.assertRaises(ValueError, lambda: run_sweep(decay, shuffled, filename,
+                                                            processes=1))
+
+    def test_interrupted(self):
+        """ Test that rows cut off by an interruption are run again """
+        params = [{"rate": rate, "y0": 1.0} for rate in np.linspace(0, 3, 4)]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "sweep.csv")
+            run_sweep(decay, params[:3], filename, processes=1)
+            with open(filename) as infile:
+                header = infile.readline()
+                lines = {int(line.split(",", 1)[0]): line for line in infile}
+            # The row of run 1 missing its last column, then that of run 2
+            # cut off mid-line
+            with open(filename, "w") as outfile:
+                outfile.writelines([header, lines[0], lines[1].rsplit(",", 1)[0] + "\n",
+                                    lines[2][:8]])
+            self.assertEqual(sorted(read_table(filename)), [0])
+
+            results = run_sweep(decay, params, filename, processes=1)
+            for param, result in zip(params, results):
+                self.assertAlmostEqual(result["y_final"], np.exp(-param["rate"]))
+            self.assertEqual(sorted(read_table(filename)), [0, 1, 2, 3])
+
+    def test_resume_unordered(self):
+        """ Test resuming from a table whose rows are not in order of index """
+        params = [{"rate": rate, "y0": 1.0} for rate in np.linspace(0, 3, 6)]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "sweep.csv")
+            first = run_sweep(decay, params[:4], filename, processes=1)
+            with open(filename) as infile:
+                lines = infile.readlines()
+            with open(filename, "w") as outfile:
+                outfile.writelines(lines[:1] + lines[:0:-1])
+
+            results = run_sweep(decay, params, filename, processes=2)
+            self.assertEqual([result["pid"] for result in results[:4]],
+                             [result["pid"] for result in first])
+            self.assertEqual([result["rate"] for result in results],
+                             [param["rate"] for param in params])
+            self.assertEqual(sorted(read_table(filename)), list(range(6)))
+
+            # The recorded parameters are still checked by index
+            self.assertRaises(ValueError, lambda: run_sweep(decay, params[::-1], filename,
+                                                            processes=1))
+
+    def test_overlap(self):
+        """ Test that results named as parameters raise an error """
+        params = [{"rate": 1.0, "y0": 1.0}]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "sweep.csv")
+            self.assertRaises(ValueError, lambda: run_sweep(decay_rate, params, filename,
+                                                            processes=1))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
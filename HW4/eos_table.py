@@ -0,0 +1,220 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Tabulated equations of state for stellar-structure integration.
+
+Realistic equations of state, e.g., stellar_structure.chandrasekhar_pressure()
+or stellar_structure.ideal_degenerate_pressure(), give P(rho) but cannot be
+inverted in closed form, while the derivatives of hydrostatic equilibrium
+need rho(P) on every evaluation. Rather than root finding every time,
+TabulatedEOS evaluates P(rho) once on a grid uniform in log(rho), resamples
+the inverse onto a grid uniform in log(P), and then serves both directions
+with monotone (Fritsch-Carlson) cubic Hermite interpolation. Since both
+grids are uniform, the interval of a query is found arithmetically, so
+each lookup is O(1) and vectorizes over arrays of any shape. Outside of
+the table, P(rho) is extrapolated as a power law.
+
+The tables can be cached to a .npz file so that they are only built once.
+A cached table is checked by evaluating the function at a few of its
+entries, and is rebuilt if it was made for another function (or other
+parameters, including any global variables the function reads) or if
+the file cannot be read.
+A TabulatedEOS has the same rho_to_P() and P_to_rho() interface as
+stellar_structure.Polytrope and can be passed to hydrostatic(), tov(),
+or mass_radius().
+"""
+
+import os
+import tempfile
+import zipfile
+import numpy as np
+
+# Number of table entries re-evaluated to check a cached table
+N_CHECK = 17
+
+
+def pchip_slopes(x, y):
+    """
+    Fritsch-Carlson slopes of a monotone piecewise-cubic Hermite
+    interpolant through the points (x, y), with x increasing
+
+    The slope at an interior point is the weighted harmonic mean of the
+    neighboring secants, or zero at a local extremum, so that the
+    interpolant does not overshoot the data.
+    """
+    dx = np.diff(x)
+    secants = np.diff(y)/dx
+    m = np.empty_like(y)
+    m[0] = secants[0]
+    m[-1] = secants[-1]
+    w1 = 2*dx[1:] + dx[:-1]
+    w2 = dx[1:] + 2*dx[:-1]
+    same_sign = secants[:-1]*secants[1:] > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        harmonic = (w1 + w2)/(w1/secants[:-1] + w2/secants[1:])
+    m[1:-1] = np.where(same_sign, harmonic, 0.0)
+    return m
+
+
+def hermite(x, y, m, xq, k):
+    """
+    Evaluate the cubic Hermite interpolant with values y and slopes m
+    at the points xq, where k are the indices of the intervals
+    [x[k], x[k+1]] containing them
+    """
+    dx = x[k+1] - x[k]
+    t = (xq - x[k])/dx
+    t2 = t*t
+    t3 = t2*t
+    return ((2*t3 - 3*t2 + 1)*y[k] + (t3 - 2*t2 + t)*dx*m[k] +
+            (-2*t3 + 3*t2)*y[k+1] + (t3 - t2)*dx*m[k+1])
+
+
+def interpolate_uniform(x, y, m, xq):
+    """
+    Evaluate the cubic Hermite interpolant with values y and slopes m on
+    the uniform grid x at the points xq. The interval of each point is
+    found arithmetically rather than by a search. Points outside of the
+    grid are extrapolated linearly with the end slopes, i.e., as power
+    laws when x and y are logarithms.
+    """
+    n = len(x)
+    xc = np.clip(xq, x[0], x[-1])
+    k = np.clip(((xc - x[0])/(x[1] - x[0])).astype(np.intp), 0, n - 2)
+    yq = hermite(x, y, m, xc, k)
+    return yq + np.where(xq < x[0], m[0], m[-1])*(xq - xc)
+
+
+
+class TabulatedEOS:
+    """
+    Equation of state interpolated from a table of P(rho)
+
+    Parameters
+    ----------
+    rho_to_P : function
+        Pressure (Ba) as a function of the density (g/cm^3), vectorized
+        over np.ndarrays and monotonically increasing
+    rho_min, rho_max : float
+        Range of densities (g/cm^3) to tabulate
+    n (optional) : int
+        Number of table entries in each direction
+    cache (optional) : str
+        Path to a .npz file. If it holds a table of the same range and
+        size whose entries match rho_to_P at N_CHECK densities spread
+        over the table, the tables are loaded from it, otherwise they
+        are built and saved to it. With rho_to_P=None, any readable
+        table of the same range and size in the file is loaded.
+
+    Attributes
+    ----------
+    errors : dict
+        Maximum relative errors of "rho_to_P" and "P_to_rho" against
+        the analytic rho_to_P, measured halfway between the table entries,
+        where the interpolation error is largest
+    """
+    def __init__(self, rho_to_P, rho_min, rho_max, n=2048, cache=None):
+        self.func = rho_to_P
+        self.rho_min = rho_min
+        self.rho_max = rho_max
+        self.n = n
+
+        if cache is not None and self._load(cache):
+            return
+        self._build()
+        if cache is not None:
+            self._save(cache)
+
+
+    def _build(self):
+        """ Tabulate P(rho) and the inverse, and measure the errors """
+        self.log_rho = np.linspace(np.log(self.rho_min), np.log(self.rho_max), self.n)
+        self.log_P = np.log(self.func(np.exp(self.log_rho)))
+        if np.any(np.diff(self.log_P) <= 0):
+            raise ValueError("rho_to_P must be monotonically increasing over the table")
+        self.m_P = pchip_slopes(self.log_rho, self.log_P)
+
+        # Resample the inverse onto a uniform grid in log(P). The forward
+        # grid is not uniform in log(P), so search it this one time.
+        self.log_P_grid = np.linspace(self.log_P[0], self.log_P[-1], self.n)
+        m_inverse = pchip_slopes(self.log_P, self.log_rho)
+        k = np.clip(np.searchsorted(self.log_P, self.log_P_grid) - 1, 0, self.n - 2)
+        self.log_rho_grid = hermite(self.log_P, self.log_rho, m_inverse, self.log_P_grid, k)
+        self.m_rho = pchip_slopes(self.log_P_grid, self.log_rho_grid)
+
+        mid = 0.5*(self.log_rho[1:] + self.log_rho[:-1])
+        rho = np.exp(mid)
+        P = self.func(rho)
+        self.errors = {"rho_to_P": np.max(np.abs(self.rho_to_P(rho)/P - 1)),
+                       "P_to_rho": np.max(np.abs(self.P_to_rho(P)/rho - 1))}
+
+
+    def _load(self, filename):
+        """
+        Load the tables if the cache matches, returning whether it did.
+        A cache that cannot be read is treated as missing.
+        """
+        if not os.path.exists(filename):
+            return False
+        try:
+            with np.load(filename) as data:
+                if (data["n"] != self.n or data["rho_min"] != self.rho_min or
+                    data["rho_max"] != self.rho_max):
+                    return False
+                tables = {key: data[key] for key in ["log_rho", "log_P", "m_P", "log_P_grid",
+                                                     "log_rho_grid", "m_rho"]}
+                errors = {"rho_to_P": float(data["error_rho_to_P"]),
+                          "P_to_rho": float(data["error_P_to_rho"])}
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            return False
+
+        if self.func is not None:
+            # The table must have been built from this function
+            k = np.linspace(0, self.n - 1, N_CHECK).astype(np.intp)
+            P = self.func(np.exp(tables["log_rho"][k]))
+            if not np.allclose(np.exp(tables["log_P"][k]), P, rtol=1e-10, atol=0):
+                return False
+        for key, value in tables.items():
+            setattr(self, key, value)
+        self.errors = errors
+        return True
+
+
+    def _save(self, filename):
+        """
+        Save the tables to a temporary .npz file in the same directory,
+        then atomically replace the cache with it
+        """
+        try:
+            fd, tempname = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(filename) or ".")
+        except OSError: #e.g., a read-only directory, just don't cache
+            return
+        try:
+            with os.fdopen(fd, "wb") as outfile:
+                np.savez(outfile, n=self.n, rho_min=self.rho_min, rho_max=self.rho_max,
+                         log_rho=self.log_rho, log_P=self.log_P, m_P=self.m_P,
+                         log_P_grid=self.log_P_grid, log_rho_grid=self.log_rho_grid,
+                         m_rho=self.m_rho, error_rho_to_P=self.errors["rho_to_P"],
+                         error_P_to_rho=self.errors["P_to_rho"])
+            os.replace(tempname, filename)
+        except OSError:
+            if os.path.exists(tempname):
+                os.remove(tempname)
+
+
+    def rho_to_P(self, rho):
+        """ Pressure (Ba) from the density (g/cm^3) """
+        return np.exp(interpolate_uniform(self.log_rho, self.log_P, self.m_P, np.log(rho)))
+
+
+    def P_to_rho(self, P):
+        """
+        Density (g/cm^3) from the pressure (Ba)
+        As with Polytrope, non-positive pressures (outside of the star)
+        return zero density.
+        """
+        positive = P > 0
+        x = np.log(np.where(positive, P, 1.0))
+        rho = np.exp(interpolate_uniform(self.log_P_grid, self.log_rho_grid, self.m_rho, x))
+        return np.where(positive, rho, 0.0)
@@ -0,0 +1,226 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Equations of state and hydrostatic equilibrium for white dwarfs and
+neutron stars, as in the HW4 notebook, but written with plain floats in
+CGS units. The notebook versions of rho_to_P() and P_to_rho() build
+astropy Quantities and convert units on every derivative evaluation,
+which costs far more than the arithmetic. Here the constants are
+computed once, and the kernels work on floats or np.ndarrays of any
+shape, including the (M, 2) ensemble states of ode.ensemble_system().
+
+Units are only checked at the boundary: functions that take physical
+inputs from the user accept either floats in CGS or astropy Quantities.
+"""
+
+import os
+import sys
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../HW3/"))
+from ode import ensemble_system
+
+
+# Constants in CGS, CODATA 2022 values as in astropy.constants
+G = 6.6743e-8 #cm^3 g^-1 s^-2
+c = 2.99792458e10 #cm s^-1
+csq = c**2
+h = 6.62607015e-27 #erg s
+m_e = 9.1093837139e-28 #g
+m_u = 1.66053906892e-24 #g
+m_n = 1.67492750056e-24 #g
+k_B = 1.380649e-16 #erg K^-1
+R_earth = 6.3781e8 #cm
+M_sun = 1.988409870698051e33 #g
+km = 1e5 #cm
+
+# Non-relativistic degenerate prefactor, (1/20) (3/pi)^(2/3) h^2
+DEGENERATE_PREFACTOR = (1.0/20) * (3/np.pi)**(2.0/3) * h**2
+
+
+def to_cgs(value, unit):
+    """
+    Unit validation at the API boundary: convert an astropy Quantity
+    to a float (or np.ndarray) in the given CGS unit, or pass a plain
+    number through assuming it is already in that unit.
+
+    Parameters
+    ----------
+    value : float, np.ndarray, astropy.units.Quantity
+        Input value
+    unit : str
+        CGS unit string understood by astropy, e.g., "g / cm3"
+    """
+    if hasattr(value, "unit"):
+        import astropy.units as u #only needed if Quantities are used
+        return value.to(u.Unit(unit)).value
+    return value
+
+
+
+class Polytrope:
+    """
+    Polytropic equation of state P = K rho^gamma, in CGS
+
+    Parameters
+    ----------
+    K : float
+        Polytropic constant in CGS
+    gamma (optional) : float
+        Adiabatic index
+    """
+    def __init__(self, K, gamma=5.0/3):
+        self.K = K
+        self.gamma = gamma
+        self.inv_K = 1.0/K
+        self.inv_gamma = 1.0/gamma
+
+
+    def rho_to_P(self, rho):
+        """ Pressure (Ba) from the density (g/cm^3) """
+        return self.K * rho**self.gamma
+
+
+    def P_to_rho(self, P):
+        """
+        Density (g/cm^3) from the pressure (Ba)
+        Unlike the notebook version, non-positive pressures (outside of
+        the star) return zero density rather than NaN.
+        """
+        return np.maximum(P*self.inv_K, 0.0)**self.inv_gamma
+
+
+
+def white_dwarf_eos(mu_e=2):
+    """ Non-relativistic degenerate electron equation of state """
+    return Polytrope(DEGENERATE_PREFACTOR / (m_e * (mu_e*m_u)**(5.0/3)))
+
+
+def neutron_star_eos():
+    """ Non-relativistic degenerate neutron equation of state """
+    return Polytrope(DEGENERATE_PREFACTOR / m_n**(8.0/3))
+
+
+
+# Relativistic degenerate prefactor, pi m_e^4 c^5 / (3 h^3)
+CHANDRASEKHAR_PREFACTOR = np.pi * m_e**4 * c**5 / (3 * h**3)
+
+
+def _chandrasekhar_series(x, nterms=16):
+    """
+    Series of x(2x^2 - 3)sqrt(1 + x^2) + 3 arcsinh(x) for small x, where
+    the closed form suffers from cancellation. Since its derivative is
+    8x^4/sqrt(1 + x^2), the terms are 8 binom(-1/2, k) x^(2k+5)/(2k+5).
+    """
+    total = np.zeros_like(x)
+    binom = 1.0
+    for k in range(nterms):
+        total += 8*binom*x**(2*k+5)/(2*k+5)
+        binom *= -(k + 0.5)/(k + 1)
+    return total
+
+
+def chandrasekhar_pressure(rho, mu_e=2):
+    """
+    Pressure (Ba) of a fully degenerate electron gas of any degree of
+    relativity, from the density (g/cm^3). This has no closed-form
+    inverse, see eos_table.TabulatedEOS.
+    """
+    rho = np.asarray(rho, dtype=np.float64)
+    x = (h/(m_e*c)) * (3*rho/(8*np.pi*mu_e*m_u))**(1.0/3) #Fermi momentum / (m_e c)
+    small = x < 0.3
+    xl = np.where(small, 1.0, x)
+    closed = xl*(2*xl**2 - 3)*np.sqrt(1 + xl**2) + 3*np.arcsinh(xl)
+    return CHANDRASEKHAR_PREFACTOR * np.where(small, _chandrasekhar_series(x), closed)
+
+
+def ideal_degenerate_pressure(rho, T, mu=0.6, mu_e=2):
+    """
+    Pressure (Ba) of an ideal gas of temperature T (K) and mean molecular
+    weight mu, plus the degenerate electron pressure, from the density
+    (g/cm^3). This also has no closed-form inverse.
+    """
+    rho = np.asarray(rho, dtype=np.float64)
+    return rho*k_B*T/(mu*m_u) + chandrasekhar_pressure(rho, mu_e)
+
+
+
+def hydrostatic(eos):
+    """
+    Return the derivative function f(r, y) of y = [P, M_enc] for
+    Newtonian hydrostatic equilibrium with the given equation of state.
+    y may also be an (M, 2) ensemble of states.
+    """
+    def f(r, y):
+        P = y[..., 0]
+        M_enc = y[..., 1]
+        rho = eos.P_to_rho(P)
+        dydr = np.empty_like(y)
+        # dP/dr = 0 at the center, where M_enc = 0
+        dydr[..., 0] = np.where(M_enc == 0, 0.0, -G*M_enc*rho/np.where(r == 0, 1.0, r)**2)
+        dydr[..., 1] = 4*np.pi*r**2*rho
+        return dydr
+    return f
+
+
+def tov(eos):
+    """
+    Return the derivative function f(r, y) of y = [P, M_enc] for the
+    relativistic Tolman-Oppenheimer-Volkoff equation with the given
+    equation of state. y may also be an (M, 2) ensemble of states.
+    """
+    def f(r, y):
+        P = y[..., 0]
+        M_enc = y[..., 1]
+        rho = eos.P_to_rho(P)
+        dydr = np.empty_like(y)
+        center = M_enc == 0
+        r_safe = np.where(r == 0, 1.0, r)
+        M_safe = np.where(center, 1.0, M_enc)
+        rho_safe = np.where(rho == 0, 1.0, rho)
+        # Define each of the four terms separately for readability
+        A = -G*M_enc*rho/r_safe**2
+        B = 1 + P/(rho_safe*csq)
+        C = 1 + 4*np.pi*r_safe**3*P/(M_safe*csq)
+        D = 1.0/(1 - 2*G*M_enc/(r_safe*csq))
+        dydr[..., 0] = np.where(center, 0.0, A*B*C*D)
+        dydr[..., 1] = 4*np.pi*r**2*rho
+        return dydr
+    return f
+
+
+
+def mass_radius(rho_cs, eos, r_max, n_r=2000, relativistic=False):
+    """
+    Integrate a set of central densities to their surfaces at once
+    and return the total masses and radii
+
+    Parameters
+    ----------
+    rho_cs : float, np.ndarray, astropy.units.Quantity
+        Central densities, in g/cm^3 if not a Quantity
+    eos : Polytrope
+        Equation of state
+    r_max : float, astropy.units.Quantity
+        Maximum radius to integrate to, in cm if not a Quantity
+    n_r (optional) : int
+        Number of radial steps
+    relativistic (optional) : bool
+        Use the TOV equation rather than Newtonian hydrostatic equilibrium
+
+    Returns
+    -------
+    masses : np.ndarray
+        Total masses in g, NaN if the surface was not reached by r_max
+    radii : np.ndarray
+        Radii in cm, where the pressure reaches zero
+    """
+    rho_cs = np.atleast_1d(np.asarray(to_cgs(rho_cs, "g / cm3"), dtype=np.float64))
+    r_max = to_cgs(r_max, "cm")
+
+    f = tov(eos) if relativistic else hydrostatic(eos)
+    rs = np.linspace(0, r_max, n_r)
+    Y0 = np.stack([eos.rho_to_P(rho_cs), np.zeros(len(rho_cs))], axis=1)
+    surface = lambda r, Y: Y[:, 0]
+    _, radii, Y_surface = ensemble_system(rs, f, Y0, event=surface)
+    return Y_surface[:, 1], radii
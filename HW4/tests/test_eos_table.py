@@ -0,0 +1,126 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Unit tests for the tabulated equations of state
+"""
+
+import functools
+import os
+import tempfile
+import unittest
+import sys
+sys.path.append("../") #lazy but it works
+import numpy as np
+from stellar_structure import (c, h, m_e, m_u, M_sun, R_earth, chandrasekhar_pressure,
+                               ideal_degenerate_pressure, white_dwarf_eos, mass_radius,
+                               Polytrope)
+from eos_table import TabulatedEOS, N_CHECK
+
+# Temperature read by a test equation of state as a global variable
+T = 1e7
+
+
+
+class TestEOSTable(unittest.TestCase):
+    """ Unit tester for eos_table.py """
+
+    def test_chandrasekhar(self):
+        """ Test the non-relativistic limit and the series/closed-form switch """
+        rhos = np.array([1.0, 1e2])
+        self.assertTrue(np.allclose(chandrasekhar_pressure(rhos), white_dwarf_eos().rho_to_P(rhos),
+                                    rtol=1e-3))
+        # The series and the closed form agree where they meet (x = 0.3)
+        rho_switch = 8*np.pi*2*m_u/3 * (0.3*m_e*c/h)**3
+        P = chandrasekhar_pressure(rho_switch*np.array([1 - 1e-9, 1 + 1e-9]))
+        self.assertAlmostEqual(P[1]/P[0], 1.0, places=7)
+
+    def test_table(self):
+        """ Test the interpolation errors, vectorization, and edge cases """
+        eos = TabulatedEOS(lambda rho: ideal_degenerate_pressure(rho, 1e7), 1e-2, 1e12)
+        self.assertLess(eos.errors["rho_to_P"], 1e-8)
+        self.assertLess(eos.errors["P_to_rho"], 1e-8)
+
+        rng = np.random.default_rng(0)
+        rhos = 10**rng.uniform(-2, 12, (50, 3)) #any shape, e.g., an ensemble
+        Ps = ideal_degenerate_pressure(rhos, 1e7)
+        self.assertEqual(eos.P_to_rho(Ps).shape, rhos.shape)
+        self.assertTrue(np.allclose(eos.P_to_rho(Ps), rhos, rtol=1e-8))
+        self.assertTrue(np.allclose(eos.rho_to_P(rhos), Ps, rtol=1e-8))
+        self.assertEqual(eos.P_to_rho(-1.0), 0.0)
+        self.assertEqual(eos.P_to_rho(0.0), 0.0)
+
+        with self.assertRaises(ValueError):
+            TabulatedEOS(lambda rho: 1.0/rho, 1.0, 10.0)
+
+    def test_cache(self):
+        """ Test that the tables are saved and reloaded """
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "chandrasekhar.npz")
+            eos = TabulatedEOS(chandrasekhar_pressure, 1e-2, 1e12, n=512, cache=filename)
+            self.assertTrue(os.path.exists(filename))
+            cached = TabulatedEOS(None, 1e-2, 1e12, n=512, cache=filename)
+            self.assertTrue(np.array_equal(cached.log_rho_grid, eos.log_rho_grid))
+            self.assertEqual(cached.errors, eos.errors)
+            # A different table size rebuilds, which fails without a function
+            with self.assertRaises(TypeError):
+                TabulatedEOS(None, 1e-2, 1e12, n=256, cache=filename)
+
+            # Another equation of state on the same grid rebuilds the table
+            for func in [functools.partial(ideal_degenerate_pressure, T=1e6),
+                         lambda rho: ideal_degenerate_pressure(rho, 1e7),
+                         lambda rho: ideal_degenerate_pressure(rho, 1e8),
+                         Polytrope(1e13, 5.0/3).rho_to_P, Polytrope(1e13, 4.0/3).rho_to_P]:
+                other = TabulatedEOS(func, 1e-2, 1e12, n=512, cache=filename)
+                self.assertTrue(np.allclose(other.rho_to_P(1e5), func(1e5), rtol=1e-6))
+
+            # The same function and parameters load the cache, checking
+            # only a few entries, even from a new instance
+            calls = list()
+            def counted(rho):
+                calls.append(np.size(rho))
+                return Polytrope(1e13, 4.0/3).rho_to_P(rho)
+            again = TabulatedEOS(counted, 1e-2, 1e12, n=512, cache=filename)
+            self.assertEqual(calls, [N_CHECK])
+            self.assertTrue(np.array_equal(again.log_P, other.log_P))
+
+            # As do the global variables that the function reads
+            global T
+            T = 1e7
+            func = lambda rho: ideal_degenerate_pressure(rho, T)
+            TabulatedEOS(func, 1e-2, 1e12, n=512, cache=filename)
+            T = 1e9
+            hot = TabulatedEOS(func, 1e-2, 1e12, n=512, cache=filename)
+            self.assertTrue(np.allclose(hot.rho_to_P(1.0), func(1.0), rtol=1e-6))
+
+    def test_corrupt_cache(self):
+        """ Test that an unreadable cache is rebuilt """
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "chandrasekhar.npz")
+            eos = TabulatedEOS(chandrasekhar_pressure, 1e-2, 1e12, n=512, cache=filename)
+            with open(filename, "rb") as infile:
+                data = infile.read()
+            for contents in [data[:len(data)//2], b"not a cache"]:
+                with open(filename, "wb") as outfile:
+                    outfile.write(contents)
+                rebuilt = TabulatedEOS(chandrasekhar_pressure, 1e-2, 1e12, n=512, cache=filename)
+                self.assertTrue(np.array_equal(rebuilt.log_P, eos.log_P))
+                # and saved again
+                cached = TabulatedEOS(None, 1e-2, 1e12, n=512, cache=filename)
+                self.assertTrue(np.array_equal(cached.log_P, eos.log_P))
+            self.assertEqual(os.listdir(directory), ["chandrasekhar.npz"])
+
+    def test_mass_radius(self):
+        """ Test that relativistic white dwarfs approach the Chandrasekhar mass """
+        eos = TabulatedEOS(chandrasekhar_pressure, 1e-2, 1e12)
+        rho_cs = np.array([1e4, 1e10])
+        masses, radii = mass_radius(rho_cs, eos, 10*R_earth, n_r=4000)
+        # Non-relativistic at low density
+        M_nr, R_nr = mass_radius(rho_cs[:1], white_dwarf_eos(), 10*R_earth, n_r=4000)
+        self.assertAlmostEqual(masses[0]/M_nr[0], 1.0, places=1)
+        self.assertTrue(1.35 < masses[1]/M_sun < 1.44)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
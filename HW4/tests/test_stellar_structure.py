@@ -0,0 +1,58 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Unit tests for the unitless stellar structure kernels
+"""
+
+import unittest
+import sys
+sys.path.append("../") #lazy but it works
+import numpy as np
+import astropy.units as u
+import astropy.constants as const
+from stellar_structure import G, M_sun, R_earth, white_dwarf_eos, mass_radius
+
+
+
+class TestStellarStructure(unittest.TestCase):
+    """ Unit tester for stellar_structure.py """
+
+    def test_constants(self):
+        """ Test the CGS constants against astropy """
+        self.assertAlmostEqual(G/const.G.cgs.value, 1, places=6)
+        self.assertAlmostEqual(M_sun/const.M_sun.to(u.g).value, 1, places=6)
+        self.assertAlmostEqual(R_earth/const.R_earth.to(u.cm).value, 1, places=6)
+
+    def test_eos(self):
+        """ Test the kernels against the notebook's astropy versions """
+        prefactor = ((1.0/20) * (3/np.pi)**(2.0/3) * const.h**2 /
+                     (const.m_e * const.u**(5.0/3))).cgs
+        rho_to_P = lambda rho: (prefactor * ((rho*u.g/u.cm**3)/2)**(5.0/3)).to(u.Ba).value
+        eos = white_dwarf_eos(mu_e=2)
+        rhos = np.logspace(2, 8, 13)
+        Ps = eos.rho_to_P(rhos)
+        self.assertTrue(np.allclose(Ps, rho_to_P(rhos), rtol=1e-6))
+        self.assertTrue(np.allclose(eos.P_to_rho(Ps), rhos))
+        self.assertEqual(eos.P_to_rho(-1.0), 0.0)
+
+    def test_mass_radius(self):
+        """ Test against the n = 3/2 Lane-Emden solution """
+        xi1 = 3.65375
+        xi1_sq_dtheta = 2.71406
+        eos = white_dwarf_eos()
+        rho_cs = np.logspace(4, 6, 5)
+        masses, radii = mass_radius(rho_cs, eos, 5*R_earth)
+        n = 1.5
+        a = np.sqrt((n + 1)*eos.K*rho_cs**(1/n - 1)/(4*np.pi*G))
+        self.assertTrue(np.allclose(radii, a*xi1, rtol=1e-3))
+        self.assertTrue(np.allclose(masses, 4*np.pi*a**3*rho_cs*xi1_sq_dtheta, rtol=1e-3))
+
+        # Quantities are accepted at the boundary
+        M, R = mass_radius(1e7*u.kg/u.m**3, eos, 5*R_earth/1e5*u.km)
+        self.assertAlmostEqual(M[0]/masses[0], 1.0)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
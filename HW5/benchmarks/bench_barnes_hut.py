@@ -0,0 +1,106 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Throughput benchmark of the Barnes-Hut force evaluation, in particle
+interactions (particle-particle and particle-node pairs) per second:
+
+1. "recursive": QuadTree.calc_acceleration() called for each Particle,
+   as in the HW5 code
+2. "flat": FlatQuadTree.calc_acceleration() called for each particle,
+   walking the array-backed tree with an explicit stack
+3. "vectorized": FlatQuadTree.accelerations() for all particles at once
+
+The per-particle versions are timed on a random sample of targets and
+their throughput extrapolated, since they take minutes at N = 10^5.
+Tree construction is timed separately.
+
+To run, enter the benchmarks/ directory and run python on the script, e.g.,
+
+python bench_barnes_hut.py --sizes 1000 10000 100000 --theta 0.5
+"""
+
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../"))
+import numpy as np
+from coordinate import Coordinate
+from particle import ParticleSet
+from quadtree import QuadTree, FlatQuadTree
+
+
+def time_recursive(particles, theta, sample):
+    """ Return the build time, and the time and interactions of the sampled targets """
+    objects = particles.to_particles()
+    start = time.perf_counter()
+    tree = QuadTree(Coordinate(0, 0), Coordinate(1, 1), objects)
+    t_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in sample:
+        tree.calc_acceleration(objects[i], theta=theta)
+    t_force = time.perf_counter() - start
+
+    # Count the interactions in a separate, untimed pass
+    interactions = [0]
+    def count(ax, ay):
+        interactions[0] += 1
+    for i in sample:
+        objects[i].add_accel_components = count
+        tree.calc_acceleration(objects[i], theta=theta)
+    return t_build, t_force, interactions[0]
+
+
+def time_flat(particles, theta, sample):
+    """ Return the build time, and the time of the sampled targets """
+    start = time.perf_counter()
+    tree = FlatQuadTree(Coordinate(0, 0), Coordinate(1, 1), particles)
+    t_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in sample:
+        tree.calc_acceleration(i, theta=theta)
+    return t_build, time.perf_counter() - start
+
+
+def time_vectorized(particles, theta, block_size):
+    """ Return the build time, and the time and interactions of all targets """
+    start = time.perf_counter()
+    tree = FlatQuadTree(Coordinate(0, 0), Coordinate(1, 1), particles)
+    t_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, _, info = tree.accelerations(theta=theta, block_size=block_size, full_output=True)
+    return t_build, time.perf_counter() - start, info["interactions"]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Barnes-Hut force evaluation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--theta", type=float, default=0.5)
+    parser.add_argument("--sample", type=int, default=200,
+                        help="Number of targets timed for the per-particle versions")
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print("%-8s %-12s %12s %14s %16s"%("N", "version", "build (s)", "forces (s)",
+                                        "interactions/s"))
+    for N in args.sizes:
+        x, y = rng.random((2, N))
+        particles = ParticleSet(1.0/N, x, y, x, y)
+        sample = rng.choice(N, min(args.sample, N), replace=False)
+
+        b_rec, t_rec, n_rec = time_recursive(particles, args.theta, sample)
+        b_flat, t_flat = time_flat(particles, args.theta, sample)
+        b_vec, t_vec, n_vec = time_vectorized(particles, args.theta, args.block_size)
+
+        # Forces for all N targets, extrapolated from the sample. The flat
+        # walk opens the same nodes as the recursive one.
+        scale = N/len(sample)
+        print("%-8i %-12s %12.4e %14.4e %16.4e"%(N, "recursive", b_rec, t_rec*scale, n_rec/t_rec))
+        print("%-8i %-12s %12.4e %14.4e %16.4e"%(N, "flat", b_flat, t_flat*scale, n_rec/t_flat))
+        print("%-8i %-12s %12.4e %14.4e %16.4e"%(N, "vectorized", b_vec, t_vec, n_vec/t_vec))
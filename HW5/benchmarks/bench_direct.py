@@ -0,0 +1,49 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Benchmark of the direct summation against the Barnes-Hut tree:
+
+1. The crossover N below which direct summation is faster than building
+   and walking a FlatQuadTree, for each theta
+2. The accuracy report: the distribution of the relative errors of the
+   tree accelerations against direct summation versus theta, on the
+   galaxy-collision initial conditions (galaxies1.npy)
+
+To run, enter the benchmarks/ directory and run python on the script, e.g.,
+
+python bench_direct.py --thetas 0.1 0.3 0.5 0.7 1.0 --softening 0.01
+"""
+
+import argparse
+import os
+import sys
+DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
+sys.path.append(DIRECTORY)
+from coordinate import Coordinate
+from particle import ParticleSet
+from direct import measure_crossover, accuracy_report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the direct summation")
+    parser.add_argument("--thetas", type=float, nargs="+", default=[0.1, 0.2, 0.3, 0.5, 0.7, 1.0])
+    parser.add_argument("--softening", type=float, default=0.0)
+    parser.add_argument("--max-n", type=int, default=16384,
+                        help="Largest N timed for the crossover")
+    args = parser.parse_args()
+
+    print("Crossover N, above which the tree is faster")
+    print("%-8s %10s"%("theta", "N"))
+    for theta in args.thetas:
+        print("%-8g %10i"%(theta, measure_crossover(theta, max_n=args.max_n)))
+
+    particles = ParticleSet.from_npy(os.path.join(DIRECTORY, "galaxies0.npy"),
+                                     os.path.join(DIRECTORY, "galaxies1.npy"), m=1e12)
+    rows = accuracy_report(particles, Coordinate(0, 0), Coordinate(10, 10), thetas=args.thetas,
+                           softening=args.softening)
+    print("\nRelative force errors for the %i galaxy particles"%len(particles))
+    columns = [key for key in rows[0] if key != "theta"]
+    print("%-8s"%"theta" + "".join("%14s"%column for column in columns))
+    for row in rows:
+        print("%-8g"%row["theta"] + "".join("%14.4e"%row[column] for column in columns))
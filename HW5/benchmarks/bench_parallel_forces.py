@@ -0,0 +1,86 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Strong-scaling benchmark of the parallel Barnes-Hut force evaluation on
+the galaxy-collision initial conditions, galaxies0.npy and galaxies1.npy:
+the same problem is run with an increasing number of processes, and the
+time per force evaluation, speedup, and parallel efficiency relative to
+the serial FlatQuadTree.accelerations() are reported. Every parallel
+result is checked to be identical to the serial one.
+
+The 655 particles of the initial conditions are too few for the pool to
+pay off, so --resample draws a larger number of particles from them,
+each jittered by a small random offset, keeping the total mass.
+
+To run, enter the benchmarks/ directory and run python on the script, e.g.,
+
+python bench_parallel_forces.py --processes 1 2 4 8 --resample 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
+sys.path.append(DIRECTORY)
+import numpy as np
+from coordinate import Coordinate
+from particle import ParticleSet
+from quadtree import FlatQuadTree
+from parallel_forces import ParallelForces
+
+
+def load_galaxies(n=None, jitter=0.02, m=1e12, seed=0):
+    """ Return the initial conditions, resampled to n particles if given """
+    particles = ParticleSet.from_npy(os.path.join(DIRECTORY, "galaxies0.npy"),
+                                     os.path.join(DIRECTORY, "galaxies1.npy"), m=m)
+    if n is None:
+        return particles
+    rng = np.random.default_rng(seed)
+    i = rng.choice(len(particles), n)
+    dx, dy = rng.normal(0, jitter, (2, n))
+    return ParticleSet(m*len(particles)/n, particles.xminus[i] + dx, particles.yminus[i] + dy,
+                       particles.x[i] + dx, particles.y[i] + dy)
+
+
+def best_time(func, repeats):
+    """ Return the best of several wall-clock times of func(), and its last result """
+    times = list()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Strong scaling of the parallel force evaluation")
+    parser.add_argument("--processes", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--resample", type=int, default=None,
+                        help="Number of particles to resample the initial conditions to")
+    parser.add_argument("--theta", type=float, default=0.5)
+    parser.add_argument("--chunks-per-process", type=int, default=4)
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    particles = load_galaxies(args.resample)
+    tree = FlatQuadTree(Coordinate(-1, -1), Coordinate(11, 11), particles)
+    print("N = %i particles, %i nodes, %i CPUs"%(len(particles), len(tree.child),
+                                                  os.cpu_count() or 1))
+
+    t_serial, (ax, ay) = best_time(lambda: tree.accelerations(theta=args.theta,
+                                                              block_size=args.block_size),
+                                   args.repeats)
+    print("%-10s %14s %10s %12s"%("processes", "forces (s)", "speedup", "efficiency"))
+    print("%-10s %14.4e %10.2f %12.2f"%("serial", t_serial, 1.0, 1.0))
+    for processes in args.processes:
+        with ParallelForces(processes, args.chunks_per_process, args.block_size) as forces:
+            forces.accelerations(tree, theta=args.theta) #start the workers
+            t, (pax, pay) = best_time(lambda: forces.accelerations(tree, theta=args.theta),
+                                      args.repeats)
+        if not (np.array_equal(pax, ax) and np.array_equal(pay, ay)):
+            raise RuntimeError("Parallel accelerations differ from the serial ones")
+        print("%-10i %14.4e %10.2f %12.2f"%(processes, t, t_serial/t, t_serial/t/processes))
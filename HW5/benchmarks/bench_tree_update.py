@@ -0,0 +1,61 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Benchmark of the per-step cost of maintaining a FlatQuadTree over a run,
+updating it in place with FlatQuadTree.update() versus building a new
+tree every step. The particles drift with random velocities, chosen so
+that a given fraction of them cross cells each step on average, and
+optionally only a fraction of them move at all.
+
+To run, enter the benchmarks/ directory and run python on the script, e.g.,
+
+python bench_tree_update.py --sizes 10000 100000 --steps 50
+"""
+
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../"))
+import numpy as np
+from coordinate import Coordinate
+from particle import ParticleSet
+from quadtree import FlatQuadTree
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark updating the tree between steps")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--speed", type=float, default=0.01,
+                        help="Typical distance moved per step, in units of the mean separation")
+    parser.add_argument("--moving", type=float, default=1.0,
+                        help="Fraction of the particles that move")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    SWcoord, NEcoord = Coordinate(-0.5, -0.5), Coordinate(1.5, 1.5)
+    print("%-8s %14s %14s %10s %10s"%("N", "rebuild (s)", "update (s)", "speedup", "rebuilds"))
+    for N in args.sizes:
+        x, y = rng.random((2, N))
+        vx, vy = rng.normal(0, args.speed/np.sqrt(N), (2, N))*(rng.random(N) < args.moving)
+        particles = ParticleSet(1.0/N, x - vx, y - vy, x, y)
+        tree = FlatQuadTree(SWcoord, NEcoord, particles)
+
+        t_rebuild = t_update = 0.0
+        rebuilds = 0
+        for step in range(args.steps):
+            particles.verlet_step()
+
+            start = time.perf_counter()
+            FlatQuadTree(SWcoord, NEcoord, particles)
+            t_rebuild += time.perf_counter() - start
+
+            start = time.perf_counter()
+            rebuilds += tree.update(particles)
+            t_update += time.perf_counter() - start
+
+        print("%-8i %14.4e %14.4e %10.2f %10i"%(N, t_rebuild/args.steps, t_update/args.steps,
+                                                t_rebuild/t_update, rebuilds))
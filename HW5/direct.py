@@ -0,0 +1,198 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Direct summation of the gravitational accelerations, O(N^2)
+
+The pairs are computed in tiles of tile_size targets by tile_size
+sources, so the memory used is O(tile_size^2) rather than O(N^2). This
+is the exact reference for the error of the Barnes-Hut approximation,
+and is faster than building and walking the tree for small N, so
+accelerations() uses it below a crossover N, by default CROSSOVER. The
+crossover can be calibrated for a machine and theta with
+measure_crossover() (see benchmarks/bench_direct.py) and passed in.
+"""
+
+import time
+import numpy as np
+from coordinate import Coordinate
+from particle import ParticleSet
+from quadtree import FlatQuadTree, particle_arrays
+
+# Number of particles from which accelerations() uses the tree. Measured
+# with measure_crossover() as 512-2048 for theta = 0.3-0.7 on the
+# development machine
+CROSSOVER = 1024
+
+
+def direct_accelerations(particles, G=6.67e-11, softening=0.0, tile_size=512):
+    """
+    Return the accelerations of all of the particles by direct summation
+
+    Parameters
+    ----------
+    particles : list, ParticleSet
+        list of Particles, or a ParticleSet
+    G (optional) : float
+        Gravitational constant to use. Defaults to SI units
+    softening (optional) : float
+        Plummer softening length, added in quadrature to distances
+    tile_size (optional) : int
+        Number of targets and of sources in each tile of pairs
+
+    Returns
+    -------
+    ax, ay : np.ndarray
+        Components of the accelerations, in the order of the particles
+    """
+    m, x, y = particle_arrays(particles)
+    n = len(m)
+    ax = np.zeros(n)
+    ay = np.zeros(n)
+    eps2 = softening*softening
+    for i in range(0, n, tile_size):
+        xi = x[i:i + tile_size, None]
+        yi = y[i:i + tile_size, None]
+        for j in range(0, n, tile_size):
+            dx = x[None, j:j + tile_size] - xi
+            dy = y[None, j:j + tile_size] - yi
+            r2 = dx*dx + dy*dy + eps2
+            if i == j:
+                # Leave out each particle's force on itself
+                np.fill_diagonal(r2, np.inf)
+            factor = m[None, j:j + tile_size]/(r2*np.sqrt(r2))
+            ax[i:i + tile_size] += (factor*dx).sum(axis=1)
+            ay[i:i + tile_size] += (factor*dy).sum(axis=1)
+    return G*ax, G*ay
+
+
+def _random_particles(n, rng):
+    """ Uniformly random particles in the unit box, for timing """
+    x, y = rng.random((2, n))
+    return ParticleSet(1.0/n, x, y, x, y)
+
+
+def measure_crossover(theta=0.5, max_n=16384, repeats=3, seed=0):
+    """
+    Measure the number of particles above which building a FlatQuadTree
+    and walking it is faster than direct summation, by timing both on
+    uniformly random particles of doubling N until the tree wins. This
+    is a calibration for the crossover of accelerations(), and takes
+    from a fraction of a second to several seconds for a small theta.
+
+    Parameters
+    ----------
+    theta (optional) : float
+        Opening angle of the tree walk
+    max_n (optional) : int
+        Largest N timed, returned if the tree has not won by then
+    repeats (optional) : int
+        Number of timings of each, of which the best is used
+    seed (optional) : int
+        Seed of the random particles
+
+    Returns
+    -------
+    n : int
+        The smallest N timed at which the tree is faster
+    """
+    rng = np.random.default_rng(seed)
+    SWcoord, NEcoord = Coordinate(0, 0), Coordinate(1, 1)
+    def tree_accelerations(particles):
+        return FlatQuadTree(SWcoord, NEcoord, particles).accelerations(theta=theta)
+
+    n = 16
+    while n < max_n:
+        particles = _random_particles(n, rng)
+        timings = list()
+        for func in [direct_accelerations, tree_accelerations]:
+            best = np.inf
+            for _ in range(repeats):
+                start = time.perf_counter()
+                func(particles)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best)
+        if timings[1] < timings[0]:
+            return n
+        n *= 2
+    return max_n
+
+
+def accelerations(particles, SWcoord, NEcoord, theta=0.5, G=6.67e-11, softening=0.0,
+                  crossover=CROSSOVER):
+    """
+    Return the accelerations of all of the particles, by direct summation
+    for fewer particles than the crossover, or else with a FlatQuadTree
+
+    Parameters
+    ----------
+    particles : list, ParticleSet
+        list of Particles, or a ParticleSet
+    SWcoord, NEcoord : Coordinate
+        Corners of the box of the tree. Particles outside of the box
+        are given zero accelerations if the tree is used.
+    theta, G, softening (optional) :
+        See FlatQuadTree.accelerations()
+    crossover (optional) : int
+        Number of particles from which to use the tree, CROSSOVER by
+        default. The choice does not depend on timings, so the same
+        inputs always use the same method.
+
+    Returns
+    -------
+    ax, ay : np.ndarray
+        Components of the accelerations, in the order of the particles
+    """
+    if len(particles) < crossover:
+        return direct_accelerations(particles, G=G, softening=softening)
+    tree = FlatQuadTree(SWcoord, NEcoord, particles)
+    return tree.accelerations(theta=theta, G=G, softening=softening)
+
+
+def accuracy_report(particles, SWcoord, NEcoord, thetas=(0.1, 0.2, 0.3, 0.5, 0.7, 1.0),
+                    softening=0.0, percentiles=(50, 90, 99)):
+    """
+    Return the distribution of the relative errors of the Barnes-Hut
+    accelerations against direct summation for each theta
+
+    Parameters
+    ----------
+    particles : list, ParticleSet
+        list of Particles, or a ParticleSet. Particles outside of the
+        box are left out of the report.
+    SWcoord, NEcoord : Coordinate
+        Corners of the box of the tree
+    thetas (optional) : list
+        Opening angles to test
+    softening (optional) : float
+        Plummer softening length, used in both
+    percentiles (optional) : list
+        Percentiles of the errors to report
+
+    Returns
+    -------
+    rows : list
+        List of dictionaries, one for each theta, of the theta, the
+        "rms" and "max" relative errors, the given percentiles (keyed
+        by e.g. "p90"), and the number of "interactions" per particle
+    """
+    tree = FlatQuadTree(SWcoord, NEcoord, particles)
+    # The tree leaves out the particles outside of the box, so do the same
+    inside = tree.order
+    m, x, y = particle_arrays(particles)
+    ax, ay = direct_accelerations(ParticleSet(m[inside], x[inside], y[inside],
+                                              x[inside], y[inside]),
+                                  G=1.0, softening=softening)
+    # A particle can feel no net force, e.g., at a point of symmetry
+    norm = np.maximum(np.hypot(ax, ay), np.finfo(float).tiny)
+    rows = list()
+    for theta in thetas:
+        tax, tay, info = tree.accelerations(theta=theta, G=1.0, full_output=True,
+                                            softening=softening)
+        error = np.hypot(tax[inside] - ax, tay[inside] - ay)/norm
+        row = {"theta": theta, "rms": np.sqrt(np.mean(error**2)), "max": np.max(error)}
+        for q, value in zip(percentiles, np.percentile(error, percentiles)):
+            row["p%g"%q] = value
+        row["interactions"] = info["interactions"]/len(norm)
+        rows.append(row)
+    return rows
@@ -0,0 +1,230 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Parallel Barnes-Hut force evaluation on a process pool
+
+The arrays of a FlatQuadTree that the force walk reads are copied into
+one block of shared memory, which is kept between steps and rewritten
+only when the tree has been rebuilt or updated (and replaced only when
+the tree has outgrown it). The workers attach to the block once and
+view it as numpy arrays, so only the name of the block and the range
+of targets of each task are pickled, never the tree. Each
+task is a contiguous range of the Morton-sorted particles, i.e., a
+spatially compact chunk whose targets open similar nodes, and its
+accelerations are written into shared arrays in place. Since the sum
+for each particle does not depend on the chunk it is in, the result is
+identical to FlatQuadTree.accelerations() for any number of processes.
+
+with ParallelForces(processes=4) as forces:
+    for step in range(n_steps):
+        tree.update(particles)
+        forces.accelerations(tree, theta=0.5, ax=particles.ax, ay=particles.ay)
+        particles.verlet_step(h)
+"""
+
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from quadtree import FlatQuadTree
+
+# Arrays of the tree read by the force walk, and the accelerations
+NODE_ARRAYS = [("child", np.intp), ("start", np.intp), ("end", np.intp),
+               ("cx", np.float64), ("cy", np.float64), ("size", np.float64),
+               ("mass", np.float64), ("comx", np.float64), ("comy", np.float64)]
+PARTICLE_ARRAYS = [("m", np.float64), ("x", np.float64), ("y", np.float64),
+                   ("ax", np.float64), ("ay", np.float64)]
+
+
+def layout(n_nodes, n):
+    """
+    Return the offsets of the arrays in a shared block for a tree with
+    n_nodes nodes and n particles, and the size of the block in bytes
+    """
+    offsets = dict()
+    size = 0
+    for arrays, length in [(NODE_ARRAYS, n_nodes), (PARTICLE_ARRAYS, n)]:
+        for name, dtype in arrays:
+            offsets[name] = (size, dtype, length)
+            size += length*np.dtype(dtype).itemsize #all 8 bytes, so aligned
+    return offsets, size
+
+
+def shared_views(buffer, n_nodes, n):
+    """ Return a dictionary of the arrays viewing a shared block """
+    offsets, _ = layout(n_nodes, n)
+    return {name: np.ndarray(length, dtype=dtype, buffer=buffer, offset=offset)
+            for name, (offset, dtype, length) in offsets.items()}
+
+
+# State of each worker process: the attached block and a tree viewing it
+_worker = {"key": None, "shm": None, "tree": None, "views": None}
+
+
+def _attach(name, n_nodes, n):
+    """ Attach this worker to a shared block, unless it already is """
+    if _worker["key"] == (name, n_nodes, n):
+        return _worker["tree"], _worker["views"]
+    shm = _worker["shm"]
+    if shm is None or shm.name != name:
+        # The views must be released before the old block can be closed
+        _worker.update(tree=None, views=None)
+        if shm is not None:
+            shm.close()
+        shm = shared_memory.SharedMemory(name=name)
+
+    views = shared_views(shm.buf, n_nodes, n)
+    # A tree with only the arrays needed by the walk, viewing the block
+    tree = FlatQuadTree.__new__(FlatQuadTree)
+    for array, _ in NODE_ARRAYS + PARTICLE_ARRAYS[:3]:
+        setattr(tree, array, views[array])
+    _worker.update(key=(name, n_nodes, n), shm=shm, tree=tree, views=views)
+    return tree, views
+
+
+def _walk_chunk(name, n_nodes, n, first, last, theta, G, block_size, softening=0.0):
+    """
+    Worker task: write the accelerations of the sorted particles
+    first:last into the shared block, and return the interactions
+    """
+    tree, views = _attach(name, n_nodes, n)
+    ax = views["ax"][first:last]
+    ay = views["ay"][first:last]
+    ax[:] = 0.0
+    ay[:] = 0.0
+    return tree.accumulate_accelerations(first, last, ax, ay, theta=theta, G=G,
+                                         block_size=block_size, softening=softening)
+
+
+
+class ParallelForces:
+    """
+    Evaluates the accelerations of the particles in a FlatQuadTree on a
+    process pool, sharing the arrays through shared memory. The pool and
+    the block are kept between steps, so use as a context manager or
+    call close() when done.
+
+    Parameters
+    ----------
+    processes (optional) : int
+        Number of worker processes, defaults to the number of CPUs
+    chunks_per_process (optional) : int
+        Number of chunks of targets per process. More, smaller chunks
+        balance the load between dense and sparse regions better.
+    block_size (optional) : int
+        Number of targets walked at once within a chunk, which scales
+        the memory of the walk, see FlatQuadTree.accelerations()
+    """
+    def __init__(self, processes=None, chunks_per_process=4, block_size=1024):
+        if processes is None:
+            processes = os.cpu_count() or 1
+        self.processes = processes
+        self.chunks_per_process = chunks_per_process
+        self.block_size = block_size
+        self.executor = ProcessPoolExecutor(max_workers=processes)
+        self.shm = None
+        self.shared = None #(weak reference to the tree, version) in the block
+        self.copies = 0 #number of times a tree was copied into the block
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self):
+        """ Shut down the pool and free the shared block """
+        self.executor.shutdown()
+        self._release()
+
+
+    def _release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+            self.shared = None
+
+
+    def share(self, tree):
+        """
+        Copy the arrays of the tree into the shared block, replacing it
+        with a larger one if the tree has outgrown it. The copy is
+        skipped if the block already holds this version of the tree,
+        i.e., it has not been rebuilt or updated since. Changes made to
+        the arrays of the tree by other means are not seen.
+
+        Returns
+        -------
+        views : dict
+            The arrays viewing the block
+        """
+        n_nodes, n = len(tree.child), len(tree.keys)
+        _, size = layout(n_nodes, n)
+        if self.shm is None or self.shm.size < size:
+            self._release()
+            # Leave room for the tree to grow with updates
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size + size//4, 1))
+        views = shared_views(self.shm.buf, n_nodes, n)
+        if self.shared is not None:
+            reference, version = self.shared
+            if reference() is tree and version == tree.version:
+                return views
+        for name, _ in NODE_ARRAYS + PARTICLE_ARRAYS[:3]:
+            views[name][:] = getattr(tree, name)
+        self.shared = (weakref.ref(tree), tree.version)
+        self.copies += 1
+        return views
+
+
+    def accelerations(self, tree, theta=None, G=6.67e-11, ax=None, ay=None,
+                      full_output=False, softening=0.0):
+        """
+        Return the accelerations of all of the particles in the tree
+
+        Parameters
+        ----------
+        tree : FlatQuadTree
+            The tree, with its moments up to date
+        theta, G (optional) :
+            See FlatQuadTree.accelerations()
+        ax, ay (optional) : np.ndarray
+            Arrays in the order of the particles given to the tree, e.g.,
+            ParticleSet.ax and .ay, which the accelerations are added to
+            in place. By default, new arrays.
+        full_output (optional) : bool
+            If True, also return a dictionary with the total number of
+            "interactions" (particle-particle and particle-node pairs)
+        softening (optional) : float
+            Plummer softening length, see FlatQuadTree.accelerations()
+
+        Returns
+        -------
+        ax, ay : np.ndarray
+            Components of the accelerations, in the order of the
+            particles given. Particles outside of the box are zero.
+        """
+        views = self.share(tree)
+        n_nodes, n = len(tree.child), len(tree.keys)
+        n_chunks = max(min(self.processes*self.chunks_per_process, n), 1)
+        bounds = np.linspace(0, n, n_chunks + 1).astype(int)
+        futures = [self.executor.submit(_walk_chunk, self.shm.name, n_nodes, n, first, last,
+                                        theta, G, self.block_size, softening)
+                   for first, last in zip(bounds[:-1], bounds[1:]) if last > first]
+        interactions = sum(future.result() for future in futures)
+
+        if ax is None:
+            ax = np.zeros(len(tree.rank))
+        if ay is None:
+            ay = np.zeros(len(tree.rank))
+        # Back to the order of the particles given
+        ax[tree.order] += views["ax"]
+        ay[tree.order] += views["ay"]
+        if full_output:
+            return ax, ay, {"interactions": interactions}
+        return ax, ay
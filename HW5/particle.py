@@ -4,6 +4,13 @@ ASTP-720, Fall 2020
 
 Class to represent a point-mass particle
 Also performs the integration
+
+For large numbers of particles, ParticleSet instead stores all of the
+particles as contiguous float64 arrays (a structure of arrays), so that
+the integration is done with array operations rather than by allocating
+new Coordinates for every particle on every step. Indexing or iterating
+over a ParticleSet gives ParticleViews, which have the same methods as
+Particle but read and write the arrays, for use with the QuadTree.
 '''
 import numpy as np
 from coordinate import Coordinate
@@ -36,7 +43,9 @@ class Particle:
         self.m = m
         self.cminus = cminus
         self.c = c
-        self.accels = list()
+        # Running sums of the accelerations for the next step
+        self.ax = 0.0
+        self.ay = 0.0
 
 
     def __eq__(self, other):
@@ -61,23 +70,23 @@ class Particle:
         return anything
         """
 
-        # First, figure out the sum of the x and y accelerations independently
-        ax = np.mean(list(map(lambda coord: coord.x, self.accels)))
-        ay = np.mean(list(map(lambda coord: coord.y, self.accels)))
-
-        newx = 2*self.c.x - self.cminus.x + h**2 * ax
-        newy = 2*self.c.y - self.cminus.y + h**2 * ay
+        # The x and y accelerations have been summed as they were added
+        newx = 2*self.c.x - self.cminus.x + h**2 * self.ax
+        newy = 2*self.c.y - self.cminus.y + h**2 * self.ay
 
-        # Update both the past and the current step simultaneously
+        # Update both the past and the current step simultaneously.
+        # This is a new Coordinate rather than an update of the old one,
+        # since QuadTree leaves keep references to the coordinates.
         self.cminus, self.c = self.c, Coordinate(newx, newy)
-        # now delete the list of accelerations
-        self.accels = list()
+        # now reset the sums of the accelerations
+        self.ax = 0.0
+        self.ay = 0.0
         return
 
 
     def add_accel(self, accel):
         """
-        Add an acceleration, given as a coordinate, to the list
+        Add an acceleration, given as a coordinate, to the sums
         used to calculate the total update
 
         Parameters
@@ -85,7 +94,201 @@ class Particle:
         accel : Coordinate
             Using a Coordinate as a vector because why not
         """
-        self.accels.append(accel)
+        self.ax += accel.x
+        self.ay += accel.y
+
+
+    def add_accel_components(self, ax, ay):
+        """
+        Add an acceleration given as its x and y components, which
+        avoids allocating a Coordinate for every interaction
+        """
+        self.ax += ax
+        self.ay += ay
+
+
+    def get_index(self):
+        """ Return index of particle """
+        return self.index
+
+
+    def get_mass(self):
+        """ Return mass of particle """
+        return self.m
+
+
+    def get_coord(self):
+        """ Return coordinate of particle """
+        return self.c
+
+
+    def get_separation(self, other):
+        """ Return separaton between this particle and another Coordinate """
+        return self.c.get_distance(other.c)
+
+
+
+class ParticleSet:
+    """
+    Structure-of-arrays store of point particles
+
+    Parameters
+    ----------
+    m : float, np.ndarray
+        Masses of the particles, or one mass for all of them
+    xminus, yminus : np.ndarray
+        Coordinates of the particles at the previous timestep
+    x, y : np.ndarray
+        Coordinates of the particles
+
+    Attributes
+    ----------
+    ax, ay : np.ndarray
+        Accelerations summed for the next step, zeroed after each step
+    """
+    def __init__(self, m, xminus, yminus, x, y):
+        self.x = np.array(x, dtype=np.float64)
+        self.y = np.array(y, dtype=np.float64)
+        self.xminus = np.array(xminus, dtype=np.float64)
+        self.yminus = np.array(yminus, dtype=np.float64)
+        self.m = np.zeros(len(self.x))
+        self.m[:] = m
+        self.ax = np.zeros(len(self.x))
+        self.ay = np.zeros(len(self.x))
+
+
+    @classmethod
+    def from_npy(cls, filename_minus, filename, m=1.0):
+        """
+        Load a ParticleSet from two (N, 2) arrays of x and y coordinates,
+        e.g., ParticleSet.from_npy("galaxies0.npy", "galaxies1.npy", m)
+
+        Parameters
+        ----------
+        filename_minus : str
+            .npy file of the coordinates at the previous timestep
+        filename : str
+            .npy file of the coordinates
+        m (optional) : float, np.ndarray
+            Masses of the particles
+        """
+        cminus = np.load(filename_minus)
+        c = np.load(filename)
+        return cls(m, cminus[:, 0], cminus[:, 1], c[:, 0], c[:, 1])
+
+
+    def __len__(self):
+        return len(self.x)
+
+
+    def __getitem__(self, index):
+        """ Return a ParticleView of a single particle """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Particle index out of range")
+        return ParticleView(self, index)
+
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ParticleView(self, index)
+
+
+    def verlet_step(self, h=1):
+        """
+        Take a Verlet step of every particle with the summed
+        accelerations, then zero the accelerations
+
+        Parameters
+        ----------
+        h : float
+            Timestep
+        """
+        # Update both the past and the current step in place, so that
+        # the arrays stay the same objects for anything viewing them
+        for c, cminus, a in [(self.x, self.xminus, self.ax), (self.y, self.yminus, self.ay)]:
+            new = 2*c - cminus + h**2 * a
+            cminus[:] = c
+            c[:] = new
+        self.ax[:] = 0.0
+        self.ay[:] = 0.0
+
+
+    def get_coords(self):
+        """ Return an (N, 2) array of the coordinates """
+        return np.stack([self.x, self.y], axis=1)
+
+
+    def to_particles(self):
+        """ Return a list of independent Particle objects """
+        return [Particle(i, self.m[i], Coordinate(self.xminus[i], self.yminus[i]),
+                         Coordinate(self.x[i], self.y[i])) for i in range(len(self))]
+
+
+
+class ParticleView:
+    """
+    View of a single particle in a ParticleSet with the Particle API.
+    Coordinates are read from and written to the arrays of the set, and
+    accelerations are summed directly into its ax and ay arrays.
+    """
+    __slots__ = ("particles", "index")
+
+    def __init__(self, particles, index):
+        self.particles = particles
+        self.index = index
+
+
+    def __eq__(self, other):
+        """ Equate solely by the index """
+        return self.index == other.index
+
+
+    @property
+    def m(self):
+        return self.particles.m[self.index]
+
+    @property
+    def c(self):
+        return Coordinate(self.particles.x[self.index], self.particles.y[self.index])
+
+    @c.setter
+    def c(self, coord):
+        self.particles.x[self.index] = coord.x
+        self.particles.y[self.index] = coord.y
+
+    @property
+    def cminus(self):
+        return Coordinate(self.particles.xminus[self.index], self.particles.yminus[self.index])
+
+    @cminus.setter
+    def cminus(self, coord):
+        self.particles.xminus[self.index] = coord.x
+        self.particles.yminus[self.index] = coord.y
+
+
+    def verlet_step(self, h=1):
+        """ Take a Verlet step of this particle only, see ParticleSet.verlet_step() """
+        p, i = self.particles, self.index
+        newx = 2*p.x[i] - p.xminus[i] + h**2 * p.ax[i]
+        newy = 2*p.y[i] - p.yminus[i] + h**2 * p.ay[i]
+        p.xminus[i], p.x[i] = p.x[i], newx
+        p.yminus[i], p.y[i] = p.y[i], newy
+        p.ax[i] = 0.0
+        p.ay[i] = 0.0
+
+
+    def add_accel(self, accel):
+        """ Add an acceleration, given as a Coordinate """
+        self.particles.ax[self.index] += accel.x
+        self.particles.ay[self.index] += accel.y
+
+
+    def add_accel_components(self, ax, ay):
+        """ Add an acceleration given as its x and y components """
+        self.particles.ax[self.index] += ax
+        self.particles.ay[self.index] += ay
 
 
     def get_index(self):
@@ -6,11 +6,84 @@ QuadTree code, separated from the main
 N-body integration code
 Note that the multiple recursive functions are not efficient
 as they are repetitive, but are not particularly designed for efficiency
+
+The tree is built by sorting rather than by repeatedly scanning the
+particle lists: every particle gets a Morton (Z-order) key, which
+interleaves the bits of its integer cell coordinates, so that the
+particles of any node are a contiguous range of the sorted keys. The
+keys are computed in one vectorized pass and sorted once, and each
+node splits its range into its four quadrants with a binary search,
+for O(N log N) construction. Cells are half-open, so that a particle
+on a boundary between quadrants is in exactly one of them.
+
+FlatQuadTree is the same tree stored as parallel arrays over the nodes
+rather than as a graph of QuadTree objects, and is walked with an
+explicit stack rather than by recursion.
 '''
 
-from particle import Particle
+import gc
+import math
+from bisect import bisect_left
+import numpy as np
+from particle import Particle, ParticleSet
 from coordinate import Coordinate
 
+
+# Bits per axis of the Morton keys, which limits the depth of the tree
+MORTON_BITS = 32
+
+
+def spread_bits(v):
+    """ Spread the lower 32 bits of v to the even bits of a uint64 """
+    v = v.astype(np.uint64)
+    for shift, mask in [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                        (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                        (1, 0x5555555555555555)]:
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def morton_keys(x, y, SWcoord, NEcoord, bits=MORTON_BITS):
+    """
+    Return the Morton keys of the points (x, y) in the box defined by
+    SWcoord and NEcoord, with the x bits in the even positions and the
+    y bits in the odd positions, so that each pair of bits numbers the
+    quadrants SW, SE, NW, NE as 0-3. Points on the NE edges are put in
+    the last cells.
+
+    Parameters
+    ----------
+    x, y : np.ndarray
+        Coordinates of the points
+    SWcoord: Coordinate
+        Coordinate of the SW corner of the box
+    NEcoord : Coordinate
+        Coordinate of the NE corner of the box
+    bits (optional) : int
+        Number of bits per axis, at most 32
+    """
+    ncells = 2**bits
+    ix = np.floor((x - SWcoord.x)/(NEcoord.x - SWcoord.x) * ncells)
+    iy = np.floor((y - SWcoord.y)/(NEcoord.y - SWcoord.y) * ncells)
+    ix = np.clip(ix, 0, ncells - 1)
+    iy = np.clip(iy, 0, ncells - 1)
+    return spread_bits(ix) | (spread_bits(iy) << np.uint64(1))
+
+
+def particle_arrays(particles):
+    """
+    Return arrays of the masses and x and y coordinates of a ParticleSet
+    or of a list of Particles
+    """
+    if isinstance(particles, ParticleSet):
+        return particles.m, particles.x, particles.y
+    coords = [particle.get_coord() for particle in particles]
+    m = np.array([particle.get_mass() for particle in particles], dtype=np.float64)
+    x = np.array([c.x for c in coords], dtype=np.float64)
+    y = np.array([c.y for c in coords], dtype=np.float64)
+    return m, x, y
+
+
 def members(SWcoord, NEcoord, particles):
     """
     Helper function:
@@ -55,10 +128,13 @@ class QuadTree:
         Coordinate of the SW corner of the box
     NEcoord : Coordinate
         Coordinate of the NE corner of the box
-    particles: list
-        list of Particles to subdivide on
+    particles: list, ParticleSet
+        list of Particles to subdivide on, or a ParticleSet
+    sort (optional) : bool
+        If True, build the tree from the sorted Morton keys, otherwise
+        recursively with members() as originally written
     """
-    def __init__(self, SWcoord, NEcoord, particles):
+    def __init__(self, SWcoord, NEcoord, particles, sort=True):
         self.SWcoord = SWcoord
         self.NEcoord = NEcoord
 
@@ -71,7 +147,80 @@ class QuadTree:
         self.total_mass = 0.0
         self.center_of_mass = Coordinate(0, 0) #potentially useless coordinate
 
-        self.subdivide(particles)
+        if sort:
+            self.build(particles)
+        else:
+            self.subdivide(particles)
+
+
+    def build(self, particles):
+        """
+        Build the tree from the sorted Morton keys of the particles.
+        Particles outside of the box are left out, as in subdivide().
+        """
+        _, x, y = particle_arrays(particles)
+        inside = np.flatnonzero((x >= self.SWcoord.x) & (x <= self.NEcoord.x) &
+                                (y >= self.SWcoord.y) & (y <= self.NEcoord.y))
+        keys = morton_keys(x[inside], y[inside], self.SWcoord, self.NEcoord)
+        order = np.argsort(keys, kind="stable")
+
+        # The nodes contain no reference cycles, so pause the garbage
+        # collector, which otherwise repeatedly scans all of the new nodes
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            # Python lists are faster than arrays for the per-node lookups
+            self._build_range(particles, inside[order].tolist(), keys[order].tolist(),
+                              0, len(order), 0)
+        finally:
+            if enabled:
+                gc.enable()
+
+
+    def _build_range(self, particles, indices, keys, start, end, level):
+        """
+        Fill in this node from the particles indices[start:end], whose
+        sorted keys agree in their first level quadrants
+        """
+        if end - start == 0:
+            return
+        elif end - start == 1:
+            self.particle = particles[indices[start]]
+            self.total_mass = self.particle.get_mass()
+            self.center_of_mass = self.particle.get_coord()
+            return
+        elif level == MORTON_BITS:
+            raise ValueError("Particles are too close together to separate: %s"%
+                             [particles[i].get_coord() for i in indices[start:end]])
+
+        # Split the range at the first key of each quadrant
+        shift = 2*(MORTON_BITS - 1 - level)
+        base = (keys[start] >> (shift + 2)) << (shift + 2)
+        bounds = [start] + [bisect_left(keys, base + (q << shift), start, end)
+                            for q in range(1, 4)] + [end]
+
+        x0, y0 = self.SWcoord.x, self.SWcoord.y
+        x1, y1 = self.NEcoord.x, self.NEcoord.y
+        xmid = (x0 + x1)/2.0
+        ymid = (y0 + y1)/2.0
+        corners = [(x0, y0, xmid, ymid), (xmid, y0, x1, ymid), #SW, SE
+                   (x0, ymid, xmid, y1), (xmid, ymid, x1, y1)] #NW, NE
+        children = list()
+        total_mass = comx = comy = 0.0
+        for q in range(4):
+            xa, ya, xb, yb = corners[q]
+            child = QuadTree(Coordinate(xa, ya), Coordinate(xb, yb), [], sort=False)
+            if bounds[q+1] > bounds[q]:
+                child._build_range(particles, indices, keys, bounds[q], bounds[q+1], level + 1)
+                total_mass += child.total_mass
+                comx += child.center_of_mass.x*child.total_mass
+                comy += child.center_of_mass.y*child.total_mass
+            children.append(child)
+        self.SW, self.SE, self.NW, self.NE = children
+
+        # Total mass and COM as in subdivide(), but without intermediate Coordinates
+        self.total_mass = total_mass
+        self.center_of_mass = Coordinate(comx/total_mass, comy/total_mass)
 
 
 
@@ -94,16 +243,16 @@ class QuadTree:
 
             # Determine NW box members, then make a new QuadTree
             NWmembers = members(self.SWcoord.addY(dy2), self.NEcoord.addX(-dx2), particles)
-            self.NW = QuadTree(self.SWcoord.addY(dy2), self.NEcoord.addX(-dx2), NWmembers)
+            self.NW = QuadTree(self.SWcoord.addY(dy2), self.NEcoord.addX(-dx2), NWmembers, sort=False)
             # Determine NE box members, then make a new QuadTree
             NEmembers = members(self.SWcoord.addX(dx2).addY(dy2), self.NEcoord, particles)
-            self.NE = QuadTree(self.SWcoord.addX(dx2).addY(dy2), self.NEcoord, NEmembers)
+            self.NE = QuadTree(self.SWcoord.addX(dx2).addY(dy2), self.NEcoord, NEmembers, sort=False)
             # Determine SW box members, then make a new QuadTree
             SWmembers = members(self.SWcoord, self.SWcoord.addX(dx2).addY(dy2), particles)
-            self.SW = QuadTree(self.SWcoord, self.SWcoord.addX(dx2).addY(dy2), SWmembers)
+            self.SW = QuadTree(self.SWcoord, self.SWcoord.addX(dx2).addY(dy2), SWmembers, sort=False)
             # Determine SE box members, then make a new QuadTree
             SWmembers = members(self.SWcoord.addX(dx2), self.NEcoord.addY(-dy2), particles)
-            self.SE = QuadTree(self.SWcoord.addX(dx2), self.NEcoord.addY(-dy2), SWmembers)
+            self.SE = QuadTree(self.SWcoord.addX(dx2), self.NEcoord.addY(-dy2), SWmembers, sort=False)
 
             # Calculate total mass and COM
             NWcom = self.NW.get_COM()
@@ -141,26 +290,27 @@ class QuadTree:
             if self.particle == comp_particle:
                 return
             M = self.particle.get_mass()
-            #distance = self.particle.get_separation(comp_particle)
-            dx = self.particle.get_coord().x - comp_particle.get_coord().x
-            dy = self.particle.get_coord().y - comp_particle.get_coord().y
-            ax = G*M/dx**2
-            ay = G*M/dy**2
-            comp_particle.add_accel(Coordinate(ax, ay))
+            c = comp_particle.get_coord()
+            dx = self.particle.get_coord().x - c.x
+            dy = self.particle.get_coord().y - c.y
+            # Inverse-square force along the separation vector
+            factor = G*M/(dx*dx + dy*dy)**1.5
+            comp_particle.add_accel_components(factor*dx, factor*dy)
         # there are sub-trees,
         elif self.NW is not None:
-            distance = self.get_center().get_distance(comp_particle.get_coord())
+            c = comp_particle.get_coord()
+            # Distance to the center of the cell, without intermediate Coordinates
+            distance = math.hypot((self.SWcoord.x + self.NEcoord.x)/2.0 - c.x,
+                                  (self.SWcoord.y + self.NEcoord.y)/2.0 - c.y)
             length = self.get_length()
             # theta is given, and threshold is met
-            if theta is not None and length/distance <= theta:
+            if theta is not None and length <= theta*distance:
                 M = self.total_mass
                 # redefine distance as to the COM
-                #distance = self.center_of_mass.get_distance(comp_particle.get_coord())
-                dx = self.center_of_mass.x - comp_particle.get_coord().x
-                dy = self.center_of_mass.y - comp_particle.get_coord().y
-                ax = G*M/dx**2
-                ay = G*M/dy**2
-                comp_particle.add_accel(Coordinate(ax, ay))
+                dx = self.center_of_mass.x - c.x
+                dy = self.center_of_mass.y - c.y
+                factor = G*M/(dx*dx + dy*dy)**1.5
+                comp_particle.add_accel_components(factor*dx, factor*dy)
             else:
                 self.NW.calc_acceleration(comp_particle, theta=theta, G=G)
                 self.NE.calc_acceleration(comp_particle, theta=theta, G=G)
@@ -240,3 +390,591 @@ class QuadTree:
                 return Coordinate(0, 0) #useless coordinate multiplied by 0 anyway
         else:
             return self.center_of_mass
+
+
+
+
+class FlatQuadTree:
+    """
+    Linearized quad-tree for the Barnes-Hut method
+
+    The nodes are numbered breadth first and stored in parallel arrays.
+    The four children of a node are consecutive, in the order SW, SE,
+    NW, NE, starting at child[node], which is -1 for a leaf. The
+    particles, sorted by their Morton keys, are also stored as arrays,
+    and the particles of any node are the range start[node]:end[node].
+    Between timesteps, update() re-bins only the particles that have
+    crossed cells, appending new nodes at the end of the arrays.
+
+    Parameters
+    ----------
+    SWcoord: Coordinate
+        Coordinate of the SW corner of the box
+    NEcoord : Coordinate
+        Coordinate of the NE corner of the box
+    particles: list, ParticleSet
+        list of Particles, or a ParticleSet
+    leaf_size (optional) : int
+        Maximum number of particles in a leaf
+
+    Attributes
+    ----------
+    child, start, end : np.ndarray
+        First child and particle range of each node
+    mass, comx, comy : np.ndarray
+        Total mass and center of mass of each node
+    cx, cy, size : np.ndarray
+        Center and side length of the cell of each node
+    lo, level, parent : np.ndarray
+        First Morton key of the cell, depth, and parent of each node
+    version : int
+        Incremented by every rebuild() and update()
+    order : np.ndarray
+        Indices of the particles in sorted order. Particles outside
+        of the box are left out.
+    m, x, y : np.ndarray
+        Masses and coordinates of the particles in sorted order
+    """
+    def __init__(self, SWcoord, NEcoord, particles, leaf_size=1):
+        self.SWcoord = SWcoord
+        self.NEcoord = NEcoord
+        self.leaf_size = leaf_size
+        self.rebuild(particles)
+
+
+    def rebuild(self, particles):
+        """ Build the tree from scratch """
+        m, x, y = particle_arrays(particles)
+        inside = np.flatnonzero((x >= self.SWcoord.x) & (x <= self.NEcoord.x) &
+                                (y >= self.SWcoord.y) & (y <= self.NEcoord.y))
+        keys = morton_keys(x[inside], y[inside], self.SWcoord, self.NEcoord)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.order = inside[order]
+        self.m = m[self.order]
+        self.x = x[self.order]
+        self.y = y[self.order]
+
+        # Position of each particle in the sorted order, -1 if outside the box
+        self.rank = np.full(len(x), -1, dtype=np.intp)
+        self.rank[self.order] = np.arange(len(self.order))
+
+        self.build()
+        self.n_built = len(self.child)
+        # Counts the changes to the tree, so that copies know when to refresh
+        self.version = getattr(self, "version", -1) + 1
+        self.buffers = dict()
+        self.compute_moments()
+
+
+    def build(self):
+        """
+        Build the node arrays one level at a time. At each level, the
+        nodes with too many particles are split at the first key of each
+        quadrant, found for all of them at once with np.searchsorted().
+        """
+        starts = [np.array([0])]
+        ends = [np.array([len(self.keys)])]
+        los = [np.zeros(1, dtype=np.uint64)]
+        cxs = [np.array([(self.SWcoord.x + self.NEcoord.x)/2.0])]
+        cys = [np.array([(self.SWcoord.y + self.NEcoord.y)/2.0])]
+        sizes = [np.array([self.NEcoord.y - self.SWcoord.y])] #assumes a square, as in QuadTree
+        parents = [np.full(1, -1, dtype=np.intp)]
+        levels = [np.zeros(1, dtype=np.intp)]
+        children = list()
+
+        n_nodes = 1
+        for level in range(MORTON_BITS + 1):
+            start, end = starts[-1], ends[-1]
+            split = np.flatnonzero(end - start > self.leaf_size)
+            if level == MORTON_BITS:
+                split = split[:0] #cannot split any further
+            first = n_nodes - len(start) #index of the first node of this level
+            child = np.full(len(start), -1, dtype=np.intp)
+            child[split] = n_nodes + 4*np.arange(len(split))
+            children.append(child)
+            if len(split) == 0:
+                break
+
+            shift = np.uint64(2*(MORTON_BITS - 1 - level))
+            lo = (los[-1][split, None] + (np.arange(4, dtype=np.uint64) << shift)[None, :])
+            bounds = np.searchsorted(self.keys, lo[:, 1:])
+            bounds = np.concatenate([start[split, None], bounds, end[split, None]], axis=1)
+            starts.append(bounds[:, :-1].ravel())
+            ends.append(bounds[:, 1:].ravel())
+            los.append(lo.ravel())
+            parents.append(np.repeat(first + split, 4))
+            levels.append(np.full(4*len(split), level + 1, dtype=np.intp))
+
+            # Quadrant q has x bit q & 1 and y bit q >> 1
+            q = np.arange(4)
+            quarter = sizes[-1][split, None]/4.0
+            cxs.append((cxs[-1][split, None] + (2*(q & 1) - 1)*quarter).ravel())
+            cys.append((cys[-1][split, None] + (2*(q >> 1) - 1)*quarter).ravel())
+            sizes.append(np.repeat(sizes[-1][split]/2.0, 4))
+            n_nodes += 4*len(split)
+
+        self.child = np.concatenate(children)
+        self.start = np.concatenate(starts)
+        self.end = np.concatenate(ends)
+        self.lo = np.concatenate(los)
+        self.level = np.concatenate(levels)
+        self.parent = np.concatenate(parents)
+        self.cx = np.concatenate(cxs)
+        self.cy = np.concatenate(cys)
+        self.size = np.concatenate(sizes)
+
+        # Internal nodes of each level, for the bottom-up and top-down passes
+        internal = np.flatnonzero(self.child >= 0)
+        self.internal = np.split(internal, np.cumsum(np.bincount(self.level[internal]))[:-1])
+
+        # The particle ranges of the leaves partition the sorted
+        # particles, so label each particle by its leaf in one pass
+        leaves = np.flatnonzero(self.child < 0)
+        leaves = leaves[np.argsort(self.start[leaves], kind="stable")]
+        self.leaf_of = np.repeat(leaves, self.end[leaves] - self.start[leaves])
+
+
+    def last_keys(self, nodes=slice(None)):
+        """ Return the last Morton key in the cells of the nodes, by default all """
+        level = self.level[nodes]
+        # The root covers all 2^64 keys, which does not fit in a shift
+        span = np.uint64(1) << (2*(MORTON_BITS - np.maximum(level, 1))).astype(np.uint64)
+        return self.lo[nodes] + np.where(level == 0, np.uint64(0xFFFFFFFFFFFFFFFF), span - np.uint64(1))
+
+
+    def compute_moments(self, dirty=None):
+        """
+        Compute the masses and centers of mass of the nodes bottom-up:
+        the leaves are summed over their particles at once with
+        np.bincount(), then each level, deepest first, is summed over
+        the children of its internal nodes
+
+        Parameters
+        ----------
+        dirty (optional) : np.ndarray
+            Boolean array of the nodes to recompute, which must include
+            all of the ancestors of any node in it. By default, all.
+        """
+        n_nodes = len(self.child)
+        for array in ["mass", "mx", "my", "comx", "comy"]:
+            if len(getattr(self, array, [])) != n_nodes:
+                setattr(self, array, np.zeros(n_nodes))
+        if dirty is None:
+            recompute = slice(None)
+            leaves = slice(None)
+            internal = self.internal
+            selected = slice(None)
+        else:
+            recompute = np.flatnonzero(dirty)
+            leaves = recompute[self.child[recompute] < 0]
+            internal = [nodes[dirty[nodes]] for nodes in self.internal]
+            selected = np.flatnonzero(dirty[self.leaf_of])
+
+        # The particles of each leaf are consecutive, so the leaves are
+        # summed over the runs of particles with the same leaf
+        leaf_of = self.leaf_of[selected]
+        runs = np.flatnonzero(np.diff(leaf_of, prepend=-1))
+        nodes = leaf_of[runs]
+        for array, weights in [(self.mass, self.m), (self.mx, self.m*self.x),
+                               (self.my, self.m*self.y)]:
+            array[leaves] = 0.0
+            if len(runs) > 0:
+                array[nodes] = np.add.reduceat(weights[selected], runs)
+
+        for nodes in internal[::-1]:
+            first = self.child[nodes]
+            for array in [self.mass, self.mx, self.my]:
+                array[nodes] = array[first] + array[first+1] + array[first+2] + array[first+3]
+
+        # Empty nodes have a zero mass and moments, and are given a zero
+        # center of mass. The nodes that are not recomputed keep theirs.
+        mass = np.maximum(self.mass[recompute], np.finfo(float).tiny)
+        self.comx[recompute] = self.mx[recompute]/mass
+        self.comy[recompute] = self.my[recompute]/mass
+        # Single particles are their own centers of mass exactly. All of
+        # the particles of the recomputed leaves are selected, so this
+        # covers every recomputed leaf with one particle.
+        single = np.diff(runs, append=len(leaf_of)) == 1
+        self.comx[leaf_of[runs[single]]] = self.x[selected][runs[single]]
+        self.comy[leaf_of[runs[single]]] = self.y[selected][runs[single]]
+
+
+    def descend(self, keys):
+        """ Return the leaves whose cells contain the given Morton keys """
+        nodes = np.zeros(len(keys), dtype=np.intp)
+        while True:
+            internal = np.flatnonzero(self.child[nodes] >= 0)
+            if len(internal) == 0:
+                return nodes
+            nodes[internal] = self.child_containing(nodes[internal], keys[internal])
+
+
+    def child_containing(self, nodes, keys):
+        """ Return the children of the internal nodes whose cells contain the keys """
+        shift = (2*(MORTON_BITS - 1 - self.level[nodes])).astype(np.uint64)
+        return self.child[nodes] + ((keys >> shift) & np.uint64(3)).astype(np.intp)
+
+
+    def compute_ranges(self):
+        """
+        Find the particle ranges of all of the nodes from the leaves of
+        the sorted particles: count the particles bottom-up, then place
+        the ranges of the children within that of their parent top-down
+        """
+        count = np.bincount(self.leaf_of, minlength=len(self.child))
+        for nodes in self.internal[::-1]:
+            first = self.child[nodes]
+            count[nodes] = count[first] + count[first+1] + count[first+2] + count[first+3]
+        self.start[0] = 0
+        for nodes in self.internal:
+            first = self.child[nodes]
+            self.start[first] = self.start[nodes]
+            for q in range(1, 4):
+                self.start[first+q] = self.start[first+q-1] + count[first+q-1]
+        self.end[:] = self.start + count
+
+
+    def split(self, nodes):
+        """ Append four empty children to each of the given leaves """
+        n_nodes = len(self.child)
+        first = n_nodes + 4*np.arange(len(nodes))
+        self.resize(n_nodes + 4*len(nodes))
+
+        new = slice(n_nodes, None)
+        q = np.arange(4)
+        shift = (2*(MORTON_BITS - 1 - self.level[nodes])).astype(np.uint64)
+        quarter = self.size[nodes, None]/4.0
+        self.child[nodes] = first
+        self.child[new] = -1
+        self.lo[new] = (self.lo[nodes, None] + (q.astype(np.uint64)[None, :] << shift[:, None])).ravel()
+        self.level[new] = np.repeat(self.level[nodes] + 1, 4)
+        self.parent[new] = np.repeat(nodes, 4)
+        self.cx[new] = (self.cx[nodes, None] + (2*(q & 1) - 1)*quarter).ravel()
+        self.cy[new] = (self.cy[nodes, None] + (2*(q >> 1) - 1)*quarter).ravel()
+        self.size[new] = np.repeat(self.size[nodes]/2.0, 4)
+        for level in np.unique(self.level[nodes]):
+            if level == len(self.internal):
+                self.internal.append(nodes[:0])
+            self.internal[level] = np.concatenate([self.internal[level],
+                                                   nodes[self.level[nodes] == level]])
+
+
+    def resize(self, n_nodes):
+        """
+        Resize the node arrays, which are views of buffers with room to
+        grow so that appending nodes does not copy all of the arrays
+        """
+        names = ["child", "start", "end", "lo", "level", "parent",
+                 "cx", "cy", "size", "mass", "mx", "my", "comx", "comy"]
+        if len(self.buffers.get("child", [])) < n_nodes:
+            capacity = max(2*n_nodes, 1024)
+            for name in names:
+                array = getattr(self, name)
+                buffer = np.zeros(capacity, dtype=array.dtype)
+                buffer[:len(array)] = array
+                self.buffers[name] = buffer
+        for name in names:
+            setattr(self, name, self.buffers[name][:n_nodes])
+
+
+    def update(self, particles, rebuild_fraction=0.05, max_growth=0.25):
+        """
+        Update the tree for new positions (and masses) of the same particles
+
+        Only the particles that have crossed the boundary of their leaf's
+        cell (or entered or left the box) are re-binned: each is walked
+        down from the root to its new leaf, and leaves that become too
+        full are split. The moments are then recomputed only for the
+        leaves whose particles changed and their ancestors. Leaves that
+        empty are not merged, so the tree is rebuilt from scratch
+        instead when its quality degrades, i.e., when too many particles
+        cross cells in one update or the tree has grown too much.
+
+        The keys, the sort, and the particle ranges of the nodes are
+        still redone for all of the particles, so the saving is modest:
+        as measured with benchmarks/bench_tree_update.py at N = 1e4-1e5,
+        an update is about 1.4-1.7 times faster than a rebuild when all
+        of the particles move, and 2.5-3.3 times when 1% of them do.
+
+        Parameters
+        ----------
+        particles : list, ParticleSet
+            The particles given when the tree was built, in the same order
+        rebuild_fraction (optional) : float
+            Rebuild if more than this fraction of the particles are re-binned
+        max_growth (optional) : float
+            Rebuild if the number of nodes has grown by more than this
+            fraction since the last rebuild
+
+        Returns
+        -------
+        rebuilt : bool
+            Whether the tree was rebuilt from scratch
+        """
+        m, x, y = particle_arrays(particles)
+        if len(x) != len(self.rank):
+            self.rebuild(particles)
+            return True
+        inside = ((x >= self.SWcoord.x) & (x <= self.NEcoord.x) &
+                  (y >= self.SWcoord.y) & (y <= self.NEcoord.y))
+        keys = morton_keys(x, y, self.SWcoord, self.NEcoord)
+
+        # Classify the particles currently in the tree
+        stays = inside[self.order]
+        new_keys = keys[self.order]
+        in_leaf = stays & (new_keys >= self.lo[self.leaf_of]) & \
+                  (new_keys <= self.last_keys(self.leaf_of))
+        entering = np.flatnonzero(inside & (self.rank < 0))
+        n_rebin = len(self.order) - np.count_nonzero(in_leaf) + len(entering)
+        if (n_rebin > rebuild_fraction*len(self.order) or
+            len(self.child) > (1 + max_growth)*self.n_built):
+            self.rebuild(particles)
+            return True
+
+        changed = ~in_leaf | (x[self.order] != self.x) | (y[self.order] != self.y) | \
+                  (m[self.order] != self.m)
+        dirty_leaves = [self.leaf_of[changed]]
+
+        order = np.concatenate([self.order[stays], entering])
+        leaf_of = np.concatenate([self.leaf_of[stays], np.zeros(len(entering), dtype=np.intp)])
+        if n_rebin > 0:
+            # Walk the re-binned particles down to their new leaves
+            moving = np.flatnonzero(np.concatenate([~in_leaf[stays],
+                                                    np.ones(len(entering), dtype=bool)]))
+            leaf_of[moving] = self.descend(keys[order[moving]])
+            dirty_leaves.append(leaf_of[moving])
+
+            # Split any leaves that have become too full, following only
+            # the particles in them down the new levels
+            counts = np.bincount(leaf_of, minlength=len(self.child))
+            full = np.flatnonzero((counts > self.leaf_size) & (self.child < 0) &
+                                  (self.level < MORTON_BITS))
+            splitting = np.arange(len(leaf_of))
+            while len(full) > 0:
+                n_nodes = len(self.child)
+                self.split(full)
+                is_full = np.zeros(n_nodes, dtype=bool)
+                is_full[full] = True
+                splitting = splitting[is_full[leaf_of[splitting]]]
+                leaf_of[splitting] = self.child_containing(leaf_of[splitting],
+                                                           keys[order[splitting]])
+                counts = np.bincount(leaf_of[splitting] - n_nodes, minlength=4*len(full))
+                full = n_nodes + np.flatnonzero((counts > self.leaf_size) &
+                                                (self.level[n_nodes:] < MORTON_BITS))
+                dirty_leaves.append(np.arange(n_nodes, len(self.child)))
+
+        # Re-sort, which is cheap since most particles are in order (and
+        # only move within their leaves if none were re-binned)
+        resort = np.argsort(keys[order], kind="stable")
+        self.order = order[resort]
+        self.leaf_of = leaf_of[resort]
+        self.keys = keys[self.order]
+        self.rank[:] = -1
+        self.rank[self.order] = np.arange(len(self.order))
+        if n_rebin > 0:
+            self.compute_ranges()
+        self.m = m[self.order]
+        self.x = x[self.order]
+        self.y = y[self.order]
+
+        # Mark the changed leaves and all of their ancestors, unless most
+        # have changed, as when all of the particles have moved
+        dirty = None
+        if np.count_nonzero(changed) < len(changed)/4:
+            dirty = np.zeros(len(self.child), dtype=bool)
+            nodes = np.unique(np.concatenate(dirty_leaves))
+            while len(nodes) > 0:
+                dirty[nodes] = True
+                nodes = self.parent[nodes]
+                nodes = np.unique(nodes[nodes >= 0])
+                nodes = nodes[~dirty[nodes]]
+        self.compute_moments(dirty)
+        self.version += 1
+        return False
+
+
+    def calc_acceleration(self, index, theta=None, G=6.67e-11):
+        """
+        Return the acceleration of a particle, walking the tree with an
+        explicit stack
+
+        Parameters
+        ----------
+        index : int
+            Index of the particle, as in the particles given
+        theta : float
+            If given, perform a threshold on length/distance
+            If length/distance <= theta, just use the COM acceleration
+            Else continue to open the node
+        G : float
+            Gravitational constant to use. Defaults to SI units
+
+        Returns
+        -------
+        ax, ay : float
+            Components of the acceleration, zero for a particle outside
+            of the box, as in accelerations()
+        """
+        rank = self.rank[index]
+        if rank < 0:
+            return 0.0, 0.0
+        px = self.x[rank]
+        py = self.y[rank]
+        child, start, end = self.child, self.start, self.end
+        ax = ay = 0.0
+
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self.mass[node] == 0:
+                continue
+            first = child[node]
+            if first < 0: #leaf, sum over its particles
+                for j in range(start[node], end[node]):
+                    if j == rank:
+                        continue
+                    dx = self.x[j] - px
+                    dy = self.y[j] - py
+                    r3 = (dx*dx + dy*dy)**1.5
+                    ax += G*self.m[j]*dx/r3
+                    ay += G*self.m[j]*dy/r3
+                continue
+            distance = np.hypot(self.cx[node] - px, self.cy[node] - py)
+            if theta is not None and self.size[node] <= theta*distance:
+                dx = self.comx[node] - px
+                dy = self.comy[node] - py
+                r3 = (dx*dx + dy*dy)**1.5
+                ax += G*self.mass[node]*dx/r3
+                ay += G*self.mass[node]*dy/r3
+            else:
+                stack.extend(range(first, first + 4))
+        return ax, ay
+
+
+    def accelerations(self, theta=None, G=6.67e-11, block_size=1024, full_output=False,
+                      softening=0.0):
+        """
+        Return the accelerations of all of the particles, walking the
+        tree for a block of target particles at once
+
+        The walk is breadth first over an array of (target, node) pairs.
+        At each step, the pairs whose nodes pass the opening criterion
+        (or are leaves) are summed into the accelerations with masks,
+        and the rest are replaced by the pairs of the target with the
+        node's four children. Targets are taken in Morton order, so that
+        the targets of a block are close together and open similar nodes.
+
+        Parameters
+        ----------
+        theta : float
+            If given, perform a threshold on length/distance
+            If length/distance <= theta, just use the COM acceleration
+            Else continue to open the node
+        G : float
+            Gravitational constant to use. Defaults to SI units
+        block_size (optional) : int
+            Number of target particles walked at once. The memory used
+            by the pairs scales with it, but is not bounded by it: each
+            level holds up to block_size times the number of nodes that
+            a target opens on that level, which is small for a typical
+            theta but grows to the number of particles without one.
+        full_output (optional) : bool
+            If True, also return a dictionary with the total number of
+            "interactions" (particle-particle and particle-node pairs)
+        softening (optional) : float
+            Plummer softening length, added in quadrature to distances
+
+        Returns
+        -------
+        ax, ay : np.ndarray
+            Components of the accelerations, in the order of the
+            particles given. Particles outside of the box are zero.
+        """
+        n = len(self.keys)
+        ax = np.zeros(n)
+        ay = np.zeros(n)
+        interactions = self.accumulate_accelerations(0, n, ax, ay, theta=theta, G=G,
+                                                     block_size=block_size, softening=softening)
+
+        # Back to the order of the particles given
+        ax_out = np.zeros(len(self.rank))
+        ay_out = np.zeros(len(self.rank))
+        ax_out[self.order] = ax
+        ay_out[self.order] = ay
+        if full_output:
+            return ax_out, ay_out, {"interactions": interactions}
+        return ax_out, ay_out
+
+
+    def accumulate_accelerations(self, first, last, ax, ay, theta=None, G=6.67e-11,
+                                 block_size=1024, softening=0.0):
+        """
+        Add the accelerations of the sorted particles first:last into
+        ax and ay, as in accelerations(). The result for each particle
+        does not depend on the range or blocks that it is walked in.
+
+        Parameters
+        ----------
+        first, last : int
+            Range of the target particles, in sorted order
+        ax, ay : np.ndarray
+            Arrays of length last - first to add the accelerations to
+        theta, G, block_size, softening (optional) :
+            See accelerations()
+
+        Returns
+        -------
+        interactions : int
+            Number of particle-particle and particle-node pairs summed
+        """
+        interactions = 0
+        for block in range(first, last, block_size):
+            targets = np.arange(block, min(block + block_size, last))
+            # Preallocated accumulators for this block of targets
+            bax = ax[block - first:block - first + len(targets)]
+            bay = ay[block - first:block - first + len(targets)]
+            nodes = np.zeros(len(targets), dtype=np.intp)
+            while len(targets) > 0:
+                keep = self.mass[nodes] > 0
+                targets, nodes = targets[keep], nodes[keep]
+
+                # Leaves: pair each target with each particle in the leaf
+                leaf = self.child[nodes] < 0
+                t, counts = targets[leaf], self.end[nodes[leaf]] - self.start[nodes[leaf]]
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                j = np.repeat(self.start[nodes[leaf]], counts) + offsets
+                t = np.repeat(t, counts)
+                other = j != t
+                t, j = t[other], j[other]
+                interactions += self._accumulate(bax, bay, block, t, self.x[j], self.y[j],
+                                                 self.m[j], G, softening)
+
+                # Internal nodes: accept the COM or open the node
+                t, nodes = targets[~leaf], nodes[~leaf]
+                if theta is not None:
+                    distance = np.hypot(self.cx[nodes] - self.x[t], self.cy[nodes] - self.y[t])
+                    accept = self.size[nodes] <= theta*distance
+                    a = nodes[accept]
+                    interactions += self._accumulate(bax, bay, block, t[accept], self.comx[a],
+                                                     self.comy[a], self.mass[a], G, softening)
+                    t, nodes = t[~accept], nodes[~accept]
+                targets = np.repeat(t, 4)
+                nodes = (self.child[nodes][:, None] + np.arange(4)[None, :]).ravel()
+        return interactions
+
+
+    def _accumulate(self, ax, ay, block, t, x, y, m, G, softening=0.0):
+        """
+        Add the accelerations of the targets t, numbered from block,
+        due to the masses m at (x, y) into the block's ax and ay arrays,
+        and return the number of interactions
+        """
+        dx = x - self.x[t]
+        dy = y - self.y[t]
+        r2 = dx*dx + dy*dy + softening*softening
+        factor = G*m/(r2*np.sqrt(r2))
+        # np.bincount() sums over the repeated targets
+        ax += np.bincount(t - block, weights=factor*dx, minlength=len(ax))
+        ay += np.bincount(t - block, weights=factor*dy, minlength=len(ay))
+        return len(t)
@@ -0,0 +1,108 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Unit tests for the direct summation
+"""
+
+import unittest
+import sys
+import tracemalloc
+sys.path.append("../") #lazy but it works
+import numpy as np
+from coordinate import Coordinate
+from particle import ParticleSet
+from quadtree import FlatQuadTree
+import direct
+from direct import direct_accelerations, accuracy_report
+
+
+
+class TestDirect(unittest.TestCase):
+    """ Unit tester for direct.py """
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.particles = ParticleSet(rng.uniform(1, 2, 300), *rng.uniform(0, 10, (4, 300)))
+        self.SWcoord = Coordinate(0, 0)
+        self.NEcoord = Coordinate(10, 10)
+
+    def test_direct(self):
+        """ Test the tiles against the full matrix of pairs, with softening """
+        p = self.particles
+        dx = p.x[None, :] - p.x[:, None]
+        dy = p.y[None, :] - p.y[:, None]
+        for softening in [0.0, 0.5]:
+            r3 = (dx**2 + dy**2 + softening**2)**1.5
+            np.fill_diagonal(r3, np.inf)
+            ax, ay = (2.0*p.m*dx/r3).sum(axis=1), (2.0*p.m*dy/r3).sum(axis=1)
+            for tile_size in [1, 64, 300, 1000]:
+                result = direct_accelerations(p, G=2.0, softening=softening, tile_size=tile_size)
+                self.assertTrue(np.allclose(result, (ax, ay)))
+            # The tree without theta sums the same pairs
+            tree = FlatQuadTree(self.SWcoord, self.NEcoord, p)
+            self.assertTrue(np.allclose(tree.accelerations(G=2.0, softening=softening), (ax, ay)))
+        # A list of Particles works too
+        self.assertTrue(np.allclose(direct_accelerations(p.to_particles(), G=2.0,
+                                                         softening=0.5), (ax, ay)))
+
+    def test_memory(self):
+        """ Test that the memory used is bounded by the tile size """
+        x, y = np.random.default_rng(0).random((2, 3000))
+        particles = ParticleSet(1.0, x, y, x, y)
+        tracemalloc.start()
+        direct_accelerations(particles, tile_size=128)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # A few 128x128 tiles, rather than 3000x3000 pairs (72 MB)
+        self.assertLess(peak, 2000000)
+
+    def test_crossover(self):
+        """ Test that the engine switches to the tree at the given crossover """
+        exact = direct_accelerations(self.particles, G=1.0)
+        result = direct.accelerations(self.particles, self.SWcoord, self.NEcoord,
+                                      theta=0.5, G=1.0, crossover=301)
+        self.assertTrue(np.array_equal(result, exact))
+        result = direct.accelerations(self.particles, self.SWcoord, self.NEcoord,
+                                      theta=0.5, G=1.0, crossover=300)
+        tree = FlatQuadTree(self.SWcoord, self.NEcoord, self.particles)
+        self.assertTrue(np.array_equal(result, tree.accelerations(theta=0.5, G=1.0)))
+        # With theta = 0, the tree opens every node, so both are exact
+        for crossover in [300, 301]:
+            result = direct.accelerations(self.particles, self.SWcoord, self.NEcoord,
+                                          theta=0.0, G=1.0, softening=0.1, crossover=crossover)
+            self.assertTrue(np.allclose(result, direct_accelerations(self.particles, G=1.0,
+                                                                     softening=0.1)))
+        # The default does not depend on timings
+        self.assertEqual(direct.CROSSOVER, 1024)
+        self.assertTrue(np.array_equal(direct.accelerations(self.particles, self.SWcoord,
+                                                            self.NEcoord, G=1.0), exact))
+
+    def test_accuracy_report(self):
+        """ Test that the errors grow with theta """
+        rows = accuracy_report(self.particles, self.SWcoord, self.NEcoord,
+                               thetas=[0.0, 0.3, 1.0], percentiles=[50, 99])
+        self.assertEqual([row["theta"] for row in rows], [0.0, 0.3, 1.0])
+        self.assertLess(rows[0]["max"], 1e-12) #every node opened
+        self.assertEqual(rows[0]["interactions"], 299)
+        self.assertLess(rows[1]["p99"], 0.05)
+        for row in rows:
+            self.assertLessEqual(row["p50"], row["p99"])
+            self.assertLessEqual(row["p99"], row["max"])
+        self.assertLess(rows[1]["rms"], rows[2]["rms"])
+        self.assertLess(rows[2]["interactions"], rows[1]["interactions"])
+
+        # A particle with no net force and one outside of the box
+        x = np.array([1.0, 5.0, 9.0, 5.0, 5.0, 12.0])
+        y = np.array([5.0, 5.0, 5.0, 1.0, 9.0, 5.0])
+        particles = ParticleSet(1.0, x, y, x, y)
+        rows = accuracy_report(particles, self.SWcoord, self.NEcoord, thetas=[0.0, 1.0])
+        for row in rows:
+            self.assertTrue(all(np.isfinite(value) for value in row.values()))
+        self.assertEqual(rows[0]["interactions"], 4)
+        self.assertLess(rows[0]["max"], 1e-12)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
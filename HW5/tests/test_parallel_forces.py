@@ -0,0 +1,85 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Unit tests for the parallel force evaluation
+"""
+
+import unittest
+import os
+import sys
+sys.path.append("../") #lazy but it works
+import numpy as np
+from coordinate import Coordinate
+from particle import ParticleSet
+from quadtree import FlatQuadTree
+from parallel_forces import ParallelForces
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
+
+
+
+class TestParallelForces(unittest.TestCase):
+    """ Unit tester for parallel_forces.py """
+
+    def setUp(self):
+        self.particles = ParticleSet.from_npy(os.path.join(DIRECTORY, "galaxies0.npy"),
+                                              os.path.join(DIRECTORY, "galaxies1.npy"), m=1e12)
+        self.tree = FlatQuadTree(Coordinate(0, 0), Coordinate(10, 10), self.particles)
+
+    def test_accelerations(self):
+        """ Test that the result is identical to the serial walk for any pool """
+        for theta in [None, 0.5]:
+            ax, ay, info = self.tree.accelerations(theta=theta, block_size=64, full_output=True)
+            for processes, chunks_per_process in [(1, 1), (2, 3), (3, 7)]:
+                with ParallelForces(processes, chunks_per_process, block_size=50) as forces:
+                    pax, pay, pinfo = forces.accelerations(self.tree, theta=theta,
+                                                           full_output=True)
+                self.assertTrue(np.array_equal(pax, ax))
+                self.assertTrue(np.array_equal(pay, ay))
+                self.assertEqual(pinfo["interactions"], info["interactions"])
+
+        # With softening, as in the serial walk
+        ax, ay = self.tree.accelerations(theta=0.5, softening=0.05)
+        with ParallelForces(2) as forces:
+            pax, pay = forces.accelerations(self.tree, theta=0.5, softening=0.05)
+        self.assertTrue(np.array_equal(pax, ax))
+        self.assertTrue(np.array_equal(pay, ay))
+        self.assertFalse(np.allclose(ax, self.tree.accelerations(theta=0.5)[0]))
+
+    def test_steps(self):
+        """ Test adding into the particles in place as the tree changes """
+        with ParallelForces(2) as forces:
+            for step in range(3):
+                ax, ay = self.tree.accelerations(theta=0.5)
+                forces.accelerations(self.tree, theta=0.5, ax=self.particles.ax,
+                                     ay=self.particles.ay)
+                self.assertTrue(np.array_equal(self.particles.ax, ax))
+                self.assertTrue(np.array_equal(self.particles.ay, ay))
+                self.particles.verlet_step(h=1e6)
+                self.tree.update(self.particles)
+
+            # The block is kept, and rewritten only when the tree changes
+            forces.accelerations(self.tree, theta=0.5)
+            name = forces.shm.name
+            copies = forces.copies
+            forces.accelerations(self.tree, theta=0.5)
+            self.assertEqual(forces.copies, copies)
+            self.tree.update(self.particles)
+            forces.accelerations(self.tree, theta=0.5)
+            self.assertEqual(forces.copies, copies + 1)
+            self.assertEqual(forces.shm.name, name)
+
+            # A larger tree is given a new shared block
+            x, y = np.random.default_rng(0).uniform(0, 10, (2, 2000))
+            tree = FlatQuadTree(Coordinate(0, 0), Coordinate(10, 10),
+                                ParticleSet(1.0, x, y, x, y))
+            self.assertTrue(np.array_equal(forces.accelerations(tree, G=1.0),
+                                           tree.accelerations(G=1.0)))
+            self.assertNotEqual(forces.shm.name, name)
+        self.assertIsNone(forces.shm)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
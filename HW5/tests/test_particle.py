@@ -0,0 +1,96 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Unit tests for the particle classes
+"""
+
+import unittest
+import os
+import sys
+sys.path.append("../") #lazy but it works
+import numpy as np
+from coordinate import Coordinate
+from particle import ParticleSet
+from quadtree import QuadTree
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../")
+
+
+
+class TestParticleSet(unittest.TestCase):
+    """ Unit tester for ParticleSet in particle.py """
+
+    def setUp(self):
+        self.particles = ParticleSet.from_npy(os.path.join(DIRECTORY, "galaxies0.npy"),
+                                              os.path.join(DIRECTORY, "galaxies1.npy"), m=1e12)
+
+    def test_load(self):
+        """ Test loading the galaxy files into contiguous arrays """
+        c = np.load(os.path.join(DIRECTORY, "galaxies1.npy"))
+        self.assertEqual(len(self.particles), 655)
+        self.assertTrue(np.array_equal(self.particles.get_coords(), c))
+        for array in [self.particles.m, self.particles.x, self.particles.y,
+                      self.particles.xminus, self.particles.yminus,
+                      self.particles.ax, self.particles.ay]:
+            self.assertEqual(array.dtype, np.float64)
+            self.assertTrue(array.flags["C_CONTIGUOUS"])
+        self.assertTrue(np.all(self.particles.m == 1e12))
+
+    def test_view(self):
+        """ Test that views read and write the arrays """
+        p = self.particles[3]
+        self.assertEqual(p.get_index(), 3)
+        self.assertEqual(p.get_mass(), 1e12)
+        self.assertEqual(p.get_coord(), Coordinate(self.particles.x[3], self.particles.y[3]))
+        self.assertEqual(self.particles[-1].get_index(), 654)
+        with self.assertRaises(IndexError):
+            self.particles[655]
+
+        p.add_accel(Coordinate(1.0, 2.0))
+        p.add_accel(Coordinate(1.0, 2.0))
+        self.assertEqual((self.particles.ax[3], self.particles.ay[3]), (2.0, 4.0))
+
+        p.c = Coordinate(1.0, 2.0)
+        self.assertEqual((self.particles.x[3], self.particles.y[3]), (1.0, 2.0))
+
+        # The views work with the QuadTree
+        tree = QuadTree(Coordinate(0, 0), Coordinate(10, 10), list(self.particles))
+        self.assertAlmostEqual(tree.get_mass(), 655e12)
+
+    def test_verlet_step(self):
+        """ Test the vectorized step against the Particle objects """
+        objects = self.particles.to_particles()
+        rng = np.random.default_rng(0)
+        ax, ay = rng.normal(size=(2, len(self.particles)))
+        self.particles.ax[:] = ax
+        self.particles.ay[:] = ay
+        arrays = [self.particles.x, self.particles.y, self.particles.xminus,
+                  self.particles.yminus]
+        x, y = self.particles.x.copy(), self.particles.y.copy()
+        self.particles.verlet_step(h=0.5)
+        # The arrays are updated in place
+        for array, name in zip(arrays, ["x", "y", "xminus", "yminus"]):
+            self.assertIs(getattr(self.particles, name), array)
+        self.assertTrue(np.array_equal(self.particles.xminus, x))
+        self.assertTrue(np.array_equal(self.particles.yminus, y))
+        for i, particle in enumerate(objects):
+            particle.add_accel(Coordinate(ax[i], ay[i]))
+            particle.verlet_step(h=0.5)
+            self.assertAlmostEqual(particle.c.x, self.particles.x[i])
+            self.assertAlmostEqual(particle.c.y, self.particles.y[i])
+            self.assertAlmostEqual(particle.cminus.x, self.particles.xminus[i])
+        self.assertTrue(np.all(self.particles.ax == 0))
+
+        # A single view steps the same way
+        view = self.particles[0]
+        view.add_accel(Coordinate(ax[0], ay[0]))
+        view.verlet_step(h=0.5)
+        objects[0].add_accel(Coordinate(ax[0], ay[0]))
+        objects[0].verlet_step(h=0.5)
+        self.assertEqual(view.get_coord(), objects[0].get_coord())
+
+
+
+if __name__ == '__main__':
+    unittest.main()
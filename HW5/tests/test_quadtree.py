@@ -0,0 +1,267 @@
+"""
+Michael Lam
+ASTP-720, Fall 2020
+
+Unit tests for the QuadTree
+"""
+
+import unittest
+import sys
+import tracemalloc
+sys.path.append("../") #lazy but it works
+import numpy as np
+from coordinate import Coordinate
+from particle import Particle, ParticleSet
+from quadtree import QuadTree, FlatQuadTree, morton_keys
+
+
+def direct_accelerations(particles, G=1.0):
+    """ Accelerations of all of the particles by direct summation """
+    dx = particles.x[None, :] - particles.x[:, None]
+    dy = particles.y[None, :] - particles.y[:, None]
+    r3 = (dx**2 + dy**2)**1.5
+    np.fill_diagonal(r3, np.inf)
+    return (G*particles.m*dx/r3).sum(axis=1), (G*particles.m*dy/r3).sum(axis=1)
+
+
+def leaves(tree):
+    """ Return the list of particle indices in the leaves of a tree """
+    if tree.particle is not None:
+        return [tree.particle.get_index()]
+    elif tree.NW is not None:
+        return leaves(tree.NW) + leaves(tree.NE) + leaves(tree.SW) + leaves(tree.SE)
+    return []
+
+
+
+class TestQuadTree(unittest.TestCase):
+    """ Unit tester for quadtree.py """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.particles = ParticleSet(rng.uniform(1, 2, 500), *rng.uniform(0, 10, (4, 500)))
+        self.SWcoord = Coordinate(0, 0)
+        self.NEcoord = Coordinate(10, 10)
+
+    def test_morton_keys(self):
+        """ Test the interleaving and the quadrant order """
+        x = np.array([1.0, 6.0, 1.0, 6.0, 10.0])
+        y = np.array([1.0, 1.0, 6.0, 6.0, 10.0])
+        keys = morton_keys(x, y, self.SWcoord, self.NEcoord, bits=2)
+        # SW, SE, NW, NE quadrants, then the NE corner in the last cell
+        self.assertEqual(keys.tolist(), [0, 4, 8, 12, 15])
+
+    def test_build(self):
+        """ Test the sorted build against the original recursive build """
+        objects = self.particles.to_particles()
+        tree = QuadTree(self.SWcoord, self.NEcoord, objects)
+        reference = QuadTree(self.SWcoord, self.NEcoord, objects, sort=False)
+        self.assertAlmostEqual(tree.get_mass(), reference.get_mass())
+        self.assertAlmostEqual(tree.get_COM().x, reference.get_COM().x)
+        self.assertAlmostEqual(tree.get_COM().y, reference.get_COM().y)
+        self.assertAlmostEqual(tree.NW.get_mass(), reference.NW.get_mass())
+        self.assertAlmostEqual(tree.SE.get_COM().x, reference.SE.get_COM().x)
+        self.assertEqual(sorted(leaves(tree)), list(range(500)))
+
+        # The same tree from the ParticleSet directly
+        tree = QuadTree(self.SWcoord, self.NEcoord, self.particles)
+        self.assertAlmostEqual(tree.get_mass(), reference.get_mass())
+        self.assertEqual(sorted(leaves(tree)), list(range(500)))
+
+    def test_acceleration(self):
+        """ Regression test of the forces and Verlet step against direct summation """
+        objects = self.particles.to_particles()
+        ax, ay = direct_accelerations(self.particles, G=2.0)
+        tree = QuadTree(self.SWcoord, self.NEcoord, objects)
+        for particle in objects:
+            tree.calc_acceleration(particle, G=2.0)
+        self.assertTrue(np.allclose([p.ax for p in objects], ax))
+        self.assertTrue(np.allclose([p.ay for p in objects], ay))
+
+        # With theta, the approximation is close
+        objects[7].ax = objects[7].ay = 0.0
+        tree.calc_acceleration(objects[7], theta=0.3, G=2.0)
+        self.assertLess(np.hypot(objects[7].ax - ax[7], objects[7].ay - ay[7]),
+                        0.02*np.hypot(ax[7], ay[7]))
+        objects[7].ax, objects[7].ay = ax[7], ay[7]
+
+        # The accelerations are summed, not averaged
+        for particle in objects:
+            particle.verlet_step(h=0.01)
+        self.particles.ax[:] = ax
+        self.particles.ay[:] = ay
+        self.particles.verlet_step(h=0.01)
+        self.assertTrue(np.allclose([p.c.x for p in objects], self.particles.x))
+        self.assertTrue(np.allclose([p.c.y for p in objects], self.particles.y))
+        self.assertEqual(objects[0].ax, 0.0)
+
+    def test_acceleration_memory(self):
+        """ Test that accumulating accelerations does not allocate memory """
+        objects = self.particles.to_particles()
+        tree = QuadTree(self.SWcoord, self.NEcoord, objects)
+        tree.calc_acceleration(objects[0]) #warm up
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        for particle in objects[:100]:
+            tree.calc_acceleration(particle)
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # 100*499 interactions, which used to keep a Coordinate each (~5 MB)
+        self.assertLess(after - before, 100000)
+
+    def test_boundaries(self):
+        """ Test that boundary particles are in exactly one leaf """
+        objects = [Particle(0, 1.0, None, Coordinate(5, 5)), #center of the box
+                   Particle(1, 1.0, None, Coordinate(2.5, 7)),
+                   Particle(2, 1.0, None, Coordinate(10, 10)), #NE corner
+                   Particle(3, 1.0, None, Coordinate(11, 5))] #outside of the box
+        tree = QuadTree(self.SWcoord, self.NEcoord, objects)
+        self.assertEqual(sorted(leaves(tree)), [0, 1, 2])
+        self.assertEqual(tree.get_mass(), 3.0)
+        # The original build counts the center particle in all four
+        # quadrants, and the other on a boundary of the NW quadrant twice
+        reference = QuadTree(self.SWcoord, self.NEcoord, objects, sort=False)
+        self.assertEqual(sorted(leaves(reference)), [0, 0, 0, 0, 1, 1, 2])
+
+        with self.assertRaises(ValueError):
+            QuadTree(self.SWcoord, self.NEcoord, objects[:1] + objects[:1])
+
+
+
+class TestFlatQuadTree(unittest.TestCase):
+    """ Unit tester for FlatQuadTree in quadtree.py """
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.particles = ParticleSet(rng.uniform(1, 2, 500), *rng.uniform(0, 10, (4, 500)))
+        self.SWcoord = Coordinate(0, 0)
+        self.NEcoord = Coordinate(10, 10)
+
+    def test_moments(self):
+        """ Test the node arrays against the QuadTree objects """
+        flat = FlatQuadTree(self.SWcoord, self.NEcoord, self.particles)
+        tree = QuadTree(self.SWcoord, self.NEcoord, self.particles)
+        self.assertAlmostEqual(flat.mass[0], tree.get_mass())
+        self.assertAlmostEqual(flat.comx[0], tree.get_COM().x)
+        # Children are SW, SE, NW, NE
+        first = flat.child[0]
+        for i, node in enumerate([tree.SW, tree.SE, tree.NW, tree.NE]):
+            self.assertAlmostEqual(flat.mass[first+i], node.get_mass())
+            self.assertAlmostEqual(flat.comy[first+i], node.get_COM().y)
+            self.assertAlmostEqual(flat.cx[first+i], node.get_center().x)
+            self.assertAlmostEqual(flat.size[first+i], node.get_length())
+        # Every particle is in exactly one leaf
+        leaf = flat.child < 0
+        self.assertEqual(np.sum(flat.end[leaf] - flat.start[leaf]), 500)
+        self.assertTrue(np.all(flat.end[leaf] - flat.start[leaf] <= 1))
+
+    def test_acceleration(self):
+        """ Test the traversal against direct summation """
+        ax, ay = direct_accelerations(self.particles)
+        for leaf_size in [1, 8]:
+            flat = FlatQuadTree(self.SWcoord, self.NEcoord, self.particles, leaf_size=leaf_size)
+            for i in [0, 17, 499]:
+                # Without theta, every node is opened
+                self.assertTrue(np.allclose(flat.calc_acceleration(i, G=1.0), (ax[i], ay[i])))
+                # With theta, the approximation is close
+                axi, ayi = flat.calc_acceleration(i, theta=0.3, G=1.0)
+                self.assertLess(np.hypot(axi - ax[i], ayi - ay[i]), 0.02*np.hypot(ax[i], ay[i]))
+
+    def test_accelerations(self):
+        """ Test the vectorized walk against the per-particle walk """
+        ax, ay = direct_accelerations(self.particles)
+        for leaf_size in [1, 8]:
+            flat = FlatQuadTree(self.SWcoord, self.NEcoord, self.particles, leaf_size=leaf_size)
+            axs, ays, info = flat.accelerations(G=1.0, block_size=64, full_output=True)
+            self.assertTrue(np.allclose(axs, ax))
+            self.assertTrue(np.allclose(ays, ay))
+            self.assertEqual(info["interactions"], 500*499)
+
+            axs, ays = flat.accelerations(theta=0.5, G=1.0, block_size=100)
+            for i in [0, 17, 499]:
+                self.assertTrue(np.allclose(flat.calc_acceleration(i, theta=0.5, G=1.0),
+                                            (axs[i], ays[i])))
+
+    def test_outside(self):
+        """ Test that a particle outside of the box has zero acceleration """
+        x = np.array([1.0, 2.0, 11.0])
+        y = np.array([1.0, 2.0, 5.0])
+        particles = ParticleSet(1.0, x, y, x, y)
+        flat = FlatQuadTree(self.SWcoord, self.NEcoord, particles)
+        self.assertEqual(flat.rank[2], -1)
+        self.assertEqual(flat.calc_acceleration(2, G=1.0), (0.0, 0.0))
+        ax, ay = flat.accelerations(G=1.0)
+        self.assertEqual((ax[2], ay[2]), (0.0, 0.0))
+        # The particles inside do not feel it
+        self.assertTrue(np.allclose(flat.calc_acceleration(0, G=1.0), (ax[0], ay[0])))
+        self.assertAlmostEqual(ax[0], 1/np.sqrt(2)/2)
+
+    def test_deep_tree(self):
+        """ Test that a very deep tree is walked without recursion """
+        x = np.array([1.0, 1.0 + 1e-8, 5.0])
+        y = np.array([1.0, 1.0, 5.0])
+        particles = ParticleSet(1.0, x, y, x, y)
+        flat = FlatQuadTree(self.SWcoord, self.NEcoord, particles)
+        self.assertGreater(flat.level.max(), 25)
+        ax, ay = direct_accelerations(particles)
+        self.assertTrue(np.allclose(flat.calc_acceleration(0, theta=0.5, G=1.0), (ax[0], ay[0])))
+
+    def test_update(self):
+        """ Test that updating the tree matches building it from scratch """
+        rng = np.random.default_rng(2)
+        for leaf_size in [1, 8]:
+            particles = ParticleSet(self.particles.m, self.particles.xminus, self.particles.yminus,
+                                    self.particles.x, self.particles.y)
+            flat = FlatQuadTree(self.SWcoord, self.NEcoord, particles, leaf_size=leaf_size)
+            for step in range(5):
+                particles.x += rng.normal(0, 0.002, len(particles))
+                particles.y += rng.normal(0, 0.002, len(particles))
+                particles.x[3] = 10.5 #leaves the box
+                particles.x[4] = 5.0 + 1e-3*step #moves across the box
+                self.assertFalse(flat.update(particles))
+                reference = FlatQuadTree(self.SWcoord, self.NEcoord, particles)
+
+                # Every particle is in one leaf whose cell contains it
+                leaf = flat.child < 0
+                counts = flat.end[leaf] - flat.start[leaf]
+                self.assertEqual(np.sum(counts), 499)
+                self.assertTrue(np.all(counts <= leaf_size))
+                self.assertTrue(np.array_equal(flat.keys, reference.keys))
+                self.assertTrue(np.array_equal(flat.order, reference.order))
+                self.assertTrue(np.all(flat.start[flat.leaf_of] <= np.arange(499)))
+                self.assertTrue(np.all(flat.end[flat.leaf_of] > np.arange(499)))
+                half = flat.size[flat.leaf_of]/2
+                self.assertTrue(np.all(abs(flat.x - flat.cx[flat.leaf_of]) <= half))
+                self.assertTrue(np.all(abs(flat.y - flat.cy[flat.leaf_of]) <= half))
+
+                # The moments and accelerations are those of a new tree
+                self.assertAlmostEqual(flat.mass[0], reference.mass[0])
+                self.assertAlmostEqual(flat.comx[0], reference.comx[0])
+                self.assertAlmostEqual(flat.comy[flat.child[0]+2], reference.comy[reference.child[0]+2])
+                self.assertTrue(np.allclose(flat.accelerations(G=1.0), reference.accelerations(G=1.0)))
+
+            # Moving only a few particles, one back into the box
+            particles.x[3] = 9.0
+            particles.y[:10] = rng.uniform(0, 10, 10)
+            self.assertFalse(flat.update(particles))
+            reference = FlatQuadTree(self.SWcoord, self.NEcoord, particles)
+            self.assertTrue(np.array_equal(flat.order, reference.order))
+            self.assertAlmostEqual(flat.mass[0], reference.mass[0])
+            self.assertAlmostEqual(flat.comy[0], reference.comy[0])
+            self.assertTrue(np.allclose(flat.accelerations(G=1.0), reference.accelerations(G=1.0)))
+            # Only the changed nodes were recomputed, as a full recompute
+            # of the same tree agrees on every node
+            comx, comy = flat.comx.copy(), flat.comy.copy()
+            flat.compute_moments()
+            self.assertTrue(np.allclose(flat.comx, comx, rtol=1e-12, atol=0))
+            self.assertTrue(np.allclose(flat.comy, comy, rtol=1e-12, atol=0))
+
+        # Too many particles crossing cells triggers a rebuild
+        particles.x += 0.5
+        self.assertTrue(flat.update(particles))
+        self.assertEqual(len(flat.child), flat.n_built)
+
+
+
+if __name__ == '__main__':
+    unittest.main()